@@ -13,19 +13,25 @@ __docformat__ = "restructuredtext en"
 
 import sys
 import sqlite3
+import contextlib
+import logging
+import functools
 import importlib
+import threading
+from operator import itemgetter
 from time import time
 
-try:
-    import cPickle as pickle
-except ImportError:
-    import pickle
+from cache_new import (LRUStore, SingleFlight, WriteBuffer, DELETED,
+                       COMPUTE_WAIT, FLUSH_SIZE, FLUSH_INTERVAL,
+                       MAX_QUERY_KEYS, NEGATIVE_TIMEOUT, SQL_GET_OR_ADD,
+                       SQL_INCR, register_write_behind, chunked, transaction,
+                       increment, modify)
+from errors import WorkerError
+from serializers import NEGATIVE, get_serializer, loads
+from workers import submit
 
 
-# FIXME: This code is not thread-safe.
-# This decision isn't optimal to say at the very least. The solution works
-# for this case as Skype4Py threads are queued but it will eventually be
-# the cause of concurrent SQLite access troubles.
+log = logging.getLogger("Gooby.Cache")
 
 
 # Hard-coded SQL queries are only being used in simple default built-in SQLite
@@ -49,20 +55,68 @@ SQL_REPLACE = "REPLACE INTO container (key, value, expires) VALUES (?, ?, ?)"
 
 SQL_CLEAR = "DELETE FROM container"
 
-SQL_CLEAR_EXPIRED = "DELETE FROM container WHERE expires <= ? AND expires != 0"
+SQL_CREATE_INDEX = """
+CREATE INDEX IF NOT EXISTS container_expires ON container (expires)
+"""
+
+# Lower bound lets SQLite use a range scan over the expiration index, skipping
+# entries which never expire.
+SQL_CLEAR_EXPIRED = "DELETE FROM container WHERE expires > 0 AND expires <= ?"
+
+SQL_CLEAR_EXPIRED_BATCH = """
+DELETE FROM container WHERE key IN
+(
+    SELECT key FROM container WHERE expires > 0 AND expires <= ? LIMIT ?
+)
+"""
 
 SQL_COUNT = "SELECT count(*) FROM container WHERE key = ?"
 
 SQL_COUNT_ALL = "SELECT count(*) FROM container"
 
+SQL_SELECT_MANY = """
+SELECT key, value, expires FROM container WHERE key IN ({0})
+"""
+
+# Expired entries are pruned on every PRUNE_INTERVAL-th write, at most
+# PRUNE_BATCH_SIZE entries at a time. Expired entries are treated as missing
+# on reads anyway.
+PRUNE_INTERVAL = 100
+
+PRUNE_BATCH_SIZE = 500
+
+# Maximum number of items kept by caches which haven't been configured.
+DEFAULT_MAX_ENTRIES = 1024
+
 
 class BaseCache(object):
     """
     Base cache class.
     """
 
-    def __init__(self, default_timeout=600):
+    def __init__(self, default_timeout=600, serializer="pickle",
+                 compress_threshold=None, negative_timeout=NEGATIVE_TIMEOUT):
+        """
+        :param default_timeout: default cache TTL in seconds
+        :type default_timeout: `float`
+
+        :param serializer: :mod:`serializers` name or serializer object
+        :type serializer: `unicode`
+
+        :param compress_threshold: minimum serialized value length in bytes
+            to compress it, `None` disables compression
+        :type compress_threshold: `int`
+
+        :param negative_timeout: default TTL of negative entries in seconds,
+            see :meth:`set_negative`
+        :type negative_timeout: `float`
+        """
+
         self._default_timeout = default_timeout
+        self._negative_timeout = negative_timeout
+        self._serializer = get_serializer(
+            serializer, compress_threshold=compress_threshold)
+        self._flights = SingleFlight()
 
     def get(self, key):
         """
@@ -84,6 +138,167 @@ class BaseCache(object):
     def clear(self):
         raise NotImplementedError
 
+    def get_many(self, keys):
+        """
+        Returns a dictionary of keys which have been found along with their
+        values.
+
+        >>> cache = SimpleCache()
+        >>> cache.set_many({"a": 1, "b": 2})
+        >>> sorted(cache.get_many(["a", "b", "c"]).items())
+        [('a', 1), ('b', 2)]
+        >>> cache.delete_many(["a", "b"])
+        >>> cache.get_many(["a", "b"])
+        {}
+        """
+
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def set_many(self, mapping, timeout=None):
+        for key, value in mapping.iteritems():
+            self.set(key, value, timeout)
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.delete(key)
+
+    def get_or_compute(self, key, loader, timeout=None, wait=COMPUTE_WAIT):
+        """
+        Returns value of `key`, storing the result of `loader()` first on a
+        miss. Concurrent misses of the same key wait up to `wait` seconds for
+        a single `loader` call and share its result or exception. `None`
+        results aren't stored, :data:`~serializers.NEGATIVE` ones are stored
+        as negative entries.
+
+        >>> cache = SimpleCache()
+        >>> cache.get_or_compute("mykey", lambda: 42)
+        42
+        >>> cache.get_or_compute("mykey", lambda: "derp")
+        42
+        """
+
+        value = self.get(key)
+        if value is not None:
+            return value
+        return self._compute(key, loader, timeout, wait)
+
+    def get_or_compute_many(self, keys, loader, timeout=None,
+                            wait=COMPUTE_WAIT):
+        """
+        Bulk :meth:`get_or_compute`. Stored values are looked up by a single
+        :meth:`get_many` call, ``loader(key)`` is only called for the keys
+        missing.
+
+        >>> cache = SimpleCache()
+        >>> cache.set("a", 1)
+        >>> values = cache.get_or_compute_many(["a", "b"], lambda key: key * 2)
+        >>> sorted(values.items())
+        [('a', 1), ('b', 'bb')]
+
+        :returns: values by key, keys `loader` returns `None` for are left
+            out
+        :rtype: `dict`
+        """
+
+        values = self.get_many(keys)
+        for key in keys:
+            if key in values:
+                continue
+            value = self._compute(key, functools.partial(loader, key),
+                                  timeout, wait)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def _compute(self, key, loader, timeout, wait):
+        def compute():
+            # Previous flight of the same key may have just stored it.
+            value = self.get(key)
+            if value is None:
+                value = loader()
+                if value is NEGATIVE:
+                    self.set_negative(key)
+                elif value is not None:
+                    self.set(key, value, timeout)
+            return value
+
+        return self._flights.do(key, compute, wait)
+
+    def set_negative(self, key, timeout=None):
+        """
+        Stores a negative entry, telling that value of `key` is known to be
+        unavailable. Unlike for missing keys, :meth:`get` returns
+        :data:`~serializers.NEGATIVE` until the entry expires.
+
+        >>> cache = SimpleCache()
+        >>> cache.set_negative("mykey")
+        >>> cache.get("mykey")
+        NEGATIVE
+
+        :param timeout: TTL in seconds, defaults to `negative_timeout`
+        :type timeout: `float`
+        """
+
+        self.set(key, NEGATIVE, timeout or self._negative_timeout)
+
+    def get_or_add(self, key, value, timeout=None):
+        """
+        Returns value stored under `key`, storing `value` first if there is
+        none. Not atomic, backends override it.
+
+        >>> cache = SimpleCache()
+        >>> cache.get_or_add("mykey", 42)
+        42
+        >>> cache.get_or_add("mykey", "derp")
+        42
+        """
+
+        stored = self.get(key)
+        if stored is None:
+            self.set(key, value, timeout)
+            return value
+        return stored
+
+    def incr(self, key, delta=1, timeout=None):
+        """
+        Adds `delta` to integer value of `key` and returns the result.
+        Missing keys start from zero and expire in `timeout` seconds, live
+        ones keep their expiration time. Not atomic, backends override it.
+
+        >>> cache = SimpleCache()
+        >>> cache.incr("counter")
+        1
+        >>> cache.incr("counter", 10)
+        11
+        >>> cache.decr("counter")
+        10
+        """
+
+        value = int(self.get(key) or 0) + delta
+        self.set(key, value, timeout)
+        return value
+
+    def decr(self, key, delta=1, timeout=None):
+        return self.incr(key, -delta, timeout)
+
+    def get_entries(self, keys):
+        """
+        Returns a dictionary of keys which have been found along with their
+        `(value, expires)` entries. Optional, used by :class:`TieredCache`
+        refreshing.
+        """
+
+        raise NotImplementedError
+
+    def _expires(self, timeout):
+        timeout = timeout or self._default_timeout or 0
+        return time() + timeout if timeout else 0
+
     def _prune(self):
         """
         Clear expired cache entries. It's probably better not to call this
@@ -97,30 +312,38 @@ class BaseCache(object):
     def get_cached(self, key, timeout=None):
         """
         Caching decorator.
-        Stores return value of a cached function or method.
+        Stores return value of a cached function or method, concurrent calls
+        share a single computation. Negative `timeout` disables storing.
 
         .. seealso::
             :class:`SimpleCache` for basic usage.
         """
 
-        self._timeout = timeout
-
         def decorated(cached_function):
             def wrapper(*args, **kwargs):
-                cached = self.get(key)
-                if cached is None:
-                    cached = cached_function(*args, **kwargs)
-                    timeout = self._timeout
-                    if timeout is None:
-                        expires = self._default_timeout
-                    else:
-                        expires = timeout
-                    if expires >= 0:
-                        self.set(key, cached, expires)
-                return cached
+                if timeout is not None and timeout < 0:
+                    cached = self.get(key)
+                    if cached is None:
+                        cached = cached_function(*args, **kwargs)
+                    return cached
+                return self.get_or_compute(
+                    key, lambda: cached_function(*args, **kwargs), timeout)
             return wrapper
         return decorated
 
+    def memoize(self, namespace=None, timeout=None, key_func=None,
+                negative_timeout=None):
+        """
+        Caching decorator storing return values of a function per call
+        arguments.
+
+        .. seealso::
+            :func:`memoize`
+        """
+
+        return memoize(namespace, timeout, key_func, negative_timeout,
+                       cache=self)
+
     def __setitem__(self, key, value, timeout=None):
         self.set(key, value, timeout)
 
@@ -143,6 +366,136 @@ class BaseCache(object):
         return unicode(self).encode("utf-8")
 
 
+def _key_part(value):
+    if isinstance(value, str):
+        value = value.decode("utf-8")
+    if isinstance(value, unicode):
+        # Quoted, so text arguments never match other ones.
+        return repr(value)[1:]
+    return u"{0}({1!r})".format(type(value).__name__, value)
+
+
+def make_key(*args, **kwargs):
+    """
+    Default :func:`memoize` key function. A single text argument is the key
+    itself, other arguments are represented along with their types, so
+    ``f(3)`` and ``f("3")`` don't share a cache entry.
+
+    >>> make_key("tt0101420")
+    u'tt0101420'
+    >>> make_key(3)
+    u'int(3)'
+    >>> make_key(1, "a", b=2)
+    u"int(1):'a':b=int(2)"
+    >>> print make_key(u"\u0433\u0443\u0431\u0438", 1)
+    '\u0433\u0443\u0431\u0438':int(1)
+    """
+
+    if len(args) == 1 and not kwargs and isinstance(args[0], basestring):
+        return unicode(args[0])
+    parts = [_key_part(arg) for arg in args]
+    parts.extend(u"{0}={1}".format(name, _key_part(value))
+                 for name, value in sorted(kwargs.iteritems()))
+    return u":".join(parts)
+
+
+def memoize(namespace=None, timeout=None, key_func=None,
+            negative_timeout=None, cache=None):
+    """
+    Caching decorator storing return values of a function per call
+    arguments. Concurrent calls with the same arguments share a single
+    computation, see :meth:`BaseCache.get_or_compute`.
+
+    Unless `cache` is given, the decorated function is expected to be a
+    method of an object with a `cache` attribute, such as a plugin, and
+    `self` isn't a part of the key.
+
+    Decorated function's `cache_info()` returns its hit and miss counters.
+
+    >>> cache = SimpleCache()
+    >>> @memoize(cache=cache)
+    ... def square(x):
+    ...     return x * x
+    ...
+    >>> square(3), square(3), square(4)
+    (9, 9, 16)
+    >>> assert cache.get("square:int(3)") == 9
+    >>> sorted(square.cache_info().items())
+    [('hits', 1), ('misses', 2)]
+
+    Methods use the cache of their object. Failed lookups may be cached
+    too:
+
+    >>> class Finder(object):
+    ...     cache = SimpleCache()
+    ...     @memoize(negative_timeout=60)
+    ...     def find(self, name):
+    ...         return None
+    ...
+    >>> assert Finder().find("derp") is None
+    >>> assert "find:derp" in Finder.cache
+
+    :param namespace: key prefix, defaults to function name. Empty string
+        means no prefix
+    :type namespace: `str`
+
+    :param timeout: cache TTL of return values in seconds
+    :type timeout: `float`
+
+    :param key_func: callable building a key from call arguments, see
+        :func:`make_key`
+    :type key_func: `callable`
+
+    :param negative_timeout: cache TTL of `None` results, which aren't
+        cached by default
+    :type negative_timeout: `float`
+
+    :param cache: cache object, `None` means the `cache` attribute of the
+        first argument
+    :type cache: :class:`BaseCache`
+    """
+
+    key_func = key_func or make_key
+
+    def decorated(func):
+        prefix = func.__name__ if namespace is None else namespace
+        counters = dict(hits=0, misses=0)
+        lock = threading.Lock()
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if cache is None:
+                target, key_args = args[0].cache, args[1:]
+            else:
+                target, key_args = cache, args
+            key = key_func(*key_args, **kwargs)
+            if prefix:
+                key = u"{0}:{1}".format(prefix, key)
+            computed = []
+
+            def loader():
+                computed.append(True)
+                value = func(*args, **kwargs)
+                if value is None and negative_timeout is not None:
+                    target.set_negative(key, negative_timeout)
+                return value
+
+            value = target.get_or_compute(key, loader, timeout)
+            with lock:
+                counters["misses" if computed else "hits"] += 1
+            if value is NEGATIVE:
+                return None
+            return value
+
+        def cache_info():
+            with lock:
+                return dict(counters)
+
+        wrapper.cache_info = cache_info
+        return wrapper
+    return decorated
+
+
 class SimpleCache(BaseCache):
     """
     Simple memory cache suited mostly for development purposes.
@@ -209,53 +562,116 @@ class SimpleCache(BaseCache):
     >>> cache["a"] = "herp"
     >>> cache["b"] = "derp"
     >>> assert len(cache) is 2
-    """
 
-    # FIXME: Not thread-safe.
+    Size-bounded cache evicts least recently used items:
 
-    def __init__(self, default_timeout=600):
+    >>> cache = SimpleCache(max_entries=2)
+    >>> cache["a"] = 1
+    >>> cache["b"] = 2
+    >>> assert cache["a"] == 1
+    >>> cache["c"] = 3
+    >>> assert "b" not in cache
+    >>> assert len(cache) is 2
+    """
+
+    def __init__(self, default_timeout=600, max_entries=None, max_bytes=None,
+                 **kwargs):
         """
         :param default_timeout: default cache TTL in seconds. Timeout set to 0
             means cache never expires.
         :type default_timeout: `integer`
+
+        :param max_entries: maximum number of stored items, `None` means no
+            limit
+        :type max_entries: `int`
+
+        :param max_bytes: maximum total size of serialized items, `None`
+            means no limit
+        :type max_bytes: `int`
+
+        See :class:`BaseCache` for serialization keyword arguments.
         """
 
-        super(SimpleCache, self).__init__(default_timeout)
-        self._cache = {}
+        super(SimpleCache, self).__init__(default_timeout, **kwargs)
+        self._cache = LRUStore(max_entries, max_bytes)
+        self._lock = threading.Lock()
 
     def get(self, key):
-        expires, value = self._cache.get(key, (0, None))
-        if expires > time() or expires == 0:
-            try:
-                value = pickle.loads(value)
-            except TypeError:
-                value = None
-            return value
+        with self._lock:
+            value = self._cache.get(key, time())
+        if value is not None:
+            return loads(value)
 
     def set(self, key, value, timeout=None):
-        self._prune()
         timeout = timeout or self._default_timeout or 0
         expires = time() + timeout if timeout > 0 else timeout
-        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
-        self._cache.update({key: (expires, value)})
+        value = self._serializer.dumps(value)
+        with self._lock:
+            self._cache.trim(time())
+            self._cache.set(key, value, expires)
 
     def add(self, key, value, timeout=None):
-        self._prune()
         timeout = timeout or self._default_timeout or 0
         expires = time() + timeout if timeout > 0 else timeout
-        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
-        self._cache.setdefault(key, (expires, value))
+        value = self._serializer.dumps(value)
+        with self._lock:
+            self._cache.trim(time())
+            if key not in self._cache:
+                self._cache.set(key, value, expires)
 
     def delete(self, key):
-        self._cache.pop(key, None)
+        with self._lock:
+            self._cache.pop(key)
+
+    def get_many(self, keys):
+        now = time()
+        with self._lock:
+            found = [(key, self._cache.get(key, now)) for key in keys]
+        return dict((key, loads(value)) for key, value in found
+                    if value is not None)
+
+    def set_many(self, mapping, timeout=None):
+        expires = self._expires(timeout)
+        items = [(key, self._serializer.dumps(value))
+                 for key, value in mapping.iteritems()]
+        with self._lock:
+            self._cache.trim(time())
+            for key, value in items:
+                self._cache.set(key, value, expires)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._cache.pop(key)
+
+    def get_or_add(self, key, value, timeout=None):
+        now = time()
+        expires = self._expires(timeout)
+        data = self._serializer.dumps(value)
+        with self._lock:
+            stored = self._cache.get(key, now)
+            if stored is None:
+                self._cache.trim(now)
+                self._cache.set(key, data, expires)
+        if stored is None:
+            return value
+        return loads(stored)
+
+    def incr(self, key, delta=1, timeout=None):
+        now = time()
+        expires = self._expires(timeout)
+        with self._lock:
+            self._cache.trim(now)
+            return increment(self._cache, key, delta, expires, now,
+                             self._serializer)
 
     def clear(self):
-        self._cache.clear()
+        with self._lock:
+            self._cache.clear()
 
     def _prune(self):
-        for key, (expires, _) in self._cache.items():
-            if expires <= time() and expires != 0:
-                self._cache.pop(key, None)
+        with self._lock:
+            self._cache.trim(time())
 
     def __contains__(self, key):
         return key in self._cache
@@ -329,9 +745,22 @@ class SQLiteCache(BaseCache):
     >>> cache["a"] = "herp"
     >>> cache["b"] = "derp"
     >>> assert len(cache) is 2
+
+    Write-behind mode:
+
+    >>> cache = SQLiteCache(write_behind=True, flush_size=2)
+    >>> cache["a"] = "herp"
+    >>> assert cache["a"] == "herp"
+    >>> len(cache._write_buffer)
+    1
+    >>> cache["b"] = "derp"
+    >>> len(cache._write_buffer)
+    0
     """
 
-    def __init__(self, location="", default_timeout=600, autocommit=True):
+    def __init__(self, location="", default_timeout=600, autocommit=True,
+                 write_behind=False, flush_size=FLUSH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, **kwargs):
         """
         :param location: database file path for filesystem storage. Empty
             string or ":memory:" for in-memory storage
@@ -343,9 +772,23 @@ class SQLiteCache(BaseCache):
         :param autocommit: decides whether database changes should be committed
             automatically
         :type autocommit: `boolean`
+
+        :param write_behind: buffer :meth:`set` and :meth:`delete` calls in
+            memory and commit them in batches. Pending writes are lost if the
+            process crashes
+        :type write_behind: `boolean`
+
+        :param flush_size: number of pending writes which triggers a flush
+        :type flush_size: `int`
+
+        :param flush_interval: maximum time in seconds pending writes are
+            kept in memory
+        :type flush_interval: `float`
+
+        See :class:`BaseCache` for serialization keyword arguments.
         """
 
-        super(SQLiteCache, self).__init__(default_timeout)
+        super(SQLiteCache, self).__init__(default_timeout, **kwargs)
 
         assert isinstance(location, basestring)
 
@@ -355,43 +798,84 @@ class SQLiteCache(BaseCache):
             self._location = location
         self._connection = None
         self._autocommit = autocommit
+        # Every thread shares a single connection, so its statements and
+        # transactions are serialized. Reentrant, as transactions flush
+        # pending writes and prune expired entries.
+        self._lock = threading.RLock()
+        self._writes = 0
+        self._write_buffer = None
+        if write_behind:
+            self._write_buffer = WriteBuffer(flush_size, flush_interval)
+            register_write_behind(self)
 
     def _get_connection(self):
-        if self._connection is None:
-            kwargs = dict(database=self._location, timeout=30)
-            if self._autocommit:
-                kwargs.update(dict(isolation_level=None))
-
-            # FIXME: Potentially dangerous garbage.
-            # Not thread-safe.
-            # See this module's docstring for more information.
-            kwargs.update(dict(check_same_thread=False))
-
-            self._connection = sqlite3.Connection(**kwargs)
-            self._connection.cursor().execute(SQL_CREATE_TABLE)
-        return self._connection
+        with self._lock:
+            if self._connection is None:
+                kwargs = dict(database=self._location, timeout=30)
+                if self._autocommit:
+                    kwargs.update(dict(isolation_level=None))
+
+                # The connection is shared between threads, every use of it
+                # holds the lock.
+                kwargs.update(dict(check_same_thread=False))
+
+                self._connection = sqlite3.Connection(**kwargs)
+                self._connection.cursor().execute(SQL_CREATE_TABLE)
+                self._connection.cursor().execute(SQL_CREATE_INDEX)
+            return self._connection
+
+    @contextlib.contextmanager
+    def _connect(self):
+        with self._lock:
+            with self._get_connection() as connection:
+                yield connection
 
     def commit(self):
-        with self._get_connection() as connection:
+        self.flush()
+        with self._connect() as connection:
             connection.commit()
 
+    def flush(self):
+        """
+        Commits pending writes of a write-behind cache in a single
+        transaction.
+        """
+
+        if self._write_buffer:
+            with self._lock:
+                self._write_buffer.flush(
+                    self._get_connection(),
+                    (SQL_CLEAR_EXPIRED_BATCH, (time(), PRUNE_BATCH_SIZE)))
+
+    def flush_is_due(self):
+        return self._write_buffer is not None and self._write_buffer.is_due()
+
     def get(self, key):
         value = None
-        with self._get_connection() as connection:
+        if self._write_buffer is not None:
+            entry = self._write_buffer.get(key)
+            if entry is DELETED:
+                return None
+            if entry is not None:
+                if entry[1] >= time() or entry[1] == 0:
+                    value = loads(entry[0])
+                return value
+        with self._connect() as connection:
             try:
                 result = connection.cursor().execute(SQL_SELECT,
                                                      (key,)).fetchone()
                 expires = result[1]
                 if expires >= time() or expires == 0:
-                    value = pickle.loads(str(result[0]))
+                    value = loads(result[0])
             except TypeError:
                 pass
         return value
 
     def set(self, key, value, timeout=None):
-        self._prune()
+        if self._write_buffer is None:
+            self._maybe_prune()
         timeout = timeout or self._default_timeout or 0
-        expires = time() + timeout if timeout > 0 else timeout
+        expires = time() + timeout if timeout else 0
         # if timeout is None:
         #     expires = 0
         # elif self._default_timeout == 0:
@@ -400,49 +884,207 @@ class SQLiteCache(BaseCache):
         #     expires = 0
         # else:
         #     expires = time() + timeout
-        with self._get_connection() as connection:
-            value = buffer(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        if self._write_buffer is not None:
+            value = self._serializer.dumps(value)
+            if self._write_buffer.put(key, (value, expires)):
+                self.flush()
+            return
+        with self._connect() as connection:
+            value = buffer(self._serializer.dumps(value))
             connection.cursor().execute(SQL_REPLACE, (key, value, expires,))
 
     def add(self, key, value, timeout=None):
-        self._prune()
+        # Adding depends on what is stored, so pending writes go first.
+        self.flush()
+        self._maybe_prune()
         timeout = timeout or self._default_timeout or 0
-        expires = time() + timeout if timeout > 0 else timeout
+        expires = time() + timeout if timeout else 0
         # if timeout is None:
         #     expires = 0
         # elif self._default_timeout == 0:
         #     expires = 0
         # else:
         #     expires = time() + timeout
-        with self._get_connection() as connection:
-            value = buffer(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        with self._connect() as connection:
+            value = buffer(self._serializer.dumps(value))
             connection.cursor().execute(SQL_INSERT, (key, value, expires,))
 
     def delete(self, key):
-        with self._get_connection() as connection:
+        if self._write_buffer is not None:
+            if self._write_buffer.put(key, DELETED):
+                self.flush()
+            return
+        with self._connect() as connection:
             connection.cursor().execute(SQL_DELETE, (key,))
 
-    def clear(self):
-        with self._get_connection() as connection:
-            connection.cursor().execute(SQL_CLEAR)
+    def get_many(self, keys):
+        """
+        Looks up keys using a single query per
+        :data:`~cache_new.MAX_QUERY_KEYS` of them.
+        """
 
-    def _prune(self):
+        return dict((key, value) for key, (value, _)
+                    in self.get_entries(keys).iteritems())
+
+    def get_entries(self, keys):
+        """
+        Returns a dictionary of keys which have been found along with their
+        `(value, expires)` entries.
+        """
+
+        now = time()
+        entries = {}
+        missing = list(keys)
+        if self._write_buffer is not None:
+            missing = []
+            for key in keys:
+                entry = self._write_buffer.get(key)
+                if entry is None:
+                    missing.append(key)
+                elif entry is not DELETED and \
+                        (entry[1] >= now or entry[1] == 0):
+                    entries[key] = (loads(entry[0]), entry[1])
+        with self._connect() as connection:
+            for chunk in chunked(missing, MAX_QUERY_KEYS):
+                query = SQL_SELECT_MANY.format(",".join("?" * len(chunk)))
+                for key, value, expires in connection.execute(query, chunk):
+                    if expires >= now or expires == 0:
+                        entries[key] = (loads(value), expires)
+        return entries
+
+    def set_many(self, mapping, timeout=None):
+        """
+        Stores every key-value pair of `mapping` in a single transaction.
+        """
+
+        expires = self._expires(timeout)
+        rows = [(key, self._serializer.dumps(value), expires)
+                for key, value in mapping.iteritems()]
+        if self._write_buffer is not None:
+            full = False
+            for key, value, expires in rows:
+                full = self._write_buffer.put(key, (value, expires)) or full
+            if full:
+                self.flush()
+            return
+        self._maybe_prune()
+        with self._lock, transaction(self._get_connection()) as connection:
+            connection.executemany(SQL_REPLACE,
+                                   [(key, buffer(value), expires)
+                                    for key, value, expires in rows])
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        if self._write_buffer is not None:
+            full = False
+            for key in keys:
+                full = self._write_buffer.put(key, DELETED) or full
+            if full:
+                self.flush()
+            return
+        with self._lock, transaction(self._get_connection()) as connection:
+            connection.executemany(SQL_DELETE, [(key,) for key in keys])
+
+    def _modify(self, key, func, upsert=None):
+        if self._write_buffer is None:
+            self._maybe_prune()
+        with self._lock:
+            result, full = modify(self._get_connection(), key, func, upsert,
+                                  self._write_buffer)
+        if full:
+            self.flush()
+        return result
+
+    def get_or_add(self, key, value, timeout=None):
+        """
+        Atomically returns value stored under `key`, storing `value` first
+        if there is none.
+        """
+
+        expires = self._expires(timeout)
+        data = self._serializer.dumps(value)
+
+        def func(entry):
+            if entry is not None:
+                return None, loads(entry[0])
+            return (data, expires), value
+
+        upsert = (SQL_GET_OR_ADD, (key, buffer(data), expires, time()))
+        return self._modify(key, func, upsert)
+
+    def incr(self, key, delta=1, timeout=None):
+        """
+        Atomically adds `delta` to integer value of `key`. Counters are
+        stored as native SQLite integers and incremented in place.
+
+        >>> cache = SQLiteCache()
+        >>> cache.incr("counter", 5)
+        5
+        >>> cache.decr("counter")
+        4
+        >>> cache.get("counter")
+        4
+        """
+
+        expires = self._expires(timeout)
+
+        def func(entry):
+            if entry is None:
+                return (delta, expires), delta
+            value = int(loads(entry[0])) + delta
+            return (value, entry[1]), value
+
+        upsert = (SQL_INCR, (key, delta, expires, time()))
+        return self._modify(key, func, upsert)
+
+    def clear(self):
+        with self._connect() as connection:
+            if self._write_buffer is not None:
+                self._write_buffer.clear(connection, SQL_CLEAR)
+            else:
+                connection.cursor().execute(SQL_CLEAR)
+
+    def _maybe_prune(self):
+        self._writes += 1
+        if self._writes >= PRUNE_INTERVAL:
+            self._writes = 0
+            self._prune(PRUNE_BATCH_SIZE)
+
+    def _prune(self, limit=None):
         """
+        :param limit: maximum number of entries to delete, `None` means no
+            limit
+        :type limit: `int`
+
         >>> from time import sleep
 
         >>> cache = SQLiteCache()
         >>> cache.add("mykey", 42, timeout=0.01)
+        >>> cache.add("otherkey", 42, timeout=0.01)
         >>> sleep(0.1)
+        >>> cache._prune(limit=1)
+        >>> len(cache)
+        1
         >>> cache._prune()
-        >>> assert cache.get("mykey") is None
+        >>> len(cache)
+        0
         """
 
-        with self._get_connection() as connection:
-            connection.cursor().execute(SQL_CLEAR_EXPIRED, (time(),))
+        self.flush()
+        with self._connect() as connection:
+            if limit is None:
+                connection.cursor().execute(SQL_CLEAR_EXPIRED, (time(),))
+            else:
+                connection.cursor().execute(SQL_CLEAR_EXPIRED_BATCH,
+                                            (time(), limit))
 
     def __contains__(self, key):
+        if self._write_buffer is not None:
+            entry = self._write_buffer.get(key)
+            if entry is not None:
+                return entry is not DELETED
         retval = False
-        with self._get_connection() as connection:
+        with self._connect() as connection:
             result = connection.cursor().execute(SQL_COUNT, (key,)).fetchone()
             count = result[0]
             if count == 1:
@@ -452,16 +1094,466 @@ class SQLiteCache(BaseCache):
         return retval
 
     def __len__(self):
-        with self._get_connection() as connection:
+        self.flush()
+        with self._connect() as connection:
             result = connection.cursor().execute(SQL_COUNT_ALL).fetchone()
             count = result[0]
         return count
 
-    def __del__(self):
-        with self._get_connection() as connection:
-            connection.commit()
-            connection.cursor().close()
-        self._connection.close()
+    def close(self):
+        """
+        Commits pending writes and closes the connection. Write-behind caches
+        are also flushed on exit, see :func:`~cache_new.flush_all`.
+        """
+
+        with self._lock:
+            if self._connection is None:
+                return
+            self.flush()
+            self._connection.commit()
+            self._connection.close()
+            self._connection = None
+
+
+class TieredCache(BaseCache):
+    """
+    Two-tier cache: a size-bounded in-memory LRU tier in front of a
+    persistent backend. Memory tier keeps values as they are, without
+    pickling, so mutating a returned object mutates the cached one.
+
+    Values found in the backend only are promoted to the memory tier for
+    `memory_timeout` seconds.
+
+    Basic usage:
+
+    >>> cache = TieredCache(max_entries=2)
+    >>> cache.set("a", 1)
+    >>> cache.set("b", 2)
+    >>> assert cache.get("a") == 1
+    >>> cache.set("c", 3)
+    >>> # "b" is the least recently used entry so it has been evicted from
+    >>> # memory, but is still stored in the backend.
+    >>> assert cache.get("b") == 2
+    >>> cache.stats()["backend"]["hits"]
+    1
+
+    Write-back mode:
+
+    >>> cache = TieredCache(max_entries=1, write_back=True)
+    >>> cache.set("a", 1)
+    >>> assert "a" not in cache.backend
+    >>> cache.set("b", 2)
+    >>> # "a" has been written to backend once evicted from memory.
+    >>> assert cache.backend.get("a") == 1
+
+    Configuration:
+
+    >>> config = dict(tiered=dict(backend="cache.TieredCache",
+    ...                           persistent_backend="cache.SQLiteCache",
+    ...                           max_entries=128))
+    >>> dict_config(config)
+    >>> assert isinstance(get_cache("tiered").backend, SQLiteCache)
+
+    Stale-while-revalidate mode: values older than `refresh_after` seconds
+    are still returned by :meth:`get_or_compute`, which refreshes them in
+    background once. Values expire for good after `default_timeout`
+    seconds.
+
+    >>> from threading import Event
+    >>> loading = Event()
+    >>> def loader():
+    ...     loading.wait()
+    ...     return 2
+    >>> cache = TieredCache(default_timeout=3600, refresh_after=-1)
+    >>> cache.set("a", 1)
+    >>> cache.get_or_compute("a", loader)
+    1
+    >>> refresh = cache._refreshing["a"]
+    >>> cache.get_or_compute("a", loader)  # Refresh is still running.
+    1
+    >>> loading.set()
+    >>> refresh.result(timeout=5)
+    >>> cache.get("a")
+    2
+    """
+
+    def __init__(self, location="", default_timeout=600,
+                 persistent_backend="cache.SQLiteCache",
+                 backend_options=None, max_entries=1024, max_bytes=None,
+                 memory_timeout=3600, write_back=False,
+                 flush_interval=FLUSH_INTERVAL, refresh_after=None,
+                 **kwargs):
+        """
+        :param location: persistent backend location
+        :type location: `str`
+
+        :param default_timeout: default cache TTL in seconds
+        :type default_timeout: `float`
+
+        :param persistent_backend: persistent backend class or its import path
+        :type persistent_backend: `str`
+
+        :param backend_options: extra persistent backend keyword arguments
+        :type backend_options: `dict`
+
+        :param max_entries: maximum number of entries kept in memory, `None`
+            means no limit
+        :type max_entries: `int`
+
+        :param max_bytes: maximum total serialized size of values kept in
+            memory, `None` means no limit
+        :type max_bytes: `int`
+
+        :param memory_timeout: TTL of values promoted from the backend, 0
+            means they are only evicted by LRU policy
+        :type memory_timeout: `float`
+
+        :param write_back: only write values to the backend once they are
+            evicted from memory or flushed instead of on every write
+        :type write_back: `boolean`
+
+        :param flush_interval: maximum time in seconds write-back values are
+            kept in memory only
+        :type flush_interval: `float`
+
+        :param refresh_after: age in seconds after which values are
+            refreshed in background, `None` disables refreshing. Requires
+            non-zero `default_timeout` and a persistent backend providing
+            :meth:`~BaseCache.get_entries`, as ages of stored values are
+            derived from their expiration times
+        :type refresh_after: `float`
+
+        Serialization keyword arguments of :class:`BaseCache` apply to the
+        persistent backend.
+        """
+
+        super(TieredCache, self).__init__(default_timeout, **kwargs)
+
+        assert not refresh_after or default_timeout
+
+        if isinstance(persistent_backend, basestring):
+            configurator = BaseCacheConfigurator(None)
+            persistent_backend = configurator._resolve(persistent_backend)
+        self.backend = persistent_backend(location=location,
+                                          default_timeout=default_timeout,
+                                          serializer=self._serializer,
+                                          **(backend_options or {}))
+
+        self._max_bytes = max_bytes
+        self._memory_timeout = memory_timeout
+        self._write_back = write_back
+        self._flush_interval = flush_interval
+        self._refresh_after = refresh_after
+
+        # Maps keys to (value, size, refresh_at) items. refresh_at is 0
+        # unless refreshing is enabled.
+        self._memory = LRUStore(max_entries, max_bytes, sizeof=itemgetter(1),
+                                on_evict=self._evicted)
+        # Maps keys of values not written to the backend yet to their
+        # timeouts.
+        self._dirty = {}
+        self._flushed = time()
+        self._lock = threading.RLock()
+        # Maps keys being refreshed in background to refresh futures.
+        self._refreshing = {}
+
+        self._counters = dict(memory_hits=0, memory_misses=0,
+                              backend_hits=0, backend_misses=0)
+
+        if write_back:
+            register_write_behind(self)
+
+    def _store(self, key, value, expires, refresh_at=None):
+        size = 0
+        if self._max_bytes is not None:
+            size = len(self._serializer.dumps(value))
+        if refresh_at is None:
+            refresh_at = time() + self._refresh_after \
+                if self._refresh_after else 0
+        with self._lock:
+            self._memory.set(key, (value, size, refresh_at), expires)
+
+    def _evicted(self, key, item):
+        if key in self._dirty:
+            self.backend.set(key, item[0], self._dirty.pop(key))
+
+    def _discard(self, key):
+        self._memory.pop(key)
+        self._dirty.pop(key, None)
+
+    def get(self, key):
+        with self._lock:
+            item = self._memory.get(key, time())
+            if item is not None:
+                self._counters["memory_hits"] += 1
+                return item[0]
+            # Expired value is gone, and so is its pending write.
+            self._dirty.pop(key, None)
+            self._counters["memory_misses"] += 1
+
+        return self._load([key]).get(key)
+
+    def _load(self, keys):
+        """
+        Looks up keys in the backend, promoting found values to memory.
+        """
+
+        if self._refresh_after:
+            entries = self.backend.get_entries(keys)
+        else:
+            entries = dict((key, (value, None)) for key, value
+                           in self.backend.get_many(keys).iteritems())
+        with self._lock:
+            self._counters["backend_hits"] += len(entries)
+            self._counters["backend_misses"] += len(keys) - len(entries)
+
+        now = time()
+        timeout = self._memory_timeout
+        expires = now + timeout if timeout else 0
+        values = {}
+        for key, (value, stored_expires) in entries.iteritems():
+            entry_expires, refresh_at = expires, None
+            if self._refresh_after:
+                # Values which never expire have been stored before
+                # refreshing was enabled, their age is unknown.
+                refresh_at = now
+                if stored_expires:
+                    refresh_at = stored_expires - self._default_timeout + \
+                        self._refresh_after
+                    if not expires or stored_expires < expires:
+                        entry_expires = stored_expires
+            self._store(key, value, entry_expires, refresh_at)
+            values[key] = value
+        return values
+
+    def set(self, key, value, timeout=None):
+        ttl = timeout or self._default_timeout or 0
+        self._store(key, value, time() + ttl if ttl else 0)
+        if self._write_back:
+            with self._lock:
+                if key in self._memory:
+                    self._dirty[key] = timeout
+                    return
+        self.backend.set(key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        if key not in self:
+            self.set(key, value, timeout)
+
+    def delete(self, key):
+        with self._lock:
+            self._discard(key)
+        self.backend.delete(key)
+
+    def get_or_compute(self, key, loader, timeout=None, wait=COMPUTE_WAIT):
+        """
+        With refreshing enabled, stale values are returned immediately and
+        refreshed by a worker thread, see :mod:`workers`.
+        """
+
+        value = self.get(key)
+        if value is None:
+            return self._compute(key, loader, timeout, wait)
+        self._refresh_stale(key, loader, timeout)
+        return value
+
+    def get_or_compute_many(self, keys, loader, timeout=None,
+                            wait=COMPUTE_WAIT):
+        """
+        Stale values found are returned immediately and refreshed like by
+        :meth:`get_or_compute`.
+        """
+
+        values = self.get_many(keys)
+        for key in keys:
+            if key in values:
+                self._refresh_stale(key, functools.partial(loader, key),
+                                    timeout)
+                continue
+            value = self._compute(key, functools.partial(loader, key),
+                                  timeout, wait)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def _refresh_stale(self, key, loader, timeout):
+        if not self._refresh_after:
+            return
+        with self._lock:
+            entry = self._memory.peek(key)
+            stale = entry is not None and 0 < entry[1][2] <= time() and \
+                key not in self._refreshing
+            if stale:
+                self._refreshing[key] = None
+        if not stale:
+            return
+        try:
+            future = submit(self._refresh, key, loader, timeout)
+        except WorkerError:
+            log.warning("Unable to schedule %r refresh", key)
+            with self._lock:
+                del self._refreshing[key]
+        else:
+            with self._lock:
+                self._refreshing[key] = future
+            future.add_done_callback(functools.partial(self._refreshed, key))
+
+    def _refreshed(self, key, future):
+        with self._lock:
+            self._refreshing.pop(key, None)
+
+    def _refresh(self, key, loader, timeout):
+        try:
+            value = loader()
+        except Exception:
+            log.exception("Unable to refresh %r", key)
+            value = None
+        if value is not None and value is not NEGATIVE:
+            self.set(key, value, timeout)
+            return
+        # Keep serving the stale value, retry later.
+        with self._lock:
+            entry = self._memory.peek(key)
+            if entry is not None:
+                expires, (value, size, _) = entry
+                self._memory.set(key, (value, size,
+                                       time() + self._refresh_after),
+                                 expires)
+
+    def _write_through(self, key):
+        """
+        Writes pending write-back value of `key` to the backend, so that
+        atomic backend operations see it.
+        """
+
+        entry = self._memory.peek(key)
+        if key in self._dirty and entry is not None:
+            self.backend.set(key, entry[1][0], self._dirty.pop(key))
+
+    def get_or_add(self, key, value, timeout=None):
+        """
+        Atomic as long as the persistent backend's :meth:`get_or_add` is.
+        """
+
+        with self._lock:
+            self._write_through(key)
+            stored = self.backend.get_or_add(key, value, timeout)
+            self._store(key, stored, self._expires(timeout))
+        return stored
+
+    def incr(self, key, delta=1, timeout=None):
+        with self._lock:
+            self._write_through(key)
+            value = self.backend.incr(key, delta, timeout)
+            self._store(key, value, self._expires(timeout))
+        return value
+
+    def get_many(self, keys):
+        values = {}
+        missing = []
+        now = time()
+        with self._lock:
+            for key in keys:
+                item = self._memory.get(key, now)
+                if item is not None:
+                    values[key] = item[0]
+                else:
+                    self._dirty.pop(key, None)
+                    missing.append(key)
+            self._counters["memory_hits"] += len(values)
+            self._counters["memory_misses"] += len(missing)
+        if not missing:
+            return values
+
+        values.update(self._load(missing))
+        return values
+
+    def set_many(self, mapping, timeout=None):
+        expires = self._expires(timeout)
+        for key, value in mapping.iteritems():
+            self._store(key, value, expires)
+        if self._write_back:
+            with self._lock:
+                mapping = dict(mapping)
+                for key in mapping.keys():
+                    if key in self._memory:
+                        self._dirty[key] = timeout
+                        del mapping[key]
+        self.backend.set_many(mapping, timeout)
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        with self._lock:
+            for key in keys:
+                self._discard(key)
+        self.backend.delete_many(keys)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._dirty.clear()
+        self.backend.clear()
+
+    def flush(self):
+        """
+        Writes values which are only kept in memory to the backend.
+        """
+
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            entries = [(key, self._memory.peek(key)[1][0], timeout)
+                       for key, timeout in dirty.iteritems()
+                       if key in self._memory]
+            self._flushed = time()
+        for key, value, timeout in entries:
+            self.backend.set(key, value, timeout)
+        if hasattr(self.backend, "flush"):
+            self.backend.flush()
+
+    def flush_is_due(self):
+        return bool(self._dirty) and \
+            time() - self._flushed >= self._flush_interval
+
+    def _prune(self):
+        with self._lock:
+            self._memory.trim(time())
+            for key in [key for key in self._dirty
+                        if key not in self._memory]:
+                del self._dirty[key]
+        self.backend._prune()
+
+    def stats(self):
+        """
+        Returns hit and miss counters along with memory usage per tier.
+
+        :rtype: `dict`
+        """
+
+        with self._lock:
+            counters = self._counters
+            return {
+                "memory": {
+                    "hits": counters["memory_hits"],
+                    "misses": counters["memory_misses"],
+                    "entries": len(self._memory),
+                    "bytes": self._memory.bytes,
+                },
+                "backend": {
+                    "hits": counters["backend_hits"],
+                    "misses": counters["backend_misses"],
+                },
+            }
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._memory.peek(key)
+            if entry is not None and (entry[0] > time() or entry[0] == 0):
+                return True
+        return key in self.backend
+
+    def __len__(self):
+        self.flush()
+        return len(self.backend)
 
 
 class CacheManager(object):
@@ -473,15 +1565,26 @@ class CacheManager(object):
     >>> cache = cm.get_cache("simple_cache")
     >>> same_cache = cm.get_cache("simple_cache")
     >>> assert cache is same_cache
+
+    Caches which haven't been configured explicitly are size-bounded:
+
+    >>> cache._cache.max_entries == DEFAULT_MAX_ENTRIES
+    True
     """
 
     _default_backend = SimpleCache
 
+    _default_options = dict(max_entries=DEFAULT_MAX_ENTRIES)
+
     def __init__(self):
         self._caches = {}
 
     def get_cache(self, key):
-        return self._caches.setdefault(key, self._default_backend())
+        try:
+            return self._caches[key]
+        except KeyError:
+            cacheobj = self._default_backend(**self._default_options)
+            return self._caches.setdefault(key, cacheobj)
 
     def add_cache(self, key, cacheobj):
         assert isinstance(cacheobj, BaseCache)
@@ -552,7 +1655,8 @@ class BaseCacheConfigurator(object):
 class DictCacheConfigurator(BaseCacheConfigurator):
     """
     Configure caching using a dictionary-like object to describe the
-    configuration.
+    configuration. Options other than "backend", "location" and "timeout"
+    are passed to the backend as keyword arguments.
 
     Example usage:
 
@@ -566,6 +1670,11 @@ class DictCacheConfigurator(BaseCacheConfigurator):
 
     >>> cache.set("a", 42)
     >>> assert cache.get("a") is 42
+
+    >>> config = dict(buffered=dict(backend="cache.SQLiteCache",
+    ...                             write_behind=True))
+    >>> dict_config(config)
+    >>> assert get_cache("buffered")._write_buffer is not None
     """
 
     def configure(self):
@@ -576,8 +1685,8 @@ class DictCacheConfigurator(BaseCacheConfigurator):
             backend = self._resolve(str(opts.pop("backend", d.get("backend"))))
             timeout = float(opts.pop("timeout", d.get("timeout")))
             location = str(opts.pop("location", d.get("location")))
-            assert not opts, "Unknown options: %s" % ", ".join(opts.keys())
-            cacheobj = backend(default_timeout=timeout, location=location)
+            cacheobj = backend(default_timeout=timeout, location=location,
+                               **opts)
             self._cache_manager.add_cache(key, cacheobj)
 
 
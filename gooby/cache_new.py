@@ -42,8 +42,8 @@
         >>> del c['derp']
         >>> 'derp' in c
         False
-        >>> [item for item in c]
-        [(u'k', u'v'), (u'herp', u'1')]
+        >>> sorted(item for item in c)
+        [(u'herp', u'1'), (u'k', u'v')]
 
     A simple example of how to cache an expensive calculation result,
     assuming `my_cache` has been initialized and is accessible::
@@ -68,23 +68,98 @@ from __future__ import unicode_literals
 
 __docformat__ = 'restructuredtext en'
 
+import atexit
 import contextlib
+import heapq
 import importlib
+import logging
+import sys
 import time
 import sqlite3
+import weakref
+from collections import OrderedDict
 try:
     import threading
 except ImportError:
     import dummy_threading as threading
-try:
-    from cPickle import pickle
-except ImportError:
-    import pickle
+from errors import FutureTimeoutError
+from scheduler import scheduler
+from serializers import NEGATIVE, get_serializer, loads
+from workers import Future
+
+
+log = logging.getLogger("Gooby.Cache")
+
+# Default TTL of negative entries, see set_negative().
+NEGATIVE_TIMEOUT = 600
+
+# Maximum time in seconds get_or_compute() waits for a concurrent computation
+# of the same key before computing the value itself.
+COMPUTE_WAIT = 30.0
+
+
+class SingleFlight(object):
+    """Deduplicates concurrent calls by key: while a call is in flight, other
+    callers of the same key wait for its result or exception instead of
+    repeating it.
+
+    >>> flight = SingleFlight()
+    >>> flight.do('k', lambda: 42)
+    42
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, wait=None):
+        """Returns result of `func()`, shared with concurrent callers of the
+        same `key`. Callers give up waiting after `wait` seconds and call
+        `func` themselves."""
+
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            try:
+                return future.result(wait)
+            except FutureTimeoutError:
+                log.warning("Gave up waiting for %r after %s second(s)",
+                            key, wait)
+                return func()
+        try:
+            result = func()
+        except Exception:
+            future.set_exception(sys.exc_info())
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
 
 
 class BaseCache(object):
-    def __init__(self, timeout=600):
+    def __init__(self, timeout=600, serializer='pickle',
+                 compress_threshold=None, negative_timeout=NEGATIVE_TIMEOUT):
+        """`serializer` is a :mod:`serializers` name or object. Serialized
+        values longer than `compress_threshold` bytes are compressed.
+        `negative_timeout` is the default TTL of negative entries."""
+
         self._timeout = timeout
+        self._negative_timeout = negative_timeout
+        self._serializer = get_serializer(
+            serializer, compress_threshold=compress_threshold)
+        self._flights = SingleFlight()
+
+    def _expires(self, timeout):
+        timeout = timeout or 0
+        if timeout is 0 and self._timeout is 0:
+            return 0
+        return time.time() + (timeout or self._timeout)
 
     def _trim(self):
         raise NotImplementedError
@@ -101,6 +176,85 @@ class BaseCache(object):
     def delete(self, key):
         raise NotImplementedError
 
+    def get_many(self, keys):
+        """Returns a dictionary of keys which have been found along with
+        their values."""
+
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def set_many(self, mapping, timeout=None):
+        """Stores every key-value pair of `mapping`."""
+
+        for key, value in mapping.iteritems():
+            self.set(key, value, timeout)
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.delete(key)
+
+    def get_or_compute(self, key, loader, timeout=None, wait=COMPUTE_WAIT,
+                       **kwargs):
+        """Returns value of `key`, storing the result of `loader()` first on
+        a miss. Concurrent misses of the same key wait up to `wait` seconds
+        for a single `loader` call and share its result or exception.
+        `None` results aren't stored, `NEGATIVE` ones are stored as negative
+        entries. Extra keyword arguments, such as `key_prefix`, are passed
+        to `get` and `set`."""
+
+        value = self.get(key, **kwargs)
+        if value is not None:
+            return value
+
+        def compute():
+            # Previous flight of the same key may have just stored it.
+            value = self.get(key, **kwargs)
+            if value is None:
+                value = loader()
+                if value is NEGATIVE:
+                    self.set(key, value, self._negative_timeout, **kwargs)
+                elif value is not None:
+                    self.set(key, value, timeout, **kwargs)
+            return value
+
+        flight = (key,) + tuple(sorted(kwargs.iteritems()))
+        return self._flights.do(flight, compute, wait)
+
+    def set_negative(self, key, timeout=None, **kwargs):
+        """Stores a negative entry, telling that value of `key` is known to
+        be unavailable. `get` returns `NEGATIVE` for such entries until they
+        expire in `timeout` seconds, the default negative TTL if not
+        given."""
+
+        self.set(key, NEGATIVE, timeout or self._negative_timeout, **kwargs)
+
+    def get_or_add(self, key, value, timeout=None):
+        """Returns value stored under `key`, storing `value` first if there
+        is none. Not atomic, backends override it."""
+
+        stored = self.get(key)
+        if stored is None:
+            self.set(key, value, timeout)
+            return value
+        return stored
+
+    def incr(self, key, delta=1, timeout=None):
+        """Adds `delta` to integer value of `key` and returns the result.
+        Missing keys start from zero and expire in `timeout` seconds, live
+        ones keep their expiration time. Not atomic, backends override
+        it."""
+
+        value = int(self.get(key) or 0) + delta
+        self.set(key, value, timeout)
+        return value
+
+    def decr(self, key, delta=1, timeout=None):
+        return self.incr(key, -delta, timeout)
+
     def clear(self):
         raise NotImplementedError
 
@@ -132,72 +286,232 @@ class BaseCache(object):
         return str(self)
 
 
+class LRUStore(object):
+    """Mapping of keys to `(expires, value)` pairs ordered from the least to
+    the most recently used one, optionally bounded by number of entries and
+    total length of values.
+    Expiration times are kept in a heap, so expired entries are removed in
+    O(log n) each instead of scanning the whole mapping. Heap items of
+    overwritten or deleted entries are skipped lazily.
+    Size of a value is its length unless `sizeof` says otherwise. Entries
+    evicted to stay within bounds are passed to `on_evict(key, value)`.
+    Not thread-safe, callers are expected to hold a lock."""
+
+    def __init__(self, max_entries=None, max_bytes=None, sizeof=len,
+                 on_evict=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._sizeof = sizeof
+        self._on_evict = on_evict
+        self._entries = OrderedDict()
+        self._heap = []
+
+    def get(self, key, now):
+        """Returns value of a live entry, marking it as recently used.
+        Expired entry is removed."""
+
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires == 0 or expires > now:
+            self._entries[key] = entry
+            return value
+        self.bytes -= self._sizeof(value)
+        return None
+
+    def set(self, key, value, expires):
+        self.pop(key)
+        self._entries[key] = (expires, value)
+        self.bytes += self._sizeof(value)
+        if expires != 0:
+            heapq.heappush(self._heap, (expires, key))
+            if len(self._heap) > 2 * len(self._entries) + 64:
+                self._compact()
+        self._evict()
+
+    def pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= self._sizeof(entry[1])
+        return entry
+
+    def clear(self):
+        self._entries.clear()
+        del self._heap[:]
+        self.bytes = 0
+
+    def trim(self, now):
+        """Removes entries expired by `now`."""
+
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            expires, key = heapq.heappop(heap)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == expires:
+                self.pop(key)
+
+    def _evict(self):
+        entries = self._entries
+        while (self.max_entries is not None and
+               len(entries) > self.max_entries) or \
+                (self.max_bytes is not None and self.bytes > self.max_bytes
+                 and len(entries) > 1):
+            key, (_, value) = entries.popitem(last=False)
+            self.bytes -= self._sizeof(value)
+            if self._on_evict is not None:
+                self._on_evict(key, value)
+
+    def _compact(self):
+        self._heap = [(expires, key) for key, (expires, _)
+                      in self._entries.iteritems() if expires != 0]
+        heapq.heapify(self._heap)
+
+    def peek(self, key):
+        """Returns `(expires, value)` entry without marking it as recently
+        used."""
+
+        return self._entries.get(key)
+
+    def touch(self, key):
+        """Marks entry as the most recently used one."""
+
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._entries[key] = entry
+
+    def keys(self):
+        return self._entries.keys()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def increment(store, key, delta, expires, now, serializer):
+    """Adds `delta` to integer value of `key` in `store`, keeping expiration
+    time of a live entry. Callers are expected to hold a lock."""
+
+    stored = store.get(key, now)
+    if stored is not None:
+        expires = store.peek(key)[0]
+        delta += int(loads(stored))
+    store.set(key, serializer.dumps(delta), expires)
+    return delta
+
+
 class SimpleCache(BaseCache):
     """Simple thread-safe memory cache.
-    Mostly suited for development purposes. Stores items in a regular Python
-    dictionary.
+    Mostly suited for development purposes. Stores serialized items in memory,
+    optionally evicting least recently used ones once there are more than
+    `max_entries` of them or they take more than `max_bytes`.
     """
 
-    def __init__(self, timeout=600):
-        super(SimpleCache, self).__init__(timeout)
+    def __init__(self, timeout=600, max_entries=None, max_bytes=None,
+                 **kwargs):
+        super(SimpleCache, self).__init__(timeout, **kwargs)
         self._lock = threading.Lock()
-        self._cache = {}
+        self._cache = LRUStore(max_entries, max_bytes)
 
     def _trim(self):
         now = time.time()
         with self._lock:
-            for key, (expires, _) in self._cache.items():
-                if 0 < expires <= now:
-                    self._cache.pop(key, None)
+            self._cache.trim(now)
 
     def get(self, key):
         now = time.time()
-        expires, value = self._cache.get(key, (0, None))
-        if expires >= now or expires is 0:
-            try:
-                return pickle.loads(value)
-            except TypeError:
-                pass
+        with self._lock:
+            value = self._cache.get(key, now)
+        if value is not None:
+            return loads(value)
         return None
 
     def set(self, key, value, timeout=None):
         """Set `timeout` to `0` to disable key expiration."""
 
         now = time.time()
-        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        value = self._serializer.dumps(value)
         timeout = timeout or 0
         if timeout is 0 and self._timeout is 0:
             expires = 0
         else:
             expires = now + (timeout or self._timeout)
-        self._trim()
         with self._lock:
-            self._cache.update({key: (expires, value)})
+            self._cache.trim(now)
+            self._cache.set(key, value, expires)
 
     def add(self, key, value, timeout=None):
         """Set `timeout` to `0` to disable key expiration."""
 
         now = time.time()
-        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        value = self._serializer.dumps(value)
         timeout = timeout or 0
         if timeout is 0 and self._timeout is 0:
             expires = 0
         else:
             expires = now + (timeout or self._timeout)
-        self._trim()
         with self._lock:
-            self._cache.setdefault(key, (expires, value))
+            self._cache.trim(now)
+            if key not in self._cache:
+                self._cache.set(key, value, expires)
 
     def delete(self, key):
         with self._lock:
-            self._cache.pop(key, None)
+            self._cache.pop(key)
+
+    def get_many(self, keys):
+        now = time.time()
+        with self._lock:
+            found = [(key, self._cache.get(key, now)) for key in keys]
+        return dict((key, loads(value)) for key, value in found
+                    if value is not None)
+
+    def set_many(self, mapping, timeout=None):
+        expires = self._expires(timeout)
+        items = [(key, self._serializer.dumps(value))
+                 for key, value in mapping.iteritems()]
+        with self._lock:
+            self._cache.trim(time.time())
+            for key, value in items:
+                self._cache.set(key, value, expires)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._cache.pop(key)
+
+    def get_or_add(self, key, value, timeout=None):
+        now = time.time()
+        expires = self._expires(timeout)
+        data = self._serializer.dumps(value)
+        with self._lock:
+            stored = self._cache.get(key, now)
+            if stored is None:
+                self._cache.trim(now)
+                self._cache.set(key, data, expires)
+        if stored is None:
+            return value
+        return loads(stored)
+
+    def incr(self, key, delta=1, timeout=None):
+        now = time.time()
+        expires = self._expires(timeout)
+        with self._lock:
+            self._cache.trim(now)
+            return increment(self._cache, key, delta, expires, now,
+                             self._serializer)
 
     def clear(self):
         with self._lock:
             self._cache.clear()
 
     def __iter__(self):
-        for key, value in self._cache.iteritems():
+        with self._lock:
+            keys = self._cache.keys()
+        for key in keys:
             yield key, self.get(key)
 
     def __contains__(self, key):
@@ -207,6 +521,144 @@ class SimpleCache(BaseCache):
         return len(self._cache)
 
 
+class StripedCache(BaseCache):
+    """Concurrent memory cache.
+    Keys are spread across `stripes` independent stores by their hash, each
+    guarded by its own lock, so writers of different keys rarely contend.
+    Reads don't block: entries are looked up without locking and only marked
+    as recently used if their stripe isn't busy. Expired entries are
+    removed a stripe at a time, there is no cache-wide lock.
+    `max_entries` and `max_bytes` limits are split evenly between stripes.
+    """
+
+    def __init__(self, timeout=600, stripes=16, max_entries=None,
+                 max_bytes=None, **kwargs):
+        super(StripedCache, self).__init__(timeout, **kwargs)
+        if max_entries is not None:
+            max_entries = -(-max_entries // stripes)
+        if max_bytes is not None:
+            max_bytes = -(-max_bytes // stripes)
+        self._stripes = [(threading.Lock(), LRUStore(max_entries, max_bytes))
+                         for _ in xrange(stripes)]
+        self._bounded = max_entries is not None or max_bytes is not None
+
+    def _stripe(self, key):
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    def _group(self, items, key=lambda item: item):
+        """Groups items by their stripes."""
+
+        groups = {}
+        for item in items:
+            index = hash(key(item)) % len(self._stripes)
+            groups.setdefault(index, []).append(item)
+        return [(self._stripes[index], group)
+                for index, group in groups.iteritems()]
+
+    def _trim(self):
+        for lock, store in self._stripes:
+            with lock:
+                store.trim(time.time())
+
+    def get(self, key):
+        lock, store = self._stripe(key)
+        entry = store.peek(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires != 0 and expires < time.time():
+            return None
+        if self._bounded and lock.acquire(False):
+            try:
+                store.touch(key)
+            finally:
+                lock.release()
+        return loads(value)
+
+    def set(self, key, value, timeout=None):
+        """Set `timeout` to `0` to disable key expiration."""
+
+        expires = self._expires(timeout)
+        value = self._serializer.dumps(value)
+        lock, store = self._stripe(key)
+        with lock:
+            store.trim(time.time())
+            store.set(key, value, expires)
+
+    def add(self, key, value, timeout=None):
+        """Set `timeout` to `0` to disable key expiration."""
+
+        expires = self._expires(timeout)
+        value = self._serializer.dumps(value)
+        lock, store = self._stripe(key)
+        with lock:
+            store.trim(time.time())
+            if key not in store:
+                store.set(key, value, expires)
+
+    def delete(self, key):
+        lock, store = self._stripe(key)
+        with lock:
+            store.pop(key)
+
+    def set_many(self, mapping, timeout=None):
+        expires = self._expires(timeout)
+        items = [(key, self._serializer.dumps(value))
+                 for key, value in mapping.iteritems()]
+        for (lock, store), group in self._group(items, key=lambda i: i[0]):
+            with lock:
+                store.trim(time.time())
+                for key, value in group:
+                    store.set(key, value, expires)
+
+    def delete_many(self, keys):
+        for (lock, store), group in self._group(keys):
+            with lock:
+                for key in group:
+                    store.pop(key)
+
+    def get_or_add(self, key, value, timeout=None):
+        now = time.time()
+        expires = self._expires(timeout)
+        data = self._serializer.dumps(value)
+        lock, store = self._stripe(key)
+        with lock:
+            stored = store.get(key, now)
+            if stored is None:
+                store.trim(now)
+                store.set(key, data, expires)
+        if stored is None:
+            return value
+        return loads(stored)
+
+    def incr(self, key, delta=1, timeout=None):
+        now = time.time()
+        expires = self._expires(timeout)
+        lock, store = self._stripe(key)
+        with lock:
+            store.trim(now)
+            return increment(store, key, delta, expires, now,
+                             self._serializer)
+
+    def clear(self):
+        for lock, store in self._stripes:
+            with lock:
+                store.clear()
+
+    def __iter__(self):
+        for lock, store in self._stripes:
+            with lock:
+                keys = store.keys()
+            for key in keys:
+                yield key, self.get(key)
+
+    def __contains__(self, key):
+        return key in self._stripe(key)[1]
+
+    def __len__(self):
+        return sum(len(store) for _, store in self._stripes)
+
+
 SQL_CREATE_TABLE = """
 CREATE TABLE IF NOT EXISTS container
 (
@@ -226,24 +678,314 @@ SQL_REPLACE = "REPLACE INTO container (key, value, expires) VALUES (?, ?, ?)"
 
 SQL_CLEAR = "DELETE FROM container"
 
+SQL_CREATE_INDEX = """
+CREATE INDEX IF NOT EXISTS container_expires ON container (expires)
+"""
+
 SQL_CLEAR_EXPIRED = "DELETE FROM container WHERE (expires <= ? AND expires > 0)"
 
+SQL_CLEAR_EXPIRED_BATCH = """
+DELETE FROM container WHERE key IN
+(
+    SELECT key FROM container WHERE (expires <= ? AND expires > 0) LIMIT ?
+)
+"""
+
 SQL_COUNT = "SELECT count(*) FROM container WHERE key = ?"
 
 SQL_COUNT_ALL = "SELECT count(*) FROM container"
 
+SQL_SELECT_MANY = """
+SELECT key, value, expires FROM container WHERE key IN ({0})
+"""
+
 SQL_SELECT_ALL = "SELECT key, value, expires FROM container"
 
+# Stores a value unless a live one exists. Changes no rows otherwise.
+SQL_GET_OR_ADD = """
+INSERT INTO container (key, value, expires) VALUES (?, ?, ?)
+ON CONFLICT (key) DO UPDATE
+SET value = excluded.value, expires = excluded.expires
+WHERE container.expires < ? AND container.expires != 0
+"""
+
+# Increments a live counter in place. Changes no rows if the stored value
+# isn't a native integer or has expired.
+SQL_INCR = """
+INSERT INTO container (key, value, expires) VALUES (?, ?, ?)
+ON CONFLICT (key) DO UPDATE
+SET value = container.value + excluded.value
+WHERE typeof(container.value) = 'integer'
+    AND (container.expires >= ? OR container.expires = 0)
+"""
+
+# UPSERT is supported since SQLite 3.24.0, older versions read and write
+# entries within a single transaction instead.
+SQLITE_UPSERT = sqlite3.sqlite_version_info >= (3, 24, 0)
+
+# Executed once per connection. WAL journal lets readers work concurrently
+# with a writer, and only requires fsync on checkpoints with NORMAL
+# synchronous mode.
+SQL_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -8000",
+    "PRAGMA temp_store = MEMORY",
+)
+
+# Number of compiled statements kept by each connection.
+STATEMENT_CACHE_SIZE = 32
+
+# Expired entries are trimmed on every TRIM_INTERVAL-th write, at most
+# TRIM_BATCH_SIZE entries at a time. Expired entries are treated as missing
+# on reads anyway.
+TRIM_INTERVAL = 100
+
+TRIM_BATCH_SIZE = 500
+
+# Maximum number of keys per bulk query, SQLite allows 999 parameters by
+# default.
+MAX_QUERY_KEYS = 500
+
+# Write-behind defaults: pending writes are committed once there are
+# FLUSH_SIZE of them or FLUSH_INTERVAL seconds after the previous flush,
+# whichever comes first.
+FLUSH_SIZE = 100
+
+FLUSH_INTERVAL = 5.0
+
+# How often the scheduler looks for write-behind caches which are due.
+FLUSH_CHECK_INTERVAL = 1.0
+
+# Pending deletion marker.
+DELETED = object()
+
+
+def chunked(items, size):
+    """Splits a sequence into lists of at most `size` items.
+
+    >>> list(chunked(range(5), 2))
+    [[0, 1], [2, 3], [4]]
+    """
+
+    items = list(items)
+    for i in xrange(0, len(items), size):
+        yield items[i:i + size]
+
+
+def blob(value):
+    """Wraps serialized value for storing in a BLOB column. Counters are
+    stored as native integers, so they can be incremented in place."""
+
+    if isinstance(value, (int, long)):
+        return value
+    return buffer(value)
+
+
+@contextlib.contextmanager
+def transaction(connection):
+    """Runs enclosed statements in a single transaction, also on connections
+    in autocommit mode."""
+
+    autocommit = connection.isolation_level is None
+    if autocommit:
+        connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield connection
+    except Exception:
+        if autocommit:
+            connection.execute("ROLLBACK")
+        else:
+            connection.rollback()
+        raise
+    if autocommit:
+        connection.execute("COMMIT")
+    else:
+        connection.commit()
+
+
+class WriteBuffer(object):
+    """Pending writes of a write-behind SQLite cache.
+    Maps database keys to `(serialized value, expires)` tuples or `DELETED`.
+    Entries are only removed from the buffer once they have been committed,
+    so readers consulting the buffer first never see stale data."""
+
+    def __init__(self, size=FLUSH_SIZE, interval=FLUSH_INTERVAL):
+        self.size = size
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flushed = time.time()
+
+    def get(self, key):
+        """Returns pending entry, `DELETED` or `None` if there is none."""
+
+        return self._pending.get(key)
+
+    def put(self, key, entry):
+        """Returns `True` once the buffer is full and should be flushed."""
+
+        with self._lock:
+            self._pending[key] = entry
+            return len(self._pending) >= self.size
+
+    def modify(self, key, func):
+        """Atomically replaces pending entry of `key` (`None` if there is
+        none) with the one returned by `func`, if any. `func` returns an
+        `(entry, result)` pair. Returns `result` and whether the buffer
+        should be flushed."""
+
+        with self._lock:
+            entry, result = func(self._pending.get(key))
+            if entry is not None:
+                self._pending[key] = entry
+            return result, len(self._pending) >= self.size
+
+    def is_due(self):
+        return bool(self._pending) and \
+            time.time() - self._flushed >= self.interval
+
+    def clear(self, connection, statement):
+        """Discards pending writes and executes `statement`."""
+
+        with self._flush_lock:
+            with self._lock:
+                self._pending.clear()
+            connection.execute(statement)
+
+    def flush(self, connection, *statements):
+        """Commits pending writes along with optional `(sql, params)`
+        statements in a single transaction. Returns number of flushed
+        entries."""
+
+        with self._flush_lock:
+            with self._lock:
+                pending = self._pending.items()
+            self._flushed = time.time()
+            if not pending:
+                return 0
+            deleted = [(key,) for key, entry in pending if entry is DELETED]
+            replaced = [(key, blob(entry[0]), entry[1])
+                        for key, entry in pending if entry is not DELETED]
+            with transaction(connection):
+                connection.executemany(SQL_DELETE, deleted)
+                connection.executemany(SQL_REPLACE, replaced)
+                for statement, params in statements:
+                    connection.execute(statement, params)
+            with self._lock:
+                for key, entry in pending:
+                    if self._pending.get(key) is entry:
+                        del self._pending[key]
+            return len(pending)
+
+    def __len__(self):
+        return len(self._pending)
+
+
+def modify(connection, key, func, upsert=None, write_buffer=None):
+    """Atomically replaces live `(value, expires)` entry of `key` (`None` if
+    there is none) with the one returned by `func`, if any. `func` returns an
+    `(entry, result)` pair. Entries pending in `write_buffer` take precedence
+    over stored ones and new entries are only buffered.
+    `upsert` is an optional `(sql, params)` statement tried first; if it
+    changes a row, stored value is the result and `func` isn't called.
+    Returns `result` and whether the write buffer should be flushed."""
+
+    now = time.time()
+
+    def apply(entry):
+        if entry is None:
+            entry = connection.execute(SQL_SELECT, (key,)).fetchone()
+        if entry is DELETED or \
+                (entry is not None and entry[1] < now and entry[1] != 0):
+            entry = None
+        return func(entry)
+
+    if write_buffer is not None:
+        return write_buffer.modify(key, apply)
+    with transaction(connection):
+        if upsert is not None and SQLITE_UPSERT:
+            if connection.execute(*upsert).rowcount:
+                stored = connection.execute(SQL_SELECT, (key,)).fetchone()
+                return loads(stored[0]), False
+        entry, result = apply(None)
+        if entry is not None:
+            connection.execute(SQL_REPLACE, (key, blob(entry[0]), entry[1]))
+    return result, False
+
+
+_write_behind_caches = weakref.WeakSet()
+
+_flush_job = None
+
+_flush_job_lock = threading.Lock()
+
+
+def register_write_behind(cache):
+    """Makes the scheduler flush `cache` periodically and on exit. Cache is
+    expected to provide `flush()` and `flush_is_due()` methods."""
+
+    global _flush_job
+    with _flush_job_lock:
+        _write_behind_caches.add(cache)
+        if _flush_job is None:
+            _flush_job = scheduler.call_every(FLUSH_CHECK_INTERVAL,
+                                              _flush_due,
+                                              delay=FLUSH_CHECK_INTERVAL)
+
+
+def _flush_due():
+    for cache in list(_write_behind_caches):
+        if cache.flush_is_due():
+            try:
+                cache.flush()
+            except Exception:
+                log.exception("Unable to flush %r", cache)
+
+
+def flush_all():
+    """Flush pending writes of every write-behind cache."""
+
+    for cache in list(_write_behind_caches):
+        try:
+            cache.flush()
+        except Exception:
+            log.exception("Unable to flush %r", cache)
+
+
+atexit.register(flush_all)
+
 
 class SQLiteCache(BaseCache):
     """SQLite cache backend.
-    Note: `:memory:` location is not directly supported, as this backend
-    creates a separate connection for each query."""
-
-    def __init__(self, location, timeout=600, key_prefix=None):
-        super(SQLiteCache, self).__init__(timeout)
+    Every thread keeps its own persistent connection to the database, so
+    compiled statements are reused between queries. Connections of threads
+    which have exited are closed when the next connection is opened.
+    Note: `:memory:` location results in a separate database per thread.
+
+    With `write_behind` enabled, `set` and `delete` only update an in-memory
+    buffer which is committed in a single transaction once `flush_size`
+    writes are pending, `flush_interval` seconds after the previous flush or
+    on exit. Writes which are not flushed yet are lost if the process
+    crashes."""
+
+    def __init__(self, location, timeout=600, key_prefix=None,
+                 write_behind=False, flush_size=FLUSH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, **kwargs):
+        super(SQLiteCache, self).__init__(timeout, **kwargs)
         self._key_prefix = key_prefix
         self._location = location
+        self._local = threading.local()
+        # Pairs of threads and connections they have opened.
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        self._write_buffer = None
+        if write_behind:
+            self._write_buffer = WriteBuffer(flush_size, flush_interval)
+            register_write_behind(self)
 
     def _make_key(self, key, key_prefix=None):
         prefix = key_prefix or self._key_prefix
@@ -251,31 +993,93 @@ class SQLiteCache(BaseCache):
             return '%s_%s' % (prefix, key)
         return key
 
+    def _get_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # Connections are only used by the thread which has opened them,
+            # the check is disabled so close() is able to close all of them.
+            kwargs = dict(database=self._location, timeout=5,
+                          isolation_level=None, check_same_thread=False,
+                          cached_statements=STATEMENT_CACHE_SIZE)
+            connection = sqlite3.Connection(**kwargs)
+            for pragma in SQL_PRAGMAS:
+                connection.execute(pragma)
+            connection.execute(SQL_CREATE_TABLE)
+            connection.execute(SQL_CREATE_INDEX)
+            self._local.connection = connection
+            with self._connections_lock:
+                dead = [(thread, conn) for thread, conn in self._connections
+                        if not thread.is_alive()]
+                self._connections = [
+                    (thread, conn) for thread, conn in self._connections
+                    if thread.is_alive()]
+                self._connections.append(
+                    (threading.current_thread(), connection))
+            for _, conn in dead:
+                conn.close()
+        return connection
+
     @contextlib.contextmanager
     def _connect(self):
-        kwargs = dict(database=self._location, timeout=5, isolation_level=None)
-        connection = sqlite3.Connection(**kwargs)
-        connection.cursor().execute(SQL_CREATE_TABLE)
-        try:
-            yield connection
-        finally:
+        yield self._get_connection()
+
+    def flush(self):
+        """Commit pending writes of a write-behind cache."""
+
+        if self._write_buffer:
+            self._write_buffer.flush(
+                self._get_connection(),
+                (SQL_CLEAR_EXPIRED_BATCH, (time.time(), TRIM_BATCH_SIZE)))
+
+    def flush_is_due(self):
+        return self._write_buffer is not None and self._write_buffer.is_due()
+
+    def close(self):
+        """Flush pending writes and close connections of every thread."""
+
+        self.flush()
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for _, connection in connections:
             connection.close()
 
-    def _trim(self):
+    def _trim(self, limit=None):
+        self.flush()
         now = time.time()
         with self._connect() as conn:
-            conn.cursor().execute(SQL_CLEAR_EXPIRED, (now,))
+            if limit is None:
+                conn.execute(SQL_CLEAR_EXPIRED, (now,))
+            else:
+                conn.execute(SQL_CLEAR_EXPIRED_BATCH, (now, limit))
+
+    def _maybe_trim(self):
+        with self._writes_lock:
+            self._writes += 1
+            due = self._writes >= TRIM_INTERVAL
+            if due:
+                self._writes = 0
+        if due:
+            self._trim(TRIM_BATCH_SIZE)
 
     def get(self, key, key_prefix=None):
         key = self._make_key(key, key_prefix)
         now = time.time()
         value = None
+        if self._write_buffer is not None:
+            entry = self._write_buffer.get(key)
+            if entry is DELETED:
+                return None
+            if entry is not None:
+                if entry[1] >= now or entry[1] == 0:
+                    value = loads(entry[0])
+                return value
         with self._connect() as conn:
             try:
-                result = conn.cursor().execute(SQL_SELECT, (key,)).fetchone()
+                result = conn.execute(SQL_SELECT, (key,)).fetchone()
                 expires = result[1]
                 if expires >= now or expires == 0:
-                    value = pickle.loads(result[0])
+                    value = loads(result[0])
             except TypeError:
                 pass
         return value
@@ -290,13 +1094,20 @@ class SQLiteCache(BaseCache):
             expires = 0
         else:
             expires = now + (timeout or self._timeout)
-        self._trim()
+        if self._write_buffer is not None:
+            value = self._serializer.dumps(value)
+            if self._write_buffer.put(key, (value, expires)):
+                self.flush()
+            return
+        self._maybe_trim()
         with self._connect() as conn:
-            value = buffer(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
-            conn.cursor().execute(SQL_REPLACE, (key, value, expires,))
+            value = buffer(self._serializer.dumps(value))
+            conn.execute(SQL_REPLACE, (key, value, expires,))
 
     def add(self, key, value, timeout=None, key_prefix=None):
-        """Set `timeout` to `0` to disable key expiration."""
+        """Set `timeout` to `0` to disable key expiration.
+        Write-behind caches flush pending writes first, as adding depends on
+        what is stored in the database."""
 
         key = self._make_key(key, key_prefix)
         now = time.time()
@@ -305,36 +1116,151 @@ class SQLiteCache(BaseCache):
             expires = 0
         else:
             expires = now + (timeout or self._timeout)
-        self._trim()
+        self.flush()
+        self._maybe_trim()
         with self._connect() as conn:
-            value = buffer(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
-            conn.cursor().execute(SQL_INSERT, (key, value, expires,))
+            value = buffer(self._serializer.dumps(value))
+            conn.execute(SQL_INSERT, (key, value, expires,))
 
     def delete(self, key, key_prefix=None):
         key = self._make_key(key, key_prefix)
+        if self._write_buffer is not None:
+            if self._write_buffer.put(key, DELETED):
+                self.flush()
+            return
+        with self._connect() as conn:
+            conn.execute(SQL_DELETE, (key,))
+
+    def get_many(self, keys, key_prefix=None):
+        """Looks up keys using a single query per `MAX_QUERY_KEYS` of them.
+        Returns a dictionary of keys which have been found along with their
+        values."""
+
+        db_keys = dict((self._make_key(key, key_prefix), key) for key in keys)
+        now = time.time()
+        values = {}
+        missing = db_keys.keys()
+        if self._write_buffer is not None:
+            missing = []
+            for db_key in db_keys:
+                entry = self._write_buffer.get(db_key)
+                if entry is None:
+                    missing.append(db_key)
+                elif entry is not DELETED and \
+                        (entry[1] >= now or entry[1] == 0):
+                    values[db_keys[db_key]] = loads(entry[0])
         with self._connect() as conn:
-            conn.cursor().execute(SQL_DELETE, (key,))
+            for chunk in chunked(missing, MAX_QUERY_KEYS):
+                query = SQL_SELECT_MANY.format(",".join("?" * len(chunk)))
+                for db_key, value, expires in conn.execute(query, chunk):
+                    if expires >= now or expires == 0:
+                        values[db_keys[db_key]] = loads(value)
+        return values
+
+    def set_many(self, mapping, timeout=None, key_prefix=None):
+        """Stores every key-value pair of `mapping` in a single
+        transaction."""
+
+        expires = self._expires(timeout)
+        rows = [(self._make_key(key, key_prefix),
+                 self._serializer.dumps(value), expires)
+                for key, value in mapping.iteritems()]
+        if self._write_buffer is not None:
+            full = False
+            for key, value, expires in rows:
+                full = self._write_buffer.put(key, (value, expires)) or full
+            if full:
+                self.flush()
+            return
+        self._maybe_trim()
+        with transaction(self._get_connection()) as conn:
+            conn.executemany(SQL_REPLACE, [(key, buffer(value), expires)
+                                           for key, value, expires in rows])
+
+    def delete_many(self, keys, key_prefix=None):
+        keys = [self._make_key(key, key_prefix) for key in keys]
+        if self._write_buffer is not None:
+            full = False
+            for key in keys:
+                full = self._write_buffer.put(key, DELETED) or full
+            if full:
+                self.flush()
+            return
+        with transaction(self._get_connection()) as conn:
+            conn.executemany(SQL_DELETE, [(key,) for key in keys])
+
+    def _modify(self, key, func, upsert=None):
+        if self._write_buffer is None:
+            self._maybe_trim()
+        result, full = modify(self._get_connection(), key, func, upsert,
+                              self._write_buffer)
+        if full:
+            self.flush()
+        return result
+
+    def get_or_add(self, key, value, timeout=None, key_prefix=None):
+        """Returns value stored under `key`, storing `value` first if there
+        is none, atomically."""
+
+        key = self._make_key(key, key_prefix)
+        expires = self._expires(timeout)
+        data = self._serializer.dumps(value)
+
+        def func(entry):
+            if entry is not None:
+                return None, loads(entry[0])
+            return (data, expires), value
+
+        upsert = (SQL_GET_OR_ADD, (key, buffer(data), expires, time.time()))
+        return self._modify(key, func, upsert)
+
+    def incr(self, key, delta=1, timeout=None, key_prefix=None):
+        """Atomically adds `delta` to integer value of `key` and returns the
+        result. Counters are stored as native SQLite integers and
+        incremented in place."""
+
+        key = self._make_key(key, key_prefix)
+        expires = self._expires(timeout)
+
+        def func(entry):
+            if entry is None:
+                return (delta, expires), delta
+            value = int(loads(entry[0])) + delta
+            return (value, entry[1]), value
+
+        upsert = (SQL_INCR, (key, delta, expires, time.time()))
+        return self._modify(key, func, upsert)
+
+    def decr(self, key, delta=1, timeout=None, key_prefix=None):
+        return self.incr(key, -delta, timeout, key_prefix)
 
     def clear(self):
+        if self._write_buffer is not None:
+            self._write_buffer.clear(self._get_connection(), SQL_CLEAR)
+            return
         with self._connect() as conn:
-            conn.cursor().execute(SQL_CLEAR)
+            conn.execute(SQL_CLEAR)
 
     def __iter__(self):
+        self.flush()
         with self._connect() as conn:
-            cursor = conn.cursor()
-            cursor.execute(SQL_SELECT_ALL)
-            for key, value, expires in cursor.fetchall():
+            for key, value, expires in conn.execute(SQL_SELECT_ALL).fetchall():
                 yield key, self.get(key)
 
     def __contains__(self, key):
         key = self._make_key(key)
+        if self._write_buffer is not None:
+            entry = self._write_buffer.get(key)
+            if entry is not None:
+                return entry is not DELETED
         with self._connect() as conn:
-            result = conn.cursor().execute(SQL_COUNT, (key,)).fetchone()
+            result = conn.execute(SQL_COUNT, (key,)).fetchone()
             return bool(result[0])
 
     def __len__(self):
+        self.flush()
         with self._connect() as conn:
-            result = conn.cursor().execute(SQL_COUNT_ALL).fetchone()
+            result = conn.execute(SQL_COUNT_ALL).fetchone()
             return result[0]
 
 
@@ -85,6 +85,16 @@ LOGGING_CONFIG = {
     },
 }
 
+# Number of titles kept in memory by each URL parser plugin.
+TITLE_CACHE_SIZE = 256
+
+# Titles older than TITLE_REFRESH_AFTER seconds are refreshed in background
+# while the cached ones are still being output. Titles which haven't been
+# refreshed in TITLE_TIMEOUT seconds expire.
+TITLE_REFRESH_AFTER = 24 * 3600.0
+
+TITLE_TIMEOUT = 30 * 24 * 3600.0
+
 # Plugin cache configuration. Keys are case-sensitive and should match
 # corresponding plugin class names. Regular Python dictionary is being used as
 # a cache-like storage by default unless it hasn't been set explicitly.
@@ -97,13 +107,19 @@ LOGGING_CONFIG = {
 # will be looking for "derp" cache config entry firstly.
 CACHE_CONFIG = {
     "VimeoURLParser": {
-        "backend": "cache.SQLiteCache",
-        "timeout": 0.0,
+        "backend": "cache.TieredCache",
+        "max_entries": TITLE_CACHE_SIZE,
+        "serializer": "raw",
+        "timeout": TITLE_TIMEOUT,
+        "refresh_after": TITLE_REFRESH_AFTER,
         "location": os.path.join(CACHE_DIR, "vimeo.sqlite"),
     },
     "YouTubeURLParser": {
-        "backend": "cache.SQLiteCache",
-        "timeout": 0.0,
+        "backend": "cache.TieredCache",
+        "max_entries": TITLE_CACHE_SIZE,
+        "serializer": "raw",
+        "timeout": TITLE_TIMEOUT,
+        "refresh_after": TITLE_REFRESH_AFTER,
         "location": os.path.join(CACHE_DIR, "youtube.sqlite"),
     },
     "URLDiscoverer": {
@@ -122,8 +138,11 @@ CACHE_CONFIG = {
         "location": os.path.join(CACHE_DIR, "herpderper.sqlite"),
     },
     "IMDbURLParser": {
-        "backend": "cache.SQLiteCache",
-        "timeout": 0.0,
+        "backend": "cache.TieredCache",
+        "max_entries": TITLE_CACHE_SIZE,
+        "serializer": "raw",
+        "timeout": TITLE_TIMEOUT,
+        "refresh_after": TITLE_REFRESH_AFTER,
         "location": os.path.join(CACHE_DIR, "imdb.sqlite"),
     },
     "DuplicateURLChecker": {
@@ -134,22 +153,32 @@ CACHE_CONFIG = {
     "GuessThePicture": {
         "backend": "cache.SQLiteCache",
         "timeout": 128000.0 * 42,  # 42 days.
+        # Most URLs aren't pictures, don't query them over and over again.
+        "negative_timeout": 128000.0 * 3,  # 3 days.
         "location": os.path.join(CACHE_DIR, "guessthepicture.sqlite"),
     },
     "LentaURLParser": {
-        "backend": "cache.SQLiteCache",
-        "timeout": 0,
+        "backend": "cache.TieredCache",
+        "max_entries": TITLE_CACHE_SIZE,
+        "serializer": "raw",
+        "timeout": TITLE_TIMEOUT,
+        "refresh_after": TITLE_REFRESH_AFTER,
         "location": os.path.join(CACHE_DIR, "lentaurlparser.sqlite"),
     },
     "CoubURLParser": {
-        "backend": "cache.SQLiteCache",
-        "timeout": 0,
+        "backend": "cache.TieredCache",
+        "max_entries": TITLE_CACHE_SIZE,
+        "serializer": "raw",
+        "timeout": TITLE_TIMEOUT,
+        "refresh_after": TITLE_REFRESH_AFTER,
         "location": os.path.join(CACHE_DIR, "couburlparser.sqlite"),
     },
     "TwitchTvNotifier": {
         "backend": "cache.SQLiteCache",
         "timeout": 0,
         "location": os.path.join(CACHE_DIR, "twitchtvnotifier.sqlite"),
+        # Stream states are rewritten on every check, buffer them.
+        "write_behind": True,
     },
 }
 
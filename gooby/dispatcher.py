@@ -27,6 +27,13 @@ Usage
     >>> responses = dispatcher.send("my signal", 42, herp="derp")
     >>> responses
     [((42,), {'herp': u'derp'}), 42]
+
+Receivers are able to run in the shared worker pool as well:
+
+    >>> from workers import gather
+    >>> futures = dispatcher.send_async("my signal", 42, herp="derp")
+    >>> gather(futures, timeout=5)
+    [((42,), {'herp': u'derp'}), 42]
 """
 
 
@@ -36,42 +43,109 @@ from __future__ import unicode_literals
 __docformat__ = "restructuredtext en"
 
 
+import sys
+import logging
 import weakref
 import threading
+from collections import OrderedDict
+
+import workers
+from errors import WorkerError
+
+
+log = logging.getLogger("Gooby.Dispatcher")
+
+
+class WeakMethod(object):
+    """
+    :func:`weakref.ref` counterpart for bound methods. Bound method objects
+    are created on every attribute access, so a plain weak reference to one
+    dies immediately. This one references the instance weakly and the
+    function strongly instead.
+
+    >>> class Test(object):
+    ...     def method(self):
+    ...         return 42
+    >>> obj = Test()
+    >>> ref = WeakMethod(obj.method)
+    >>> ref()()
+    42
+    >>> del obj
+    >>> ref() is None
+    True
+    """
+
+    def __init__(self, method, callback=None):
+        self._func = method.im_func
+        if callback is not None:
+            self._self = weakref.ref(method.im_self, lambda _: callback(self))
+        else:
+            self._self = weakref.ref(method.im_self)
+
+    def __call__(self):
+        obj = self._self()
+        if obj is None:
+            return None
+        return self._func.__get__(obj, type(obj))
 
 
-WEAKREF_TYPES = (weakref.ReferenceType,)
+WEAKREF_TYPES = (weakref.ReferenceType, WeakMethod)
 
 
-_id = lambda target: id(target)
+def _id(target):
+    # Bound methods are identified by their instance and function, as every
+    # attribute access produces a new method object.
+    if getattr(target, "im_self", None) is not None:
+        return id(target.im_self), id(target.im_func)
+    return id(target)
 
 
 class _Dispatcher(object):
     def __init__(self):
+        # Signal -> {receiver ID: receiver} mapping; ordered, so receivers
+        # are called in order of connection.
         self.connections = dict()
-        self.lock = threading.Lock()
+        # Receiver ID -> set of signals index for quick cleanup.
+        self._signals = dict()
+        # Reentrant, since weak reference callbacks are able to fire while
+        # the lock is already being held by the same thread.
+        self.lock = threading.RLock()
 
     def connect(self, receiver, signal, weak=True):
         lookup_id = _id(receiver)
         if weak:
-            receiver = weakref.ref(receiver, self._remove_receiver)
-        with self.lock:
-            receivers = self.connections.setdefault(signal, list())
-            for r_id, _ in receivers:
-                if r_id == lookup_id:
-                    break
+            callback = lambda ref: self._remove_receiver(lookup_id, ref)
+            if getattr(receiver, "im_self", None) is not None:
+                receiver = WeakMethod(receiver, callback)
             else:
-                receivers.append((lookup_id, receiver))
+                receiver = weakref.ref(receiver, callback)
+        with self.lock:
+            receivers = self.connections.setdefault(signal, OrderedDict())
+            if lookup_id not in receivers:
+                receivers[lookup_id] = receiver
+                self._signals.setdefault(lookup_id, set()).add(signal)
 
     def disconnect(self, receiver, signal):
         lookup_id = _id(receiver)
         with self.lock:
-            receivers = self.connections.get(signal)
-            for index in xrange(len(receivers)):
-                r_id, _ = receivers[index]
-                if r_id == lookup_id:
-                    del receivers[index]
-                    break
+            self._disconnect(lookup_id, signal)
+
+    def _disconnect(self, lookup_id, signal):
+        receivers = self.connections.get(signal)
+        if receivers is not None:
+            receivers.pop(lookup_id, None)
+            if not receivers:
+                del self.connections[signal]
+        signals = self._signals.get(lookup_id)
+        if signals is not None:
+            signals.discard(signal)
+            if not signals:
+                del self._signals[lookup_id]
+
+    def clear(self):
+        with self.lock:
+            self.connections.clear()
+            self._signals.clear()
 
     def send(self, signal, *args, **kwargs):
         responses = list()
@@ -79,29 +153,63 @@ class _Dispatcher(object):
             responses.append(receiver(*args, **kwargs))
         return responses
 
+    def send_async(self, signal, *args, **kwargs):
+        """
+        Calls every receiver in the shared worker pool instead of the calling
+        thread.
+
+        :returns: one future per receiver; use :func:`workers.gather` to wait
+            for the results
+        :rtype: `list` of :class:`workers.Future` objects
+        """
+
+        futures = list()
+        for receiver in self._real_receivers(signal):
+            try:
+                future = workers.submit(receiver, *args, **kwargs)
+            except WorkerError:
+                future = workers.Future()
+                future.set_exception(sys.exc_info())
+            futures.append(future)
+        return futures
+
+    def post(self, signal, *args, **kwargs):
+        """
+        Fire-and-forget version of :meth:`send_async`. Receiver errors are
+        logged.
+        """
+
+        for future in self.send_async(signal, *args, **kwargs):
+            future.add_done_callback(_log_failure)
+
     def _real_receivers(self, signal):
-        for r_id, receiver in self.connections.get(signal):
+        with self.lock:
+            receivers = self.connections.get(signal, {}).values()
+        for receiver in receivers:
             if isinstance(receiver, WEAKREF_TYPES):
                 receiver = receiver()
+                if receiver is None:
+                    continue
             yield receiver
 
-    def _remove_receiver(self, receiver):
+    def _remove_receiver(self, lookup_id, ref):
+        """
+        Weak reference callback. Removes dead receiver from every signal it
+        has been connected to.
+        """
+
         with self.lock:
-            to_remove = list()
-            for signal, receivers in self.connections.iteritems():
-                for r_id, r in receivers:
-                    if r == receiver:
-                        to_remove.append(r_id)
-                for lookup_id in to_remove:
-                    # Enumerate in reversed order to avoid index errors while
-                    # deleting list elements.
-                    # last_index = len(receivers) - 1
-                    # for index, (r_id, _) in enumerate(reversed(receivers)):
-                    #     if r_id == lookup_id:
-                    #         del receivers[last_index - index]
-                    for index, (r_id, _) in enumerate(receivers):
-                        if r_id == lookup_id:
-                            receivers.pop(index)
+            for signal in list(self._signals.get(lookup_id, ())):
+                receivers = self.connections.get(signal, {})
+                # The same ID might have been taken by another receiver.
+                if receivers.get(lookup_id) is ref:
+                    self._disconnect(lookup_id, signal)
+
+
+def _log_failure(future):
+    error = future.exception()
+    if error is not None:
+        log.error("Signal receiver has failed: %r", error)
 
 
 dispatcher = _Dispatcher()
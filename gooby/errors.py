@@ -32,3 +32,11 @@ class PluginOutputError(GoobyError):
 
 class PluginError(GoobyError):
     pass
+
+
+class WorkerError(GoobyError):
+    pass
+
+
+class FutureTimeoutError(WorkerError):
+    pass
@@ -28,6 +28,8 @@ from version import __version__ as gooby_version
 from errors import PluginOutputError, PluginError
 from dispatcher import dispatcher
 import signals
+import workers
+from scheduler import scheduler
 
 
 log = logging.getLogger("Gooby")
@@ -63,8 +65,8 @@ class Gooby(object):
     def _chats(self):
         """Signal receiver."""
 
-        for chat in chain(self.skype.RecentChats, self.skype.BookmarkedChats):
-            yield chat.Name
+        return [chat.Name for chat in chain(self.skype.RecentChats,
+                                            self.skype.BookmarkedChats)]
 
     def _usage(self, target, *args, **kwargs):
         """Signal receiver."""
@@ -121,6 +123,9 @@ class Gooby(object):
 
     def shutdown(self):
         log.info("Shutting down")
+        scheduler.shutdown()
+        workers.worker_pool.shutdown(wait=False)
+        workers.process_pool.shutdown(wait=False)
         del self.skype
         logging.shutdown()
 
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+:mod:`messagelog` --- Append-only chat message log
+==================================================
+
+Keeps chat sentences in SQLite, one row per sentence indexed by chat and
+timestamp. Appending a sentence is a single insert, expiring old sentences
+is a range delete, and sentences are read back as a stream instead of being
+loaded at once.
+
+    >>> from messagelog import MessageLog
+    >>> log = MessageLog(":memory:")
+    >>> log.append("#chat", "Herp derp.", timestamp=1)
+    1
+    >>> log.append("#chat", "Gooby pls.", timestamp=2)
+    2
+    >>> list(log.sentences("#chat"))
+    [u'Herp derp.', u'Gooby pls.']
+    >>> log.expire("#chat", before=2)
+    1
+    >>> log.count("#chat")
+    1
+"""
+
+
+from __future__ import unicode_literals
+
+
+__docformat__ = "restructuredtext en"
+
+
+import sqlite3
+import threading
+import time
+
+from cache_new import SQL_PRAGMAS, STATEMENT_CACHE_SIZE, transaction
+
+
+SQL_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS messages
+(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat TEXT NOT NULL,
+    timestamp FLOAT NOT NULL,
+    sentence TEXT NOT NULL
+)
+"""
+
+SQL_CREATE_INDEX = """
+CREATE INDEX IF NOT EXISTS messages_chat_timestamp
+ON messages (chat, timestamp)
+"""
+
+SQL_INSERT = """
+INSERT INTO messages (chat, timestamp, sentence) VALUES (?, ?, ?)
+"""
+
+# Index entries are ordered by rowid within equal timestamps, so sentences
+# are streamed in timestamp order without sorting, those with equal
+# timestamps in the order they were appended. Sentences appended with
+# earlier timestamps than previous ones are streamed before them.
+SQL_SELECT = """
+SELECT id, timestamp, sentence FROM messages
+WHERE chat = ? AND timestamp >= ?
+ORDER BY timestamp, id
+"""
+
+# Rows appended after a known one, e.g. to catch up with the log.
+SQL_SELECT_AFTER = """
+SELECT id, timestamp, sentence FROM messages
+WHERE id > ? AND chat = ?
+ORDER BY id
+"""
+
+SQL_DELETE_EXPIRED = "DELETE FROM messages WHERE chat = ? AND timestamp < ?"
+
+SQL_COUNT = "SELECT COUNT(*) FROM messages WHERE chat = ?"
+
+SQL_COUNT_AFTER = "SELECT COUNT(*) FROM messages WHERE id > ? AND chat = ?"
+
+SQL_CHATS = "SELECT DISTINCT chat FROM messages"
+
+SQL_CLEAR = "DELETE FROM messages WHERE chat = ?"
+
+# Rows fetched from the database at a time while streaming.
+FETCH_SIZE = 256
+
+
+class MessageLog(object):
+    """
+    Append-only log of chat sentences.
+
+    Every thread keeps its own connection to the database, like
+    :class:`~cache_new.SQLiteCache` does, so the log may be shared between
+    threads. Note: `:memory:` location results in a separate database per
+    thread.
+    """
+
+    def __init__(self, location):
+        """
+        :param location: database file path
+        :type location: `unicode`
+        """
+
+        self._location = location
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    def _get_connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.Connection(
+                database=self._location, timeout=5, isolation_level=None,
+                check_same_thread=False,
+                cached_statements=STATEMENT_CACHE_SIZE)
+            for pragma in SQL_PRAGMAS:
+                connection.execute(pragma)
+            connection.execute(SQL_CREATE_TABLE)
+            connection.execute(SQL_CREATE_INDEX)
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def close(self):
+        """Close connections of every thread."""
+
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for connection in connections:
+            connection.close()
+
+    def append(self, chat, sentence, timestamp=None):
+        """
+        :param chat: chat name
+        :type chat: `unicode`
+
+        :param sentence: sentence to append
+        :type sentence: `unicode`
+
+        :param timestamp: sentence UNIX timestamp, current time by default
+        :type timestamp: `float`
+
+        :returns: id of the appended row
+        :rtype: `int`
+        """
+
+        if timestamp is None:
+            timestamp = time.time()
+        cursor = self._get_connection().execute(SQL_INSERT,
+                                                (chat, timestamp, sentence))
+        return cursor.lastrowid
+
+    def extend(self, chat, entries):
+        """
+        Appends multiple sentences in a single transaction.
+
+        :param entries: ``(sentence, timestamp)`` pairs
+        :type entries: iterable
+        """
+
+        with transaction(self._get_connection()) as conn:
+            conn.executemany(SQL_INSERT, ((chat, timestamp, sentence)
+                                          for sentence, timestamp in entries))
+
+    def entries(self, chat, since=0):
+        """
+        Streams ``(id, timestamp, sentence)`` rows of a chat ordered by
+        timestamp, rows with equal timestamps in the order they were
+        appended.
+
+        :param since: minimal sentence timestamp
+        :type since: `float`
+
+        :rtype: generator
+        """
+
+        return self._stream(SQL_SELECT, (chat, since))
+
+    def entries_after(self, chat, entry_id):
+        """
+        Streams ``(id, timestamp, sentence)`` rows of a chat appended after
+        the row with the given id.
+
+        :rtype: generator
+        """
+
+        return self._stream(SQL_SELECT_AFTER, (entry_id, chat))
+
+    def _stream(self, query, parameters):
+        cursor = self._get_connection().cursor()
+        cursor.arraysize = FETCH_SIZE
+        cursor.execute(query, parameters)
+        try:
+            while True:
+                rows = cursor.fetchmany()
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            cursor.close()
+
+    def sentences(self, chat, since=0):
+        """
+        Streams sentences of a chat in the order of :meth:`entries`.
+
+        :rtype: generator
+        """
+
+        for _, _, sentence in self.entries(chat, since):
+            yield sentence
+
+    def expire(self, chat, before):
+        """
+        Deletes sentences of a chat older than `before`.
+
+        :param before: UNIX timestamp
+        :type before: `float`
+
+        :returns: number of deleted sentences
+        :rtype: `int`
+        """
+
+        cursor = self._get_connection().execute(SQL_DELETE_EXPIRED,
+                                                (chat, before))
+        return cursor.rowcount
+
+    def count(self, chat):
+        """
+        :returns: number of sentences logged for a chat
+        :rtype: `int`
+        """
+
+        return self._get_connection().execute(SQL_COUNT,
+                                              (chat,)).fetchone()[0]
+
+    def count_after(self, chat, entry_id):
+        """
+        :returns: number of sentences of a chat appended after the row with
+            the given id
+        :rtype: `int`
+        """
+
+        return self._get_connection().execute(
+            SQL_COUNT_AFTER, (entry_id, chat)).fetchone()[0]
+
+    def chats(self):
+        """
+        :returns: names of chats having logged sentences
+        :rtype: `list`
+        """
+
+        return [row[0] for row in self._get_connection().execute(SQL_CHATS)]
+
+    def clear(self, chat):
+        """Deletes every sentence of a chat."""
+
+        self._get_connection().execute(SQL_CLEAR, (chat,))
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -18,10 +18,15 @@ __docformat__ = "restructuredtext en"
 
 
 import logging
+import sys
+from collections import deque
 
 from Skype4Py.enums import cmsReceived
 
 import cache
+import workers
+from errors import WorkerError
+from output import ChatMessage
 
 
 __all__ = [
@@ -155,7 +160,9 @@ class Plugin(object):
         self.priority = priority
         self.whitelist = whitelist
         self.options = kwargs
-        self.output = list()
+        # Appended to by event handlers and deferred call callbacks from
+        # other threads, deque appends and pops are atomic.
+        self.output = deque()
 
     def _init_logger(self):
         self._logger_name = "Gooby.Plugin." + self.__class__.__name__
@@ -165,9 +172,71 @@ class Plugin(object):
         return cache.get_cache(self.__class__.__name__)
 
     def flush_output(self):
-        output = self.output[:]
-        self.output = list()
-        return output
+        # Pop messages one by one instead of swapping or clearing the
+        # container, so messages appended meanwhile are never lost.
+        output = list()
+        while True:
+            try:
+                output.append(self.output.popleft())
+            except IndexError:
+                return output
+
+    def defer(self, func, *args, **kwargs):
+        """
+        Executes ``func(*args, **kwargs)`` in the shared worker pool, so the
+        calling event handler is able to return immediately.
+
+        Return value of `func` is appended to the plugin output once it is
+        ready. It should be either ``None``, a :class:`~output.ChatMessage`
+        object or a list of those. Exceptions are logged by the plugin logger.
+
+        ::
+
+            def on_message_status(self, message, status):
+                self.defer(self.slow_reply, message.Chat.Name)
+
+            def slow_reply(self, chat_name):
+                return ChatMessage(chat_name, retrieve_something())
+
+        :returns: future object
+        :rtype: :class:`~workers.Future`
+        """
+
+        return self._defer(workers.submit, func, args, kwargs)
+
+    def defer_process(self, func, *args, **kwargs):
+        """
+        Like :meth:`defer`, but executes ``func(*args, **kwargs)`` in the
+        shared worker process pool. Suits CPU bound calls, which would hold
+        the GIL and stall other threads otherwise. `func` must be defined at
+        module level, and its arguments and return value must be picklable.
+
+        :returns: future object
+        :rtype: :class:`~workers.Future`
+        """
+
+        return self._defer(workers.submit_process, func, args, kwargs)
+
+    def _defer(self, submit, func, args, kwargs):
+        try:
+            future = submit(func, *args, **kwargs)
+        except WorkerError:
+            future = workers.Future()
+            future.set_exception(sys.exc_info())
+        future.add_done_callback(self._deferred_done)
+        return future
+
+    def _deferred_done(self, future):
+        try:
+            result = future.result()
+        except Exception:
+            self._logger.exception("Deferred call has failed")
+            return
+        if result is None:
+            return
+        if isinstance(result, ChatMessage):
+            result = [result]
+        self.output.extend(result)
 
     def usage(self):
         return "No known usage for {0}".format(self.__class__.__name__)
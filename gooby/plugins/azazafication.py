@@ -14,13 +14,13 @@ from __future__ import unicode_literals
 __docformat__ = "restructuredtext en"
 
 
-from collections import Counter
 import random
 
 from Skype4Py.enums import cmsReceived
 
 from plugin import Plugin
 from output import ChatMessage
+from textanalysis import analyze
 
 
 OPENING_BRACES = "("
@@ -69,6 +69,18 @@ SKIPPED = [
 ]
 
 
+def count_braces(s,
+                 opening_braces=OPENING_BRACES,
+                 closing_braces=CLOSING_BRACES):
+    """
+    >>> count_braces("((a)")
+    (2, 1)
+    """
+
+    return (sum(s.count(brace) for brace in opening_braces),
+            sum(s.count(brace) for brace in closing_braces))
+
+
 def braces_are_matched(s,
                        opening_braces=OPENING_BRACES,
                        closing_braces=CLOSING_BRACES):
@@ -88,13 +100,8 @@ def braces_are_matched(s,
     >>> assert braces_are_matched("") is True
     """
 
-    counter = Counter(s)
-    opening_braces_count = 0
-    closing_braces_count = 0
-    for braces_type in opening_braces:
-        opening_braces_count += counter.get(braces_type, 0)
-    for braces_type in closing_braces:
-        closing_braces_count += counter.get(braces_type, 0)
+    opening_braces_count, closing_braces_count = count_braces(
+        s, opening_braces, closing_braces)
     return opening_braces_count == closing_braces_count
 
 
@@ -109,24 +116,24 @@ class Azazafication(Plugin):
         if status != cmsReceived:
             return
 
-        s = ''.join(message.Body.strip().split())
+        analysis = analyze(message)
+        # Most messages have no braces at all.
+        char_counts = analysis.char_counts
+        if not any(char_counts[brace]
+                   for brace in OPENING_BRACES + CLOSING_BRACES):
+            return
+
+        s = ''.join(analysis.tokens)
         for smile in SKIPPED:
             s = s.replace(smile, "")
 
-        if braces_are_matched(s):
+        opening_braces_count, closing_braces_count = count_braces(s)
+        if opening_braces_count == closing_braces_count:
             return
 
         if random.uniform(0.0, 1.0) >= self.TRIGGER_THRESHOLD:
             return
 
-        counter = Counter(s)
-        opening_braces_count = 0
-        closing_braces_count = 0
-        for opening_brace in OPENING_BRACES:
-            opening_braces_count += counter.get(opening_brace, 0)
-        for closing_brace in CLOSING_BRACES:
-            closing_braces_count += counter.get(closing_brace, 0)
-
         if opening_braces_count > closing_braces_count:
             text = "{0}{1}".format(random.choice(SAD_ANSWERS),
                                    "(" * random.randint(1, 5))
@@ -14,11 +14,10 @@ from __future__ import unicode_literals
 __docformat__ = "restructuredtext en"
 
 
-import atexit
 import datetime
-from threading import Timer
 import random
 import operator
+from functools import partial
 
 from Skype4Py.enums import cmsReceived
 
@@ -26,6 +25,7 @@ from plugin import Plugin
 from output import ChatMessage
 from pluginmanager import chat_is_whitelisted
 from dispatcher import dispatcher
+from scheduler import scheduler
 import signals
 
 
@@ -145,9 +145,6 @@ def str_to_datetime(date_str):
     return dt
 
 
-_timer = None
-
-
 class BirthdayReminder(Plugin):
     """
     >>> import datetime
@@ -184,18 +181,6 @@ class BirthdayReminder(Plugin):
     # Time in seconds.
     CHECK_INTERVAL = 600
 
-    @staticmethod
-    @atexit.register
-    def _cleanup():
-        global _timer
-        try:
-            _timer.cancel()
-            _timer.join()
-        except AttributeError:
-            pass
-        finally:
-            del _timer
-
     def __init__(self, priority=0, whitelist=None, **kwargs):
         super(BirthdayReminder, self).__init__(priority, whitelist, **kwargs)
 
@@ -215,11 +200,10 @@ class BirthdayReminder(Plugin):
 
         self._notified = False
         self._logger.info("Parsed %d date(s)", len(self.dates))
-        self._check_dates()
+        self._job = scheduler.call_every(self.CHECK_INTERVAL,
+                                         self._check_dates)
 
     def _check_dates(self):
-        global _timer
-
         today = datetime.datetime.today()
 
         persons = list()
@@ -234,9 +218,6 @@ class BirthdayReminder(Plugin):
                 self._notified = True
             return
         self._notified = False
-        _timer = Timer(self.CHECK_INTERVAL, self._check_dates)
-        _timer.daemon = True
-        _timer.start()
 
     def _notify_chats(self, names):
         substitutes = {
@@ -245,13 +226,18 @@ class BirthdayReminder(Plugin):
         }
         message = TODAY.format(**substitutes)
         if self.whitelist:
-            # for chat in self.whitelist:
-            #     self.output.append(ChatMessage(chat, message))
-            responses = dispatcher.send(signals.REQUEST_CHATS)
-            chats = responses[0]
-            for chat in chats:
-                if chat_is_whitelisted(chat, self.whitelist):
-                    self.output.append(ChatMessage(chat, message))
+            for future in dispatcher.send_async(signals.REQUEST_CHATS):
+                future.add_done_callback(partial(self._broadcast, message))
+
+    def _broadcast(self, message, future):
+        try:
+            chats = future.result()
+        except Exception:
+            self._logger.exception("Unable to retrieve chats list")
+            return
+        for chat in chats:
+            if chat_is_whitelisted(chat, self.whitelist):
+                self.output.append(ChatMessage(chat, message))
 
     def on_message_status(self, message, status):
         if status != cmsReceived:
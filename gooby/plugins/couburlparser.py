@@ -19,6 +19,7 @@ from lxml.etree import XMLSyntaxError
 
 from Skype4Py.enums import cmsReceived, cmsSent
 
+from cache import NEGATIVE
 from plugin import Plugin
 from utils import retry_on_exception
 from output import ChatMessage
@@ -46,10 +47,13 @@ class CoubURLParser(Plugin):
         >>> plugin.get_video_title(http://coub.com/view/51cf5)
         u'METACHAOS'
         """
-        cached_title = self._cache.get(video_id)
-        if cached_title is not None:
-            return cached_title
+        title = self._cache.get_or_compute(
+            video_id, lambda: self._retrieve_video_title(video_id))
+        if title is NEGATIVE:
+            return None
+        return title
 
+    def _retrieve_video_title(self, video_id):
         url = self._api_url.format(video_id)
 
         @retry_on_exception((urllib2.URLError, urllib2.HTTPError), tries=2,
@@ -62,17 +66,21 @@ class CoubURLParser(Plugin):
             except XMLSyntaxError:
                 return
 
-        xml = retrieve_xml()
+        try:
+            xml = retrieve_xml()
+        except urllib2.URLError as e:
+            self._logger.error("Unable to retrieve {0}: {1}".format(
+                video_id, e))
+            return NEGATIVE
 
         try:
             title = xml.find("title").text
 
         except AttributeError:
-            return None
+            return NEGATIVE
 
         else:
             title = unicode(title)
-            self._cache.set(video_id, title)
             return title
 
     def on_message_status(self, message, status):
@@ -86,19 +94,27 @@ class CoubURLParser(Plugin):
         if not found:
             return
 
-        titles = []
+        self.defer(self.retrieve_titles, message.Chat.Name, message.FromHandle,
+                   found)
 
-        for url in found:
-            video_id = url
+        return message, status
 
-            if video_id is None:
-                continue
+    def retrieve_titles(self, chat_name, handle, video_ids):
+        """Deferred part of :meth:`on_message_status`."""
 
+        titles = []
+
+        found = self.cache.get_or_compute_many(
+            video_ids, self._retrieve_video_title)
+
+        for video_id in video_ids:
             self._logger.info("Retrieving {0} for {1}".format(
-                video_id, message.FromHandle
+                video_id, handle
             ))
 
-            title = self.get_video_title(video_id)
+            title = found.get(video_id)
+            if title is NEGATIVE:
+                title = None
 
             if title is not None:
                 titles.append(title)
@@ -107,7 +123,7 @@ class CoubURLParser(Plugin):
                 titles.append(msg)
 
                 msg = "Unable to retrieve {0} for {1}".format(
-                    video_id, message.FromHandle
+                    video_id, handle
                 )
                 self._logger.error(msg)
 
@@ -118,9 +134,7 @@ class CoubURLParser(Plugin):
             msg = u"[Coub] {0}".format("".join(titles))
         else:
             msg = u"[Coub]\n{0}".format("\n".join(titles))
-        #message.Chat.SendMessage(msg)
-        self.output.append(ChatMessage(message.Chat.Name, msg))
-        return message, status
+        return ChatMessage(chat_name, msg)
 
 
 if __name__ == "__main__":
@@ -88,42 +88,51 @@ class DuplicateURLChecker(Plugin):
         if not found:
             return
 
-        output = []
+        urls = []
 
         for url in found:
             if any(s in url for s in ("youtu.be", "youtube.com")):
                 video_id = get_video_id(url)
                 if video_id is not None:
                     url = "https://www.youtube.com/watch?v={0}".format(video_id)
+            urls.append(url)
+
+        posted = self.cache.get_many(urls)
+
+        entry = (message.FromHandle, message.FromDisplayName, time())
+        for url in urls:
+            if url not in posted:
+                # Atomic, so only the first of concurrent posters is stored.
+                stored = self.cache.get_or_add(url, entry)
+                if tuple(stored) != entry:
+                    posted[url] = stored
+
+        output = []
+
+        for url in urls:
+            try:
+                posted_by, full_name, ts = posted[url]
+            except (KeyError, ValueError):
+                continue
+
+            if posted_by == message.FromHandle:
+                return
+
+            if full_name in message.Body:
+                return
+
+            if posted_by in message.Body:
+                return
+
+            m = "{0} has been originally posted by {1} on {2}".format(
+                chop(url, max_len=15, ending="..."),
+                full_name,
+                datetime.fromtimestamp(ts).strftime("%d.%m.%Y at %X"))
+            output.append(m)
 
-            if url not in self.cache:
-                self.cache[url] = (message.FromHandle,
-                                   message.FromDisplayName,
-                                   time())
-            else:
-                try:
-                    posted_by, full_name, ts = self.cache[url]
-                except (KeyError, ValueError):
-                    pass
-                else:
-                    if posted_by == message.FromHandle:
-                        return
-
-                    if full_name in message.Body:
-                        return
-
-                    if posted_by in message.Body:
-                        return
-
-                    m = "{0} has been originally posted by {1} on {2}".format(
-                        chop(url, max_len=15, ending="..."),
-                        full_name,
-                        datetime.fromtimestamp(ts).strftime("%d.%m.%Y at %X"))
-                    output.append(m)
-
-                    m = "URL dupe by {0}, originally posted by {1}".format(
-                        message.FromHandle, posted_by)
-                    self._logger.info(m)
+            m = "URL dupe by {0}, originally posted by {1}".format(
+                message.FromHandle, posted_by)
+            self._logger.info(m)
 
         if not output:
             return
@@ -23,6 +23,7 @@ from Skype4Py.enums import cmsReceived
 
 from plugin import Plugin
 from output import ChatMessage
+from textanalysis import analyze
 
 
 _regexp = re.compile('s/(\w+)/(\w+)', re.UNICODE | re.IGNORECASE)
@@ -42,10 +43,11 @@ class FakeSed(Plugin):
         if message.Chat.Name not in self._history:
             self._history[message.Chat.Name] = deque(maxlen=self.HISTORY_LENGTH)
 
-        match = re.match(_regexp, message.Body)
+        body = analyze(message).text
+        match = _regexp.match(body)
 
         if not match:
-            self._history[message.Chat.Name].append(message.Body)
+            self._history[message.Chat.Name].append(body)
             return
 
         search, replace = match.groups((1, 2))
@@ -63,7 +65,7 @@ class FakeSed(Plugin):
         if replaced:
             msg = ">>> {0}".format(replaced_str)
         else:
-            m = message.Body.replace(match.group(0), '')
+            m = body.replace(match.group(0), '')
             replaced_str = m.replace(search, replace)
             if m != replaced_str:
                 msg = ">>> {0}".format(m)
@@ -29,11 +29,17 @@ except ImportError:
 import lxml.html
 from Skype4Py.enums import cmsReceived, cmsSent
 
+from cache import NEGATIVE
 from plugin import Plugin
 from utils import retry_on_exception
 from output import ChatMessage
 
 
+# Stored for unresolvable URLs before negative cache entries were
+# introduced.
+LEGACY_SKIP = "#skip#"
+
+
 class GzipHandler(urllib2.BaseHandler):
     """
     A handler that enhances urllib2's capabilities with transparent gzipped
@@ -152,10 +158,13 @@ class GuessThePicture(Plugin):
         'peter griffin gif'
         """
 
-        cached_guess = self._cache.get(image_url)
-        if cached_guess is not None:
-            return cached_guess
+        guess = self._cache.get_or_compute(
+            image_url, lambda: self._retrieve_guess(image_url))
+        if guess is NEGATIVE:
+            return None
+        return guess
 
+    def _retrieve_guess(self, image_url):
         url = self._api_url.format(image_url)
 
         @retry_on_exception((urllib2.URLError, urllib2.HTTPError), tries=2,
@@ -166,18 +175,19 @@ class GuessThePicture(Plugin):
             html_string = reader(response).read()
             return lxml.html.fromstring(html_string)
 
-        html = retrieve_html()
+        try:
+            html = retrieve_html()
+        except urllib2.URLError as e:
+            self._logger.error("Unable to guess {0}: {1}".format(image_url, e))
+            return NEGATIVE
 
         path = ".//div[@class='_hUb']/a[@class='_gUb']"
 
         try:
-            guess = html.find(path).text.strip()
+            return html.find(path).text.strip()
 
         except AttributeError:
-            guess = "#skip#"
-
-        self._cache.set(image_url, guess)
-        return guess
+            return NEGATIVE
 
     def on_message_status(self, message, status):
         if status not in (cmsReceived, cmsSent):
@@ -188,16 +198,27 @@ class GuessThePicture(Plugin):
         if not found:
             return
 
+        self.defer(self.retrieve_guesses, message.Chat.Name,
+                   message.FromHandle, found)
+
+        return message, status
+
+    def retrieve_guesses(self, chat_name, handle, urls):
+        """Deferred part of :meth:`on_message_status`."""
+
         output = []
 
-        for url in found:
-            self._logger.info("Guessing {0} for {1}".format(
-                url, message.FromHandle))
+        cached_guesses = self.cache.get_many(urls)
+
+        for url in urls:
+            self._logger.info("Guessing {0} for {1}".format(url, handle))
 
-            guess = self.guess_the_picture(url)
+            guess = cached_guesses.get(url)
+            if guess is None:
+                guess = self.guess_the_picture(url)
 
-            if guess == "#skip#":
-                msg = "No clue, skipping".format(message.FromHandle)
+            if guess in (None, NEGATIVE, LEGACY_SKIP):
+                msg = "No clue, skipping"
                 self._logger.info(msg)
             else:
                 output.append(guess)
@@ -213,9 +234,7 @@ class GuessThePicture(Plugin):
 
         msg = "^ etot about {0}".format(", ".join(output))
 
-        self.output.append(ChatMessage(message.Chat.Name, msg))
-        #message.Chat.SendMessage(msg)
-        return message, status
+        return ChatMessage(chat_name, msg)
 
 
 if __name__ == "__main__":
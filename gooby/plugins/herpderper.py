@@ -15,12 +15,13 @@ __docformat__ = "restructuredtext en"
 
 
 import random
-import re
 
 from Skype4Py.enums import cmsReceived, cmeEmoted
 
 from plugin import Plugin
 from output import ChatMessage
+from quotes import first_quote, LINUX, MACOSX, WINDOWS
+from textanalysis import analyze
 
 
 def all_same(myiter):
@@ -40,135 +41,6 @@ def all_same(myiter):
     return len(set(myiter)) is 1
 
 
-def parse_linux_quote(message):
-    """
-    >>> message = ur'''
-    ... > [Wednesday, June 26, 2013 1:37:59 PM username derp] a quoted message
-    ...
-    ... some other message.
-    ... '''
-    >>> found = parse_linux_quote(message)
-    >>> assert found is not None
-    >>> assert found.group("quote") == "a quoted message"
-    """
-
-    pattern = re.compile(
-        r"""
-        # Conversation message pattern which matches Linux Skype client message
-        # quotation.
-        >\s\[
-        (?P<datetime>
-            (?P<day>
-                \w+
-            ),\s
-            (?P<month>
-                \w+
-            )\s
-            (?P<date>
-                \d{1,2}
-            ),\s
-            (?P<year>
-                \d{4}
-            )\s
-            (?P<time>
-                \d{1,2}:\d{2}:\d{2}
-            )\s
-            (?P<ampm>
-                \w{2}
-            )
-        )\s
-        (?P<sender>
-            .+
-        )
-        \]\s
-        (?P<quote>
-            .*
-        )\n?
-        (?P<message>
-            .*
-        )\W*
-        """,
-        re.UNICODE | re.VERBOSE)
-
-    return pattern.search(message)
-
-
-def parse_macosx_quote(message):
-    """
-    >>> message = ur'''
-    ... 26.06.13 в 13:37 skypename.derp написал (-а):
-    ... > a quoted message
-    ... some other message.
-    ... '''
-    >>> found = parse_macosx_quote(message)
-    >>> assert found is not None
-    >>> assert found.group("quote") == "a quoted message"
-    """
-
-    pattern = re.compile(
-        r"""
-        # Conversation message pattern which matches Mac OS X Skype client
-        # message quotation.
-        (?P<date>
-            \d{2}\.\d{2}\.\d{2}
-        )\s\w+\s
-        (?P<time>
-            \d{2}:\d{2}
-        )\s
-        # There are no space characters in Skype user names.
-        (?P<sender>
-            [a-zA-Z0-9_\-\.]+
-        )\s.*:\n
-        >\s*
-        (?P<quote>
-            .*
-        )\n*
-        (?P<message>
-            .*
-        )\W*
-        """,
-        re.UNICODE | re.VERBOSE)
-
-    return pattern.search(message)
-
-
-def parse_windows_quote(message):
-    """
-    >>> message = ur'''[1:37:59] username derp: a quoted message
-    ... <<<'''
-    >>> found = parse_windows_quote(message)
-    >>> assert found is not None
-    >>> assert found.group("quote") == "a quoted message"
-    """
-    # FIXME: Does not work with actual client quotes for some reason.
-
-    pattern = re.compile(
-        r"""
-        # Conversation message pattern which matches Windows Skype client
-        # message quotation.
-        \[
-        (?P<time>
-            \d{1,2}:\d{2}:\d{2}
-        )\s*
-        (?P<ampm>
-            \w{2}
-        )?\]\s
-        (?P<sender>
-            .*
-        ):\s
-        (?P<quote>
-            .*
-        )\n*
-        <<<\s*
-        (?P<message>
-            .*
-        )\W*
-        """,
-        re.UNICODE | re.VERBOSE)
-
-    return pattern.search(message)
-
-
 def message_is_quoted(message):
     """
     >>> # Windows client.
@@ -196,13 +68,7 @@ def message_is_quoted(message):
     >>> assert message_is_quoted(message) is True
     """
 
-    if parse_macosx_quote(message) is not None:
-        return True
-    if parse_linux_quote(message) is not None:
-        return True
-    if parse_windows_quote(message) is not None:
-        return True
-    return False
+    return first_quote(message, (MACOSX, LINUX, WINDOWS)) is not None
 
 
 class HerpDerper(Plugin):
@@ -223,15 +89,17 @@ class HerpDerper(Plugin):
         if status != cmsReceived or message.Type == cmeEmoted:
             return
 
-        if not any(t.lower() in message.Body.lower() for t in self._triggers):
+        analysis = analyze(message)
+        # Triggers are lowercase already.
+        if not any(t in analysis.lower for t in self._triggers):
             return
 
-        if message_is_quoted(message.Body):
+        if message_is_quoted(analysis.text):
             return
 
         msg = []
 
-        if "?" in message.Body:
+        if "?" in analysis.text:
             msg = random.choice(["да", "нет", 'Да.', 'Нет.', 'Да', 'Нет',
                                  'да.', 'нет.'])
             self.output.append(ChatMessage(message.Chat.Name, msg))
@@ -248,12 +116,7 @@ class HerpDerper(Plugin):
         if len(words) is max_words and all_same(words):
             self._logger.info("Jackpot winner {0}".format(message.FromHandle))
 
-            try:
-                wins = int(self._cache.get(message.FromHandle))
-            except TypeError:
-                wins = 0
-            wins += 1
-            self._cache.set(message.FromHandle, wins)
+            wins = self._cache.incr(message.FromHandle)
 
             msg.append("{0} wins the jackpot! {1} in total".format(
                 message.FromDisplayName, wins
@@ -23,6 +23,7 @@ import re
 import lxml.html
 from Skype4Py.enums import cmsReceived, cmsSent
 
+from cache import memoize
 from plugin import Plugin
 from utils import retry_on_exception
 from output import ChatMessage
@@ -54,6 +55,8 @@ class IMDbURLParser(Plugin):
     _opener = urllib2.build_opener()
     _opener.addheaders = [(k, v) for k, v in _headers.iteritems()]
 
+    # Keys are movie IDs as they are.
+    @memoize(namespace="")
     def get_movie_title(self, movie_id):
         """
         >>> plugin = IMDbURLParser()
@@ -66,29 +69,28 @@ class IMDbURLParser(Plugin):
         >>> assert "tt0101420" in plugin.cache
         """
 
-        @self.cache.get_cached(movie_id)
-        def _do_get_movie_title():
-            url = self._api_url.format(movie_id)
+        return self._retrieve_movie_title(movie_id)
 
-            @retry_on_exception((urllib2.URLError, urllib2.HTTPError), tries=2,
-                                backoff=0, delay=1)
-            def retrieve_html():
-                response = self._opener.open(url)
-                buf = response.read(4096)
-                return lxml.html.fromstring(buf)
+    def _retrieve_movie_title(self, movie_id):
+        url = self._api_url.format(movie_id)
 
-            html = retrieve_html()
+        @retry_on_exception((urllib2.URLError, urllib2.HTTPError), tries=2,
+                            backoff=0, delay=1)
+        def retrieve_html():
+            response = self._opener.open(url)
+            buf = response.read(4096)
+            return lxml.html.fromstring(buf)
 
-            try:
-                title = u"{0}".format(html.find(".//title").text[:-7])
+        html = retrieve_html()
 
-            except AttributeError:
-                return None
+        try:
+            title = u"{0}".format(html.find(".//title").text[:-7])
 
-            else:
-                return title
+        except AttributeError:
+            return None
 
-        return _do_get_movie_title()
+        else:
+            return title
 
     def on_message_status(self, message, status):
         if status not in (cmsReceived, cmsSent):
@@ -101,13 +103,24 @@ class IMDbURLParser(Plugin):
         if not found:
             return
 
+        self.defer(self.retrieve_titles, message.Chat.Name, message.FromHandle,
+                   found)
+
+        return message, status
+
+    def retrieve_titles(self, chat_name, handle, movie_ids):
+        """Deferred part of :meth:`on_message_status`."""
+
         titles = []
 
-        for movie_id in found:
-            msg = "Retrieving {0} for {1}".format(movie_id, message.FromHandle)
+        found = self.cache.get_or_compute_many(
+            movie_ids, self._retrieve_movie_title)
+
+        for movie_id in movie_ids:
+            msg = "Retrieving {0} for {1}".format(movie_id, handle)
             self._logger.info(msg)
 
-            title = self.get_movie_title(movie_id)
+            title = found.get(movie_id)
 
             if title is not None:
                 titles.append(title)
@@ -116,7 +129,7 @@ class IMDbURLParser(Plugin):
                 titles.append(msg)
 
                 msg = "Unable to retrieve {0} for {1}".format(
-                    movie_id, message.FromHandle
+                    movie_id, handle
                 )
                 self._logger.error(msg)
 
@@ -127,9 +140,7 @@ class IMDbURLParser(Plugin):
             msg = u"[IMDb] {0}".format("".join(titles))
         else:
             msg = u"[IMDb]\n{0}".format("\n".join(titles))
-        self.output.append(ChatMessage(message.Chat.Name, msg))
-        #message.Chat.SendMessage(msg)
-        return message, status
+        return ChatMessage(chat_name, msg)
 
 if __name__ == "__main__":
     import doctest
@@ -29,10 +29,16 @@ except ImportError:
 import lxml.html
 from Skype4Py.enums import cmsReceived, cmsSent
 
+from cache import NEGATIVE
 from plugin import Plugin
 from output import ChatMessage
 
 
+# Stored for unresolvable URLs before negative cache entries were
+# introduced.
+LEGACY_SKIP = "#skip#"
+
+
 _p = re.compile(
     r"""
     (?P<url>
@@ -142,10 +148,13 @@ class LentaURLParser(Plugin):
     _opener.add_handler(LentaHeaderHandler())
 
     def get_article_title(self, lenta_url):
-        cached_title = self._cache.get(lenta_url)
-        if cached_title is not None:
-            return cached_title
+        title = self._cache.get_or_compute(
+            lenta_url, lambda: self._retrieve_article_title(lenta_url))
+        if title is NEGATIVE:
+            return None
+        return title
 
+    def _retrieve_article_title(self, lenta_url):
         response = self._opener.open(lenta_url)
         reader = codecs.getreader("utf-8")
         html_string = reader(response).read()
@@ -153,12 +162,9 @@ class LentaURLParser(Plugin):
 
         path = ".//h1[@class='b-topic__title']"
         try:
-            title = html.find(path).text.strip()
+            return html.find(path).text.strip()
         except AttributeError:
-            title = "#skip#"
-
-        self._cache.set(lenta_url, title)
-        return title
+            return NEGATIVE
 
     def on_message_status(self, message, status):
         if status not in (cmsReceived, cmsSent):
@@ -172,16 +178,28 @@ class LentaURLParser(Plugin):
         if not found:
             return
 
+        self.defer(self.retrieve_titles, message.Chat.Name, message.FromHandle,
+                   found)
+
+        return message, status
+
+    def retrieve_titles(self, chat_name, handle, urls):
+        """Deferred part of :meth:`on_message_status`."""
+
         titles = []
 
-        for url in found:
-            self._logger.info("Resolving {0} for {1}".format(
-                url, message.FromHandle))
+        found = self.cache.get_or_compute_many(
+            urls, self._retrieve_article_title)
 
-            title = self.get_article_title(url)
+        for url in urls:
+            self._logger.info("Resolving {0} for {1}".format(url, handle))
 
-            if title == "#skip#":
-                msg = "No clue, skipping".format(message.FromHandle)
+            title = found.get(url)
+            if title is NEGATIVE:
+                title = None
+
+            if title in (None, LEGACY_SKIP):
+                msg = "No clue, skipping"
                 self._logger.info(msg)
             else:
                 titles.append(title)
@@ -194,8 +212,7 @@ class LentaURLParser(Plugin):
             msg = "[Lenta] {0}".format("".join(titles))
         else:
             msg = "[Lenta]\n{0}".format("\n".join(titles))
-        self.output.append(ChatMessage(message.Chat.Name, msg))
-        return message, status
+        return ChatMessage(chat_name, msg)
 
 
 if __name__ == "__main__":
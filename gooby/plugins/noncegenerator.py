@@ -14,7 +14,6 @@ from __future__ import unicode_literals
 __docformat__ = "restructuredtext en"
 
 
-from string import punctuation
 from collections import OrderedDict, deque
 from random import choice, shuffle, uniform
 from math import ceil
@@ -23,9 +22,7 @@ from Skype4Py.enums import cmsReceived, cmeEmoted
 
 from plugin import Plugin
 from output import ChatMessage
-
-
-VOWELS = u"аеёиоуыэюя"
+from textanalysis import TextAnalysis, analyze, VOWELS
 
 SUBSTITUTES = {
     u"а": u"хуя",
@@ -64,6 +61,10 @@ EXTRA_WORDS = [
     u"здело",
 ]
 
+# No extra word is a prefix of another one, so a word starts with one of
+# them at most.
+EXTRA_PREFIXES = tuple(word.lower() for word in EXTRA_WORDS)
+
 TEMPLATES_SIMPLE = [
     u"{nonce_word}",
     u"{word}-{nonce_word}",
@@ -84,11 +85,6 @@ TEMPLATES_NONCE_ONLY = [
 ]
 
 
-def _translate(s, characters, translate_to=u" "):
-    translation_table = dict((ord(char), translate_to) for char in characters)
-    return s.translate(translation_table)
-
-
 def find_first_vowel_index(word):
     """
     >>> assert find_first_vowel_index("учёт") is 2
@@ -116,22 +112,22 @@ def find_first_vowel_index(word):
     return index - 1 if found else None
 
 
-def word_is_eligible(word, vowel_threshold=2):
+def word_is_eligible(word, vowel_threshold=2, vowel_count=None):
     """
     >>> assert word_is_eligible("учёт", 2) is True
 
     >>> assert word_is_eligible("откос", 2) is True
 
     >>> assert word_is_eligible("молоко", 4) is False
+
+    >>> assert word_is_eligible("молоко", 4, vowel_count=4) is True
     """
 
     if any(sub.lower() in word.lower() for sub in SUBSTITUTES.itervalues()):
         return False
 
-    vowel_count = 0
-
-    for vowel in VOWELS.lower():
-        vowel_count += word.lower().count(vowel.lower())
+    if vowel_count is None:
+        vowel_count = count_vowels(word)
 
     return vowel_count >= vowel_threshold
 
@@ -200,8 +196,12 @@ def generate_nonce_phrase(phrase,
                           templates_simple=TEMPLATES_SIMPLE,
                           templates_composite=TEMPLATES_COMPOSITE,
                           templates_nonce_only=TEMPLATES_NONCE_ONLY,
-                          preserve_case=True):
+                          preserve_case=True,
+                          analysis=None):
     """
+    :param analysis: :class:`~textanalysis.TextAnalysis` of the phrase, if
+        there is one already
+
     >>> templates_simple = ["{word}-{nonce_word}"]
     >>> templates_composite = ["{word}-{nonce_word}"]
     >>> templates_nonce_only = ["test"]
@@ -241,25 +241,26 @@ def generate_nonce_phrase(phrase,
 
     assert 0 <= nonce_quantity <= 1.0
 
+    if analysis is None:
+        analysis = TextAnalysis(phrase)
+
     substitutes = OrderedDict()
-    words = phrase.split()
+    vowel_counts = analysis.vowel_counts
 
-    if len(words) is 1:
+    if len(analysis.tokens) is 1:
         templates = templates_composite
     else:
         templates = templates_simple
 
-    for word in words:
-        w = word.strip(u"{0}{1}".format(u"—", punctuation))
-        word_parts = _translate(w, punctuation).split()
-
+    for word_parts in analysis.parts:
         if len(word_parts) > 1:
             templates = templates_nonce_only
 
         for part in word_parts:
             if len(part) is 1:
                 continue
-            if not word_is_eligible(part) and part.lower() not in extra_words:
+            if (not word_is_eligible(part, vowel_count=vowel_counts[part]) and
+                    part.lower() not in extra_words):
                 continue
             nonce_word = generate_nonce_word(part, preserve_case=preserve_case)
             template = choice(templates)
@@ -279,7 +280,7 @@ def count_vowels(word):
     >>> assert count_vowels("проверка") is 3
     """
 
-    return len([char for char in word if char.lower() in VOWELS])
+    return sum(1 for char in word.lower() if char in VOWELS)
 
 
 class NonceGenerator(Plugin):
@@ -331,15 +332,14 @@ class NonceGenerator(Plugin):
         if message.FromHandle not in self._quotas:
             self._quotas[message.FromHandle] = list()
 
+        analysis = analyze(message)
+
         # Algorithm which only triggers on certain keywords.
-        if any(word.lower() in message.Body.lower() for word in EXTRA_WORDS):
-            words = message.Body.split()
-            for word in words:
-                word = word.strip(u"{0}{1}".format(u"—", punctuation))
-                for keyword in EXTRA_WORDS:
-                    if word.lower().startswith(keyword.lower()):
-                        if uniform(0.0, 1.0) <= self.EXTRA_TRIGGER_THRESHOLD:
-                            _output.append(generate_nonce_phrase(word))
+        if any(word in analysis.lower for word in EXTRA_PREFIXES):
+            for word in analysis.stripped_tokens:
+                if word.lower().startswith(EXTRA_PREFIXES):
+                    if uniform(0.0, 1.0) <= self.EXTRA_TRIGGER_THRESHOLD:
+                        _output.append(generate_nonce_phrase(word))
 
         # Quota algorithm.
         # Triggers on several subsequent messages are being sent by the same
@@ -359,17 +359,18 @@ class NonceGenerator(Plugin):
                 self._quotas[message.FromHandle] = [message.Timestamp]
 
         if quota_is_reached:
-            result = generate_nonce_phrase(message.Body)
-            if message.Body.lower() != result.lower():
+            result = generate_nonce_phrase(analysis.text, analysis=analysis)
+            if analysis.lower != result.lower():
                 _output.append(result)
 
         # Algorithm which triggers randomly if nothing else has been
         # triggered before.
         if not _output:
             if uniform(0.0, 1.0) <= self.TRIGGER_THRESHOLD:
-                result = generate_nonce_phrase(phrase=message.Body,
-                                               nonce_quantity=uniform(0.1, 0.9))
-                if message.Body.lower() != result.lower():
+                result = generate_nonce_phrase(phrase=analysis.text,
+                                               nonce_quantity=uniform(0.1, 0.9),
+                                               analysis=analysis)
+                if analysis.lower != result.lower():
                     _output.append(result)
 
         msg = list()
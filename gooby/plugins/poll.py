@@ -18,9 +18,9 @@ __docformat__ = "restructuredtext en"
 
 
 import re
-from threading import Timer
 
 from plugin import ChatCommandPlugin
+from scheduler import scheduler
 
 
 class Poll(ChatCommandPlugin):
@@ -41,6 +41,7 @@ class Poll(ChatCommandPlugin):
             line = u"Poll has ended. Results for '%s' by %s\nyes: %d | no: %d"
             chat.SendMessage(line % (poll.get("subject"), poll.get("owner"),
                                      yes_count, no_count))
+            poll.get("job").cancel()
             del self._polls[chat_name]
 
     def on_poll_command(self, message):
@@ -78,16 +79,14 @@ class Poll(ChatCommandPlugin):
                 chat.SendMessage("Poll is already running")
                 return
 
-            thread = Timer(vote_time * 60, self.stop_poll, args=(chat,))
+            job = scheduler.call_later(vote_time * 60, self.stop_poll, chat)
             poll = {
                 "voters": {},
                 "owner": message.FromHandle,
                 "subject": match.group(3),
-                "thread": thread,
+                "job": job,
                 }
 
-            thread.daemon = True
-            thread.start()
             self._polls.update({chat_name: poll})
             line = (u"%s has started a new poll for next %d minute(s):\n'%s'\n"
                     "Type '!vote yes' or '!vote no' to participate")
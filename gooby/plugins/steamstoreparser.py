@@ -113,11 +113,18 @@ class SteamStoreParser(Plugin):
         if not found:
             return
 
-        output = []
-
         self._logger.info("Retrieving {0} for {1}".format(", ".join(found),
                                                           message.FromHandle))
-        for app_info in self.retrieve_app_info(found):
+        self.defer(self.format_app_info, message.Chat.Name, found)
+
+        return message, status
+
+    def format_app_info(self, chat_name, app_ids):
+        """Deferred part of :meth:`on_message_status`."""
+
+        output = []
+
+        for app_info in self.retrieve_app_info(app_ids):
             if app_info is None:
                 continue
 
@@ -161,8 +168,7 @@ class SteamStoreParser(Plugin):
         else:
             msg = u"Steam ->\n{0}".format('\n'.join(output))
 
-        self.output.append(ChatMessage(message.Chat.Name, msg))
-        return message, status
+        return ChatMessage(chat_name, msg)
 
 
 if __name__ == '__main__':
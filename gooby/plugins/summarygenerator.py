@@ -15,12 +15,21 @@ __docformat__ = "restructuredtext en"
 
 
 import os
+import bisect
+import hashlib
+import json
+import logging
+import mmap
 import random
 import string
+import struct
 import re
+from array import array
 from collections import deque
-from datetime import datetime, timedelta
+from itertools import izip
+from datetime import timedelta
 from time import time
+from timeit import default_timer
 
 from Skype4Py.enums import cmsReceived
 
@@ -28,90 +37,33 @@ from plugin import Plugin
 from output import ChatMessage
 from config import CACHE_DIR
 from cache_new import from_dict
-from plugins.herpderper import (
-    parse_linux_quote, parse_macosx_quote, parse_windows_quote
+from messagelog import MessageLog
+from textanalysis import analyze
+from quotes import (
+    parse_quotes, first_quote,
+    LINUX, MACOSX, WINDOWS, ANDROID, WINDOWS_MULTIPLE,
 )
 
 
-def parse_android_quote(message):
-    """
-    >>> message = ur'''
-    ... some skype name - Сегодня 6:19
-    ... > A Quoted message.
-    ... some answer
-    ... '''
-    >>> match = parse_android_quote(message)
-    >>> match.group('quote')
-    u'A Quoted message.'
-    >>> match.group('message')
-    u'some answer'
-    """
-    pattern = re.compile(
-        r"""
-        (?P<sender>
-            .*
-        )\s\-\s
-        (?P<date>
-            .*
-        )\s
-        (?P<time>
-            \d{1,2}:\d{1,2}
-        )\n
-        >\s*
-        (?P<quote>
-            .*
-        )\n*
-        (?P<message>
-            .*
-        )
-        """,
-        re.VERBOSE | re.UNICODE | re.MULTILINE
-    )
-
-    return pattern.search(message)
-
-
-def parse_windows_multiple_quote(message):
-    """
-    >>> message = ur'''[06.08.2015 12:30:27] some derp: le message >> Kappa
-    ... [06.08.2015 12:32:51] othername.derp: Asdf?'''
-    >>> messages = parse_windows_multiple_quote(message)
-    >>> messages
-    [u'le message >> Kappa', u'Asdf?']
-    >>> messages = parse_windows_multiple_quote('')
-    >>> messages
-    []
-    """
-    pattern = re.compile(
-        r"""
-        \[
-        (?P<date>
-            \d{2}\.\d{2}\.\d{4}
-        )\s
-        (?P<time>
-            \d{2}:\d{2}:\d{2}
-        )
-        \]\s
-        (?P<sender>
-            .+
-        ):\s
-        (?P<message>
-            .*
-        )\s*
-        """,
-        re.VERBOSE | re.UNICODE | re.MULTILINE
-    )
+URL_SUBSTRINGS = ('http', 'ftp', 'www', 'mailto')
 
-    try:
-        return [m.groupdict().get('message') for m in pattern.finditer(message)]
-    except AttributeError:
-        pass
-    return []
+TIMESTAMP_PATTERN = re.compile(
+    ur'(\[\d{1,2}:\d{1,2}:\d{2}(?:\s\w{2})?\]\s*)')
+
+WORD_PATTERN = re.compile(r'\w+', re.U)
+
+DOT_SPLIT_PATTERN = re.compile(ur'(\.)')
+
+NORMALIZER_REPLACEMENTS = {
+    '. _.': ' ._.',
+}
 
 
 def url_filter(word, *args, **kwargs):
-    crap = ('http', 'ftp', 'www', 'mailto')
-    return '' if any(substring in word.lower() for substring in crap) else word
+    lowercased = word.lower()
+    if any(substring in lowercased for substring in URL_SUBSTRINGS):
+        return ''
+    return word
 
 
 def timestamp_filter(word, *args, **kwargs):
@@ -123,8 +75,7 @@ def timestamp_filter(word, *args, **kwargs):
     >>> timestamp_filter(u'[4:14:19 PM] 3')
     u'3'
     """
-    pattern = re.compile(ur'(\[\d{1,2}:\d{1,2}:\d{2}(?:\s\w{2})?\]\s*)')
-    return pattern.sub('', word)
+    return TIMESTAMP_PATTERN.sub('', word)
 
 
 def quotation_filter(word, *args, **kwargs):
@@ -151,11 +102,8 @@ def sentence_normalizer(sentence, *args, **kwargs):
     >>> print sentence_normalizer('asdf ._.')
     Asdf ._.
     """
-    replacements = {
-        '. _.': ' ._.',
-    }
-    pattern = re.compile(r'\w+', re.U)
-    sentences = [word.strip() for word in re.split(ur'(\.)', sentence) if word]
+    sentences = [word.strip() for word in DOT_SPLIT_PATTERN.split(sentence)
+                 if word]
     ending = '.'
 
     output = []
@@ -175,29 +123,39 @@ def sentence_normalizer(sentence, *args, **kwargs):
         if not output[i].endswith(tuple(string.punctuation)):
             output[i] += ending
 
-    if not pattern.match(' '.join(output)):
+    if not WORD_PATTERN.match(' '.join(output)):
         return ''
 
     if not filter(None, ' '.join(output).split(ending)):
         return ''
 
     output = ' '.join(output)
-    for old, new in replacements.iteritems():
+    for old, new in NORMALIZER_REPLACEMENTS.iteritems():
         output = output.replace(old, new)
 
     return output
 
 
 def sentence_quote_filter(sentence, *args, **kwargs):
-    for func in (parse_windows_quote, parse_linux_quote, parse_macosx_quote,
-                 parse_android_quote):
-        match = func(sentence)
-        if match is not None:
-            try:
-                return match.group('message')
-            except AttributeError:
-                pass
-    messages = parse_windows_multiple_quote(sentence)
+    """
+    >>> sentence_quote_filter(u'''
+    ... some skype name - Сегодня 6:19
+    ... > A Quoted message.
+    ... some answer
+    ... ''')
+    u'some answer'
+    >>> sentence = u'''[06.08.2015 12:30:27] some derp: le message >> Kappa
+    ... [06.08.2015 12:32:51] othername.derp: Asdf?'''
+    >>> sentence_quote_filter(sentence)
+    u'le message >> Kappa Asdf?'
+    >>> sentence_quote_filter(u'herp derp')
+    u'herp derp'
+    """
+    quote = first_quote(sentence, (WINDOWS, LINUX, MACOSX, ANDROID))
+    if quote is not None:
+        return quote.message
+    messages = [q.message for q in parse_quotes(sentence)
+                if q.client == WINDOWS_MULTIPLE]
     if messages:
         return ' '.join(messages)
     return sentence
@@ -227,86 +185,585 @@ WORD_FILTERS = (url_filter, timestamp_filter, quotation_filter, )
 SENTENCE_POSTFILTERS = (sentence_normalizer, sentence_min_length_limiter, )
 
 
-class MarkovChain(object):
+class TextPipeline(object):
     """
-    >>> mc = MarkovChain.from_textfile('D:/Projects/Miscellaneous/the_golem_-_intro.txt')
-    >>> mc.generate_sentences(sentences_count=3)
+    Normalizes message text: applies sentence prefilters, then every word
+    filter to each word in a single pass, then sentence postfilters. Word
+    filters must return a single word, or an empty string to drop it.
+
+    Time spent in every stage is accumulated in :attr:`timings`.
+
+    >>> pipeline = TextPipeline()
+    >>> print pipeline(u'[04:14:19] чот рофл http://derp.com >>> ходил')
+    Чот рофл ходил.
+    >>> pipeline.count, sorted(pipeline.timings)
+    (1, [u'postfilters', u'prefilters', u'word_filters'])
+    """
+
+    def __init__(self, prefilters=SENTENCE_PREFILTERS,
+                 word_filters=WORD_FILTERS, postfilters=SENTENCE_POSTFILTERS):
+        self._prefilters = tuple(prefilters)
+        self._word_filters = tuple(word_filters)
+        self._postfilters = tuple(postfilters)
+        self.reset_timings()
+
+    def reset_timings(self):
+        self.count = 0
+        self.timings = {
+            'prefilters': 0.0,
+            'word_filters': 0.0,
+            'postfilters': 0.0,
+        }
+
+    def format_timings(self):
+        count = self.count or 1
+        return "{0} messages, {1} ms per message".format(self.count, ", ".join(
+            "{0} {1:.3f}".format(stage, self.timings[stage] * 1000 / count)
+            for stage in ('prefilters', 'word_filters', 'postfilters')))
+
+    def __call__(self, text, **kwargs):
+        """
+        :param kwargs: sentence prefilters keyword arguments, e.g.
+            ``chat_members``
+
+        :returns: normalized text, empty if nothing is left
+        :rtype: `unicode`
+        """
+        started = default_timer()
+        for f in self._prefilters:
+            text = f(text, **kwargs)
+        prefiltered = default_timer()
+
+        words = list()
+        for word in text.split():
+            for f in self._word_filters:
+                word = f(word)
+                if not word:
+                    break
+            else:
+                words.append(word)
+        text = ' '.join(words)
+        filtered = default_timer()
+
+        for f in self._postfilters:
+            text = f(text)
+        finished = default_timer()
+
+        timings = self.timings
+        timings['prefilters'] += prefiltered - started
+        timings['word_filters'] += filtered - prefiltered
+        timings['postfilters'] += finished - filtered
+        self.count += 1
+        return text
+
+
+log = logging.getLogger("Gooby.Plugin.SummaryGenerator")
+
+# Saved chain file signature and format version.
+CHAIN_MAGIC = b'GMCH'
+
+CHAIN_VERSION = 2
+
+# Saved chain header: signature, format version, chain order, number of
+# words, size of encoded words, number of states, number of transitions,
+# number of sentence starting states and size of metadata. Integers are
+# stored in native byte order.
+CHAIN_HEADER = struct.Struct(b'=4s8i')
+
+# Word ids are packed into a single integer state key, ID_BITS per word.
+ID_BITS = 31
+
+ID_MASK = (1 << ID_BITS) - 1
+
+# Successor word id and its count packed into a single integer.
+COUNT_BITS = 32
+
+COUNT_MASK = (1 << COUNT_BITS) - 1
+
+
+def _padding(size):
+    # Sections of a saved chain are aligned to 4 bytes.
+    return -size % 4
+
+
+def read_chain_header(data):
+    """
+    Parses the header of a chain saved by :meth:`MarkovChain.dump`.
+
+    :param data: saved chain
+    :type data: `str` or :class:`mmap.mmap`
+
+    :returns: chain order, metadata and ``(offset, length)`` of every
+        section by its name
+    :rtype: `tuple`
+
+    :raises: `ValueError` if the chain is truncated or corrupt
+    """
+    if len(data) < CHAIN_HEADER.size:
+        raise ValueError("Saved Markov chain is truncated")
+    header = CHAIN_HEADER.unpack_from(data)
+    (magic, version, order, words_count, words_size, states_count,
+     transitions_count, starts_count, meta_size) = header
+    if magic != CHAIN_MAGIC:
+        raise ValueError("Not a saved Markov chain")
+    if version != CHAIN_VERSION:
+        raise ValueError("Unsupported chain version: {0}".format(version))
+    if order < 1 or min(header[3:]) < 0:
+        raise ValueError("Saved Markov chain is corrupt")
+    offset = CHAIN_HEADER.size
+    meta = json.loads(data[offset:offset + meta_size])
+    offset += meta_size + _padding(meta_size)
+    sections = dict()
+    for name, item_size, length in (
+            ('word_offsets', 4, words_count + 1),
+            ('words', 1, words_size),
+            ('states', 4, states_count * order),
+            ('state_offsets', 4, states_count + 1),
+            ('successors', 4, transitions_count),
+            ('weights', 4, transitions_count),
+            ('next_states', 4, transitions_count),
+            ('starts', 4, starts_count)):
+        sections[name] = (offset, length)
+        size = item_size * length
+        offset += size + _padding(size)
+    if offset > len(data):
+        raise ValueError("Saved Markov chain is truncated")
+    return order, meta, sections
+
+
+class BaseMarkovChain(object):
+    """
+    Sentence generator. Subclasses define how states, i.e. sequences of
+    `order` words, and transitions between them are stored.
     """
     ENDING_CHARACTERS = ('!', '?', '.')
     RUSSIAN_ALPHABET = u'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'
     ENGLISH_ALPHABET = string.lowercase
     ALPHABETIC = RUSSIAN_ALPHABET + ENGLISH_ALPHABET
 
-    def __init__(self, order=1):
+    def __init__(self, order=2):
         self._order = order
-        self._db = dict()
-        self._order = 2
-        self._used_first_keys = list()
+        # Stored along with a saved chain.
+        self.meta = dict()
 
-    def generate_db(self, words):
-        for i, word in enumerate(words[:-(self._order + 1)]):
-            value_pos = i + self._order
-            key = tuple(words[i:i + self._order])
-            values = self._db.setdefault(key, list())
-            value = words[value_pos]
-            values.append(value)
-
-    def _find_first_key(self):
-        possible_keys = []
-        for key in self._db.iterkeys():
-            first_word = key[0]
-            last_word = key[-1]
-            if key in self._used_first_keys:
-                continue
-            if not first_word.lower().startswith(tuple(self.ALPHABETIC)):
-                continue
-            if first_word.endswith(tuple(string.punctuation)):
-                continue
-            if first_word.startswith(tuple(string.punctuation)):
-                continue
-            if last_word.endswith(tuple(string.punctuation)):
-                continue
-            if first_word.istitle():
-                possible_keys.append(key)
-        if not possible_keys:
-            possible_keys.extend(self._db.keys())
-        first_key = random.choice(possible_keys)
-        self._used_first_keys.append(first_key)
-        return first_key
-
-    def generate_sentence(self, max_len=8):
-        key = self._find_first_key()
+    def __len__(self):
+        raise NotImplementedError
+
+    @property
+    def order(self):
+        return self._order
+
+    @classmethod
+    def is_first_key(cls, words):
+        """
+        Tells whether a sentence may start with the given state words.
+
+        >>> MarkovChain.is_first_key([u'Herp', u'derp'])
+        True
+        >>> MarkovChain.is_first_key([u'Herp', u'derp.'])
+        False
+        """
+        first_word = words[0]
+        last_word = words[-1]
+        if not first_word.lower().startswith(tuple(cls.ALPHABETIC)):
+            return False
+        if first_word.endswith(tuple(string.punctuation)):
+            return False
+        if first_word.startswith(tuple(string.punctuation)):
+            return False
+        if last_word.endswith(tuple(string.punctuation)):
+            return False
+        return first_word.istitle()
+
+    def _sample_first_keys(self, count):
+        """
+        Draws `count` distinct states satisfying :meth:`is_first_key`, or
+        any states if there are not enough of those.
+        """
+        raise NotImplementedError
+
+    def _state_words(self, state):
+        raise NotImplementedError
+
+    def _transitions(self, state):
+        """
+        :returns: successor word ids and their counts
+        :rtype: `tuple`
+        """
+        raise NotImplementedError
+
+    def _step(self, state):
+        """
+        Draws a successor of a state.
+
+        :returns: successor word id and the following state, `None` if
+            the state has no successors
+        """
+        raise NotImplementedError
+
+    def _word(self, word_id):
+        raise NotImplementedError
+
+    def _find_state(self, words):
+        raise NotImplementedError
+
+    def successors(self, words):
+        """
+        :param words: `order` words
+        :type words: `list`
+
+        :returns: words following the given ones and their counts
+        :rtype: `dict`
+        """
+        state = self._find_state(words)
+        if state is None:
+            return dict()
+        word_ids, counts = self._transitions(state)
+        return dict((self._word(word_id), count)
+                    for word_id, count in izip(word_ids, counts))
+
+    def generate_sentence(self, max_len=8, first_key=None):
+        key = first_key
+        if key is None:
+            key = self._sample_first_keys(1)[0]
         words = list()
-        words.append(key[0])
-        while 1:
-            possible_words = self._db.get(key)
-            if not possible_words:
+        words.append(self._state_words(key)[0])
+        while key is not None:
+            step = self._step(key)
+            if step is None:
                 break
-            word = random.choice(list(possible_words))
+            word_id, key = step
+            word = self._word(word_id)
             words.append(word)
             if word.endswith(self.ENDING_CHARACTERS) and len(words) > max_len:
                 break
-            key = key[1:] + (word, )
         return ' '.join(words)
 
     def generate_sentences(self, sentences_count=3, max_word_per_sentence=24):
+        # Starting states of every sentence are drawn at once.
         sentences = []
-        for _ in xrange(sentences_count):
-            sentence = self.generate_sentence()
+        for key in self._sample_first_keys(sentences_count):
+            sentence = self.generate_sentence(first_key=key)
             sentences.append(sentence)
             if len(sentence.split()) > max_word_per_sentence:
                 break
         return sentences
 
+
+class MarkovChain(BaseMarkovChain):
+    """
+    Words are stored once in a vocabulary and referred to by integer ids.
+    Every state maps to a single array of successor ids interleaved with
+    their counts, or to a single packed integer if only one word follows
+    the state, which is the case for most of them. States which may start
+    a sentence are indexed as they are added.
+
+    Meant for building and updating chains. Successors are sampled by
+    scanning their counts, saved chains are sampled by
+    :class:`MappedMarkovChain` using weights precomputed by :meth:`dump`.
+
+    >>> mc = MarkovChain.from_textfile('D:/Projects/Miscellaneous/the_golem_-_intro.txt')
+    >>> mc.generate_sentences(sentences_count=3)
+    """
+
+    def __init__(self, order=1):
+        super(MarkovChain, self).__init__(order)
+        self._order = 2
+        # Word ids are indexes of the vocabulary list.
+        self._words = list()
+        self._ids = dict()
+        # Maps packed word ids of states to successor arrays.
+        self._db = dict()
+        self._state_mask = (1 << ID_BITS * self._order) - 1
+        # States satisfying is_first_key() and their positions in the list.
+        self._first_keys = list()
+        self._first_key_positions = dict()
+
+    def __len__(self):
+        return len(self._db)
+
+    def _word_id(self, word):
+        word_id = self._ids.get(word)
+        if word_id is None:
+            word_id = self._ids[word] = len(self._words)
+            self._words.append(word)
+        return word_id
+
+    @staticmethod
+    def _pack(word_ids):
+        state = 0
+        for word_id in word_ids:
+            state = state << ID_BITS | word_id
+        return state
+
+    def _unpack(self, state):
+        return tuple(state >> ID_BITS * i & ID_MASK
+                     for i in xrange(self._order - 1, -1, -1))
+
+    def _add_state(self, state, successors):
+        self._db[state] = successors
+        if self.is_first_key(self._state_words(state)):
+            self._first_key_positions[state] = len(self._first_keys)
+            self._first_keys.append(state)
+
+    def _remove_state(self, state):
+        del self._db[state]
+        position = self._first_key_positions.pop(state, None)
+        if position is None:
+            return
+        last = self._first_keys.pop()
+        if last != state:
+            self._first_keys[position] = last
+            self._first_key_positions[last] = position
+
+    def _sample_first_keys(self, count):
+        keys = random.sample(self._first_keys,
+                             min(count, len(self._first_keys)))
+        if len(keys) < count:
+            states = list(self._db)
+            keys.extend(random.choice(states)
+                        for _ in xrange(count - len(keys)))
+        return keys
+
+    def _state_words(self, state):
+        return tuple(self._words[word_id] for word_id in self._unpack(state))
+
+    def _transitions(self, state):
+        successors = self._db.get(state)
+        if successors is None:
+            return (), ()
+        if isinstance(successors, array):
+            return successors[::2], successors[1::2]
+        return (successors >> COUNT_BITS, ), (successors & COUNT_MASK, )
+
+    def _step(self, state):
+        successors = self._db.get(state)
+        if successors is None:
+            return None
+        if isinstance(successors, array):
+            # Successors are chosen with probability proportional to the
+            # number of times they occur.
+            n = random.randrange(sum(successors[1::2]))
+            for i in xrange(1, len(successors), 2):
+                n -= successors[i]
+                if n < 0:
+                    break
+            word_id = successors[i - 1]
+        else:
+            word_id = successors >> COUNT_BITS
+        return word_id, (state << ID_BITS | word_id) & self._state_mask
+
+    def _word(self, word_id):
+        return self._words[word_id]
+
+    def _find_state(self, words):
+        try:
+            return self._pack([self._ids[word] for word in words])
+        except KeyError:
+            return None
+
+    def generate_db(self, words):
+        self.update(words)
+
+    def update(self, words, context=()):
+        """
+        Counts in transitions between `words`, which follow `context` words
+        in the corpus.
+
+        >>> mc = MarkovChain()
+        >>> mc.update([u'Herp', u'derp.'])
+        >>> mc.update([u'Gooby', u'pls.'], context=[u'Herp', u'derp.'])
+        >>> mc.successors([u'Herp', u'derp.'])
+        {u'Gooby': 1}
+        >>> mc.successors([u'derp.', u'Gooby'])
+        {u'pls.': 1}
+        """
+        words = list(context)[-self._order:] + list(words)
+        word_ids = [self._word_id(word) for word in words]
+        for i in xrange(len(word_ids) - self._order):
+            self._count(word_ids[i:i + self._order + 1], 1)
+
+    def discard(self, words):
+        """
+        Counts out a single transition given as `order` + 1 words.
+        """
+        try:
+            word_ids = [self._ids[word] for word in words]
+        except KeyError:
+            return
+        self._count(word_ids, -1)
+
+    def _count(self, word_ids, delta):
+        state, word_id = self._pack(word_ids[:-1]), word_ids[-1]
+        successors = self._db.get(state)
+        if successors is None:
+            if delta > 0:
+                self._add_state(state, word_id << COUNT_BITS | delta)
+            return
+        if not isinstance(successors, array):
+            if successors >> COUNT_BITS == word_id:
+                count = (successors & COUNT_MASK) + delta
+                if count > 0:
+                    self._db[state] = word_id << COUNT_BITS | count
+                else:
+                    self._remove_state(state)
+                return
+            if delta < 0:
+                return
+            successors = self._db[state] = array(b'i', (
+                successors >> COUNT_BITS, successors & COUNT_MASK))
+        for i in xrange(0, len(successors), 2):
+            if successors[i] == word_id:
+                break
+        else:
+            if delta > 0:
+                successors.extend((word_id, delta))
+            return
+        count = successors[i + 1] + delta
+        if count > 0:
+            successors[i + 1] = count
+            return
+        del successors[i:i + 2]
+        if len(successors) == 2:
+            self._db[state] = successors[0] << COUNT_BITS | successors[1]
+
+    def dump(self, f, meta=None):
+        """
+        Writes the chain in a compact binary format, which is read back by
+        :meth:`load` or memory-mapped by :class:`MappedMarkovChain`.
+
+        Words no longer used are dropped. Word ids are renumbered in the
+        order of encoded words, and states are sorted, so both can be
+        binary searched. Every transition is saved with the cumulative
+        weight of the state successors up to it and the index of the state
+        it leads to, so sampling a successor needs no lookups.
+
+        :param f: file opened for writing in binary mode
+
+        :param meta: JSON serializable metadata saved along with the chain
+        :type meta: `dict`
+        """
+        used = set()
+        for state in self._db:
+            used.update(self._unpack(state))
+            used.update(self._transitions(state)[0])
+        encoded = dict((word_id, self._words[word_id].encode('utf-8'))
+                       for word_id in used)
+        old_ids = sorted(used, key=encoded.__getitem__)
+        new_ids = dict((old_id, new_id)
+                       for new_id, old_id in enumerate(old_ids))
+
+        word_offsets = array(b'i', [0])
+        for word_id in old_ids:
+            word_offsets.append(word_offsets[-1] + len(encoded[word_id]))
+        words = b''.join(encoded[word_id] for word_id in old_ids)
+
+        keys = sorted((tuple(new_ids[word_id]
+                             for word_id in self._unpack(state)), state)
+                      for state in self._db)
+        positions = dict((key, i) for i, (key, _) in enumerate(keys))
+        states = array(b'i')
+        state_offsets = array(b'i', [0])
+        successor_ids = array(b'i')
+        weights = array(b'i')
+        next_states = array(b'i')
+        starts = array(b'i')
+        for i, (key, state) in enumerate(keys):
+            word_ids, counts = self._transitions(state)
+            states.extend(key)
+            weight = 0
+            for word_id, count in izip(word_ids, counts):
+                word_id = new_ids[word_id]
+                weight += count
+                successor_ids.append(word_id)
+                weights.append(weight)
+                next_states.append(positions.get(key[1:] + (word_id, ), -1))
+            state_offsets.append(len(weights))
+            if state in self._first_key_positions:
+                starts.append(i)
+        del positions
+
+        meta = json.dumps(meta or dict())
+        f.write(CHAIN_HEADER.pack(CHAIN_MAGIC, CHAIN_VERSION, self._order,
+                                  len(old_ids), len(words), len(keys),
+                                  len(weights), len(starts), len(meta)))
+        for section in (meta, word_offsets.tostring(), words,
+                        states.tostring(), state_offsets.tostring(),
+                        successor_ids.tostring(), weights.tostring(),
+                        next_states.tostring(), starts.tostring()):
+            f.write(section)
+            f.write(b'\0' * _padding(len(section)))
+
+    @classmethod
+    def load(cls, f):
+        """
+        Reads a chain written by :meth:`dump`, see :attr:`meta` for the
+        saved metadata.
+
+        >>> from StringIO import StringIO
+        >>> f = StringIO()
+        >>> MarkovChain.from_string(u'Herp derp. Gooby pls.').dump(f)
+        >>> f.seek(0)
+        >>> MarkovChain.load(f).successors([u'derp.', u'Gooby'])
+        {u'pls.': 1}
+        """
+        data = f.read()
+        order, meta, sections = read_chain_header(data)
+
+        def ints(name):
+            offset, length = sections[name]
+            values = array(b'i')
+            values.fromstring(data[offset:offset + 4 * length])
+            return values
+
+        obj = cls(order)
+        obj.meta = meta
+        words_offset = sections['words'][0]
+        word_offsets = ints('word_offsets')
+        for i in xrange(len(word_offsets) - 1):
+            start = words_offset + word_offsets[i]
+            end = words_offset + word_offsets[i + 1]
+            obj._word_id(data[start:end].decode('utf-8'))
+
+        states = ints('states')
+        state_offsets = ints('state_offsets')
+        successor_ids = ints('successors')
+        weights = ints('weights')
+        for i in xrange(len(state_offsets) - 1):
+            start, end = state_offsets[i], state_offsets[i + 1]
+            if end - start == 1:
+                successors = (successor_ids[start] << COUNT_BITS |
+                              weights[start])
+            else:
+                successors = array(b'i', [0]) * (2 * (end - start))
+                successors[::2] = successor_ids[start:end]
+                successors[1::2] = array(b'i', (
+                    weights[j] - (weights[j - 1] if j > start else 0)
+                    for j in xrange(start, end)))
+            state = obj._pack(states[i * order:(i + 1) * order])
+            obj._add_state(state, successors)
+        return obj
+
     @classmethod
     def from_string(cls, text, order=1):
+        return cls.from_sentences((text, ), order)
+
+    @classmethod
+    def from_sentences(cls, sentences, order=1):
+        """
+        Builds a chain from an iterable of sentences, e.g. a stream returned
+        by :meth:`~messagelog.MessageLog.sentences`.
+
+        >>> mc = MarkovChain.from_sentences([u'Herp derp.', u'Gooby pls.'])
+        >>> mc.successors([u'derp.', u'Gooby'])
+        {u'pls.': 1}
+        """
         obj = cls(order)
-        words = []
-        for word in text.split():
-            if not word:
-                continue
-            words.append(word)
-        obj.generate_db(words)
+        context = []
+        for sentence in sentences:
+            words = sentence.split()
+            obj.update(words, context)
+            context = (context + words)[-obj.order:]
         return obj
 
     @classmethod
@@ -317,6 +774,324 @@ class MarkovChain(object):
         return obj
 
 
+class MappedMarkovChain(BaseMarkovChain):
+    """
+    Read-only chain memory-mapped from a file written by
+    :meth:`MarkovChain.dump`. Sentences are generated without loading the
+    whole chain into memory, and each generated word costs a binary search
+    within successors of a single state, regardless of the chain size.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        order, meta, sections = read_chain_header(self._map)
+        super(MappedMarkovChain, self).__init__(order)
+        self.meta = meta
+        self._sections = sections
+        self._state_struct = struct.Struct(b'=%di' % order)
+        self._words_count = sections['word_offsets'][1] - 1
+        self._states_count = sections['state_offsets'][1] - 1
+
+    def close(self):
+        self._map.close()
+
+    def __len__(self):
+        return self._states_count
+
+    def _ints(self, name, index, length):
+        offset = self._sections[name][0] + 4 * index
+        return struct.unpack_from(b'=%di' % length, self._map, offset)
+
+    def _encoded_word(self, word_id):
+        start, end = self._ints('word_offsets', word_id, 2)
+        offset = self._sections['words'][0]
+        return self._map[offset + start:offset + end]
+
+    def _word(self, word_id):
+        return self._encoded_word(word_id).decode('utf-8')
+
+    def _state_ids(self, state):
+        offset = self._sections['states'][0] + 4 * self._order * state
+        return self._state_struct.unpack_from(self._map, offset)
+
+    def _sample_first_keys(self, count):
+        starts_count = self._sections['starts'][1]
+        keys = [self._ints('starts', i, 1)[0] for i in
+                random.sample(xrange(starts_count), min(count, starts_count))]
+        keys.extend(random.randrange(self._states_count)
+                    for _ in xrange(count - len(keys)))
+        return keys
+
+    def _state_words(self, state):
+        return tuple(self._word(word_id)
+                     for word_id in self._state_ids(state))
+
+    def _transitions(self, state):
+        start, end = self._ints('state_offsets', state, 2)
+        weights = self._ints('weights', start, end - start)
+        counts = tuple(weight - previous for previous, weight in
+                       izip((0, ) + weights, weights))
+        return self._ints('successors', start, end - start), counts
+
+    def _step(self, state):
+        start, end = self._ints('state_offsets', state, 2)
+        if start == end:
+            return None
+        weights = self._ints('weights', start, end - start)
+        i = start + bisect.bisect(weights, random.randrange(weights[-1]))
+        next_state = self._ints('next_states', i, 1)[0]
+        return (self._ints('successors', i, 1)[0],
+                next_state if next_state >= 0 else None)
+
+    def _search_state(self, word_ids):
+        lo, hi = 0, self._states_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._state_ids(mid) < word_ids:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._states_count and self._state_ids(lo) == word_ids:
+            return lo
+        return None
+
+    def _search_word(self, word):
+        encoded = word.encode('utf-8')
+        lo, hi = 0, self._words_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._encoded_word(mid) < encoded:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._words_count and self._encoded_word(lo) == encoded:
+            return lo
+        return None
+
+    def _find_state(self, words):
+        word_ids = tuple(self._search_word(word) for word in words)
+        if None in word_ids:
+            return None
+        return self._search_state(word_ids)
+
+
+class ChatModel(object):
+    """
+    Markov chain of a single chat kept in sync with its message log.
+
+    Logged sentences are counted in and expired ones are counted out, so
+    the chain is never rebuilt from the whole history. The chain is saved
+    along with the id of the last counted log row, so rows logged after the
+    last save are counted in once the model is loaded.
+
+    >>> model = ChatModel(None)
+    >>> model.add(1, u'Herp derp.')
+    >>> model.add(2, u'Gooby pls.')
+    >>> model.chain.successors([u'derp.', u'Gooby'])
+    {u'pls.': 1}
+    >>> entries = [(1, 100, u'Herp derp.'), (2, 200, u'Gooby pls.')]
+    >>> model.expire(entries, before=200)
+    >>> len(model.chain)
+    0
+    >>> model.add(3, u'Kappa.')
+    >>> model.chain.successors([u'Gooby', u'pls.'])
+    {u'Kappa.': 1}
+    """
+
+    def __init__(self, path, order=2):
+        self.path = path
+        self.chain = MarkovChain(order)
+        self.last_id = 0
+        # Last words of the corpus, which the next sentence follows.
+        self._tail = []
+        self._dirty = False
+
+    @classmethod
+    def load(cls, path):
+        model = cls(path)
+        if not os.path.exists(path):
+            return model
+        with open(path, 'rb') as f:
+            model.chain = MarkovChain.load(f)
+        model.last_id = model.chain.meta['last_id']
+        model._tail = model.chain.meta['tail']
+        return model
+
+    def save(self):
+        if not self._dirty:
+            return
+        meta = {
+            'last_id': self.last_id,
+            'tail': self._tail,
+        }
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            self.chain.dump(f, meta)
+        # Windows doesn't allow renaming to an existing file.
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(temp_path, self.path)
+        self._dirty = False
+
+    def add(self, entry_id, sentence):
+        words = sentence.split()
+        self.chain.update(words, self._tail)
+        self._tail = (self._tail + words)[-self.chain.order:]
+        self.last_id = entry_id
+        self._dirty = True
+
+    def catch_up(self, entries):
+        """
+        Counts in log rows appended after the last counted one.
+
+        :param entries: rows returned by
+            :meth:`~messagelog.MessageLog.entries_after`
+        """
+        for entry_id, _, sentence in entries:
+            self.add(entry_id, sentence)
+
+    def expire(self, entries, before):
+        """
+        Counts out transitions starting within sentences older than
+        `before`.
+
+        :param entries: rows streamed from the oldest one, see
+            :meth:`~messagelog.MessageLog.entries`
+        """
+        # Sliding window of (word, expired) pairs, stops at the first
+        # transition starting within a live sentence.
+        window = deque()
+        for _, timestamp, sentence in entries:
+            expired = timestamp < before
+            for word in sentence.split():
+                window.append((word, expired))
+                if len(window) <= self.chain.order:
+                    continue
+                if not window[0][1]:
+                    return
+                self.chain.discard([w for w, _ in window])
+                window.popleft()
+                self._dirty = True
+        # Fewer than `order` live words are left, the next sentence must not
+        # follow expired ones.
+        live = [word for word, expired in window if not expired]
+        if len(live) < len(window):
+            self._tail = live
+            self._dirty = True
+
+
+# Saved chat models are rewritten once the sentences logged since make up
+# this fraction of the counted ones, or once the model is older than
+# MODEL_MAX_AGE seconds. Expired sentences are counted out and purged from
+# the message log on rewrites only.
+MODEL_REWRITE_RATIO = 0.1
+
+MODEL_MAX_AGE = timedelta(days=7).total_seconds()
+
+
+def update_model(message_log, model_path, chat_name, expires):
+    """
+    Brings a saved chat model up to date with the message log, purges
+    expired sentences from the log and rewrites the model.
+
+    :param expires: sentences older than this UNIX timestamp are expired
+    :type expires: `float`
+
+    :rtype: :class:`ChatModel`
+    """
+    try:
+        model = ChatModel.load(model_path)
+    except Exception:
+        log.exception("Unable to load %s model, rebuilding it", chat_name)
+        model = ChatModel(model_path)
+    model.catch_up(message_log.entries_after(chat_name, model.last_id))
+    entries = message_log.entries(chat_name)
+    try:
+        model.expire(entries, expires)
+    finally:
+        entries.close()
+    purged_count = message_log.expire(chat_name, expires)
+    log.info("Purged %s messages from %s (%s left)", purged_count,
+             chat_name, message_log.count(chat_name))
+    model.save()
+    if os.path.exists(model_path):
+        # Up to date even if unchanged, see MODEL_MAX_AGE.
+        os.utime(model_path, None)
+    return model
+
+
+def map_model(message_log, model_path, chat_name):
+    """
+    Memory-maps a saved chat model unless it is due to be rewritten, see
+    :data:`MODEL_REWRITE_RATIO` and :data:`MODEL_MAX_AGE`.
+
+    A mapped model is read-only, so sentences logged after it has been
+    saved are not counted in and expired ones are not counted out until the
+    rewrite. This is deliberate: updating the model on every sentence or
+    summary means loading and saving the whole chain. Summaries leave out
+    up to a tenth of the most recent sentences, and expiration is applied
+    up to a week late, which is negligible for a 69 weeks long history.
+
+    :returns: chain of the model or `None`
+    :rtype: :class:`MappedMarkovChain`
+    """
+    try:
+        if time() - os.path.getmtime(model_path) > MODEL_MAX_AGE:
+            return None
+        chain = MappedMarkovChain(model_path)
+    except (EnvironmentError, ValueError):
+        return None
+    pending = message_log.count_after(chat_name, chain.meta.get('last_id', 0))
+    counted = message_log.count(chat_name) - pending
+    if pending > counted * MODEL_REWRITE_RATIO:
+        chain.close()
+        return None
+    return chain
+
+
+def generate_summary(log_location, model_path, chat_name, expires):
+    """
+    Generates a summary from a saved chat model. Executed by a worker
+    process, so the chat model is only ever loaded there.
+
+    The model is always sampled memory-mapped, see
+    :class:`MappedMarkovChain`, so sampling it costs neither loading it nor
+    summing successor weights. Sentences logged after the model has been saved are counted
+    in by :func:`update_model` once enough of them accumulate.
+
+    :param log_location: :class:`~messagelog.MessageLog` database path
+    :type log_location: `unicode`
+
+    :param model_path: saved :class:`ChatModel` path
+    :type model_path: `unicode`
+
+    :param expires: sentences older than this UNIX timestamp are expired
+    :type expires: `float`
+
+    :rtype: :class:`~output.ChatMessage` or `None`
+    """
+    message_log = MessageLog(log_location)
+    try:
+        chain = map_model(message_log, model_path, chat_name)
+        if chain is None:
+            update_model(message_log, model_path, chat_name, expires)
+    finally:
+        message_log.close()
+    if chain is None:
+        # The updated model is sampled from the file it has been saved to
+        # as well, the in-memory chain is only meant for building it.
+        if not os.path.exists(model_path):
+            return None
+        chain = MappedMarkovChain(model_path)
+    try:
+        if not chain:
+            return None
+        return ChatMessage(chat_name, ' '.join(chain.generate_sentences()))
+    finally:
+        chain.close()
+
+
 class SummaryGenerator(Plugin):
     # Determines text generation frequency, i.e. generate text for every
     # n messages received.
@@ -324,81 +1099,101 @@ class SummaryGenerator(Plugin):
 
     EXPIRATION_TIMEDELTA = timedelta(weeks=69)
 
+    def __init__(self, priority=0, whitelist=None, **kwargs):
+        super(SummaryGenerator, self).__init__(priority, whitelist, **kwargs)
+        # Sentences are stored one per row, so appending one doesn't rewrite
+        # the whole chat history.
+        self._log_location = os.path.join(CACHE_DIR,
+                                          "summarygenerator_log.sqlite")
+        self._message_log = MessageLog(self._log_location)
+        self._pipeline = TextPipeline()
+        self._migrated_chats = set()
+        self._models_dir = os.path.join(CACHE_DIR, "summarygenerator")
+        if not os.path.isdir(self._models_dir):
+            os.makedirs(self._models_dir)
+        # Chats being generated for by worker processes.
+        self._generating = set()
+
     def _init_cache(self):
         return from_dict({
             'backend': 'cache_new.SQLiteCache',
             'location': os.path.join(CACHE_DIR, "summarygenerator.sqlite"),
             'timeout': 0,
             'key_prefix': '',
+            # Every received message increments the counter.
+            'write_behind': True,
         })
 
-    @staticmethod
-    def process_message(message):
+    @property
+    def message_log(self):
+        return self._message_log
+
+    def process_message(self, message):
         names = [m.DisplayName for m in message.Chat.Members]
         usernames = [m.Handle for m in message.Chat.Members]
         chat_members = names + usernames
-        kwargs = {
-            'chat_members': chat_members,
-        }
-        output = message.Body
-        for f in SENTENCE_PREFILTERS:
-            output = f(output, **kwargs)
-        for f in WORD_FILTERS:
-            output = ' '.join(filter(None, [f(w) for w in output.split()]))
-        for f in SENTENCE_POSTFILTERS:
-            output = f(output)
-        return output
-
-    def _purge_expired(self, chat_name):
-        cached_messages = self.cache.get(chat_name) or deque()
-        now_dt_utc = datetime.utcnow()
-        purged_count = 0
-        while 1:
-            try:
-                message, msg_timestamp_utc = cached_messages.popleft()
-            except IndexError:
-                break
-            msg_dt_utc = datetime.fromtimestamp(msg_timestamp_utc)
-            if now_dt_utc - msg_dt_utc < self.EXPIRATION_TIMEDELTA:
-                cached_messages.appendleft((message, msg_timestamp_utc))
-                break
-            purged_count += 1
-        self.cache.set(chat_name, cached_messages)
-        self.logger.info("Purged %s messages from %s (%s left)",
-                         purged_count, chat_name, len(cached_messages))
+        return self._pipeline(analyze(message).text,
+                              chat_members=chat_members)
+
+    def _migrate_history(self, chat_name):
+        # Chat histories used to be stored as a single pickled deque of
+        # (sentence, timestamp) tuples under the chat name key.
+        if chat_name in self._migrated_chats:
+            return
+        history = self.cache.get(chat_name)
+        if history:
+            self.message_log.extend(chat_name, history)
+            self.logger.info("Migrated %s messages of %s to the message log",
+                             len(history), chat_name)
+        self.cache.delete(chat_name)
+        self._migrated_chats.add(chat_name)
+
+    def _model_path(self, chat_name):
+        digest = hashlib.md5(chat_name.encode('utf-8')).hexdigest()
+        return os.path.join(self._models_dir, digest + '.model')
+
+    def _generate(self, chat_name):
+        # Models are loaded, updated and sampled by worker processes, the
+        # event thread only submits a job.
+        if chat_name in self._generating:
+            self.logger.warning("Still generating gibberish for %s",
+                                chat_name)
+            return
+        self._generating.add(chat_name)
+        self.logger.info("Generating gibberish for %s", chat_name)
+        self.logger.debug("Text pipeline: %s",
+                          self._pipeline.format_timings())
+        expires = time() - self.EXPIRATION_TIMEDELTA.total_seconds()
+        future = self.defer_process(generate_summary, self._log_location,
+                                    self._model_path(chat_name), chat_name,
+                                    expires)
+        future.add_done_callback(
+            lambda future: self._generating.discard(chat_name))
 
     def on_message_status(self, message, status):
         if status != cmsReceived:
             return
 
         chat_name = message.Chat.Name
-
-        try:
-            counter = int(self.cache.get('counter', key_prefix=chat_name))
-        except (TypeError, ValueError):
-            counter = 0
-
-        cached_sentences = self.cache.get(chat_name) or deque()
+        self._migrate_history(chat_name)
 
         processed_message = self.process_message(message)
 
         if processed_message:
-            cached_sentences.append((processed_message, time()))
-            self.cache.set(chat_name, cached_sentences)
-            counter += 1
-            self.cache.set('counter', counter, key_prefix=chat_name)
+            self.message_log.append(chat_name, processed_message)
+            counter = self.cache.incr('counter', key_prefix=chat_name)
+        else:
+            try:
+                counter = int(self.cache.get('counter', key_prefix=chat_name))
+            except (TypeError, ValueError):
+                counter = 0
 
         if not counter % 50 and counter and self.TRIGGER_THRESHOLD - counter:
             self.logger.info("Triggering in %s messages at %s",
                              self.TRIGGER_THRESHOLD - counter, chat_name)
 
         if counter >= self.TRIGGER_THRESHOLD:
-            self._purge_expired(chat_name)
-            self.logger.info("Generating gibberish for %s", chat_name)
-            text = ' '.join([sentence[0] for sentence in cached_sentences])
-            mc = MarkovChain.from_string(text)
-            output = ' '.join(mc.generate_sentences())
-            self.output.append(ChatMessage(chat_name, output))
+            self._generate(chat_name)
             self.cache.set('counter', 0, key_prefix=chat_name)
 
         return message, status
@@ -17,8 +17,7 @@ __docformat__ = "restructuredtext en"
 import urllib2
 import urllib
 import json
-import atexit
-from threading import Timer
+from functools import partial
 
 # from Skype4Py.enums import cmsReceived, cmsSent
 
@@ -26,11 +25,10 @@ from plugin import Plugin
 from output import ChatMessage
 from dispatcher import dispatcher
 from pluginmanager import chat_is_whitelisted
+from scheduler import scheduler
 import signals
 
 
-_timer = None
-
 DEFAULT_CHECK_INTERVAL = 60
 
 STATUS_ONLINE = 1
@@ -50,23 +48,7 @@ class TwitchTvNotifier(Plugin):
     _opener = urllib2.build_opener()
     _opener.addheaders = [(k, v) for k, v in _headers.iteritems()]
 
-    @staticmethod
-    @atexit.register
-    def _cleanup():
-        global _timer
-        try:
-            _timer.cancel()
-            _timer.join()
-        except AttributeError:
-            pass
-        finally:
-            del _timer
-
     def _check_streams(self):
-        if not self.stream_names:
-            return
-
-        global _timer
         output = []
         try:
             data = self.retrieve_stream_data(self.stream_names)
@@ -86,15 +68,18 @@ class TwitchTvNotifier(Plugin):
 
         if self.whitelist and output:
             message = "\n".join(output)
-            responses = dispatcher.send(signals.REQUEST_CHATS)
-            chats = responses[0]
-            for chat in chats:
-                if chat_is_whitelisted(chat, self.whitelist):
-                    self.output.append(ChatMessage(chat, message))
+            for future in dispatcher.send_async(signals.REQUEST_CHATS):
+                future.add_done_callback(partial(self._broadcast, message))
 
-        _timer = Timer(self.check_interval, self._check_streams)
-        _timer.daemon = True
-        _timer.start()
+    def _broadcast(self, message, future):
+        try:
+            chats = future.result()
+        except Exception:
+            self.logger.exception("Unable to retrieve chats list")
+            return
+        for chat in chats:
+            if chat_is_whitelisted(chat, self.whitelist):
+                self.output.append(ChatMessage(chat, message))
 
     def __init__(self, priority=0, whitelist=None, **kwargs):
         super(TwitchTvNotifier, self).__init__(priority, whitelist, **kwargs)
@@ -102,7 +87,10 @@ class TwitchTvNotifier(Plugin):
                                                DEFAULT_CHECK_INTERVAL)
         self.stream_names = self.options.get('streams', list())
         self.logger.info("Watching %s", self.stream_names)
-        self._check_streams()
+        self._job = None
+        if self.stream_names:
+            self._job = scheduler.call_every(self.check_interval,
+                                             self._check_streams)
 
     def retrieve_stream_data(self, channels):
         """
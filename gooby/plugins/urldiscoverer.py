@@ -113,13 +113,10 @@ class URLDiscoverer(Plugin):
     _opener.addheaders = [(k, v) for k, v in _headers.iteritems()]
 
     def resolve_url(self, url):
-        resolved_url = self._cache.get(url)
-        if resolved_url is not None:
-            return resolved_url
+        return self._cache.get_or_compute(url, lambda: self._resolve_url(url))
 
-        resolved_url = self._opener.open("http://{0}".format(url)).url
-        self._cache.set(url, resolved_url)
-        return resolved_url
+    def _resolve_url(self, url):
+        return self._opener.open("http://{0}".format(url)).url
 
     def on_message_status(self, message, status):
         if status != cmsReceived:
@@ -134,19 +131,29 @@ class URLDiscoverer(Plugin):
         if not found:
             return
 
+        self.defer(self.resolve_urls, message.Chat.Name, message.FromHandle,
+                   message.FromDisplayName, found)
+
+        return message, status
+
+    def resolve_urls(self, chat_name, handle, display_name, urls):
+        """Deferred part of :meth:`on_message_status`."""
+
         resolved = []
 
-        for url in found:
+        cached_urls = self.cache.get_many(urls)
+
+        for url in urls:
             try:
-                self._logger.info(u"Resolving {0} for {1}".format(
-                    url, message.FromHandle
-                ))
-                resolved_url = self.resolve_url(url)
+                self._logger.info(u"Resolving {0} for {1}".format(url, handle))
+                resolved_url = cached_urls.get(url)
+                if resolved_url is None:
+                    resolved_url = self.resolve_url(url)
                 resolved.append(u"{0} -> {1}".format(url, resolved_url))
 
             except (urllib2.HTTPError, urllib2.URLError) as e:
                 m = u"Unable to resolve {0} for {1} ({2}): {3}".format(
-                    url, message.FromDisplayName, message.FromHandle, str(e)
+                    url, display_name, handle, str(e)
                 )
                 self._logger.error(m)
                 resolved.append(u"{0} -> unable to resolve ({1})".format(
@@ -160,9 +167,7 @@ class URLDiscoverer(Plugin):
             msg = "redirection {0}".format(resolved[0])
         else:
             msg = "redirection {0}".format("\n".join(resolved))
-        self.output.append(ChatMessage(message.Chat.Name, msg))
-        #message.Chat.SendMessage(msg)
-        return message, status
+        return ChatMessage(chat_name, msg)
 
 
 if __name__ == "__main__":
@@ -25,6 +25,7 @@ from lxml.etree import XMLSyntaxError
 
 from Skype4Py.enums import cmsReceived, cmsSent
 
+from cache import NEGATIVE
 from plugin import Plugin
 from utils import retry_on_exception
 from output import ChatMessage
@@ -75,10 +76,13 @@ class VimeoURLParser(Plugin):
         u'METACHAOS'
         """
 
-        cached_title = self._cache.get(video_id)
-        if cached_title is not None:
-            return cached_title
+        title = self._cache.get_or_compute(
+            video_id, lambda: self._retrieve_video_title(video_id))
+        if title is NEGATIVE:
+            return None
+        return title
 
+    def _retrieve_video_title(self, video_id):
         url = self._api_url.format(video_id)
 
         @retry_on_exception((urllib2.URLError, urllib2.HTTPError), tries=2,
@@ -91,17 +95,21 @@ class VimeoURLParser(Plugin):
             except XMLSyntaxError:
                 return
 
-        xml = retrieve_xml()
+        try:
+            xml = retrieve_xml()
+        except urllib2.URLError as e:
+            self._logger.error("Unable to retrieve {0}: {1}".format(
+                video_id, e))
+            return NEGATIVE
 
         try:
             title = xml.find("video/title").text
 
         except AttributeError:
-            return None
+            return NEGATIVE
 
         else:
             title = unicode(title)
-            self._cache.set(video_id, title)
             return title
 
     def on_message_status(self, message, status):
@@ -115,19 +123,31 @@ class VimeoURLParser(Plugin):
         if not found:
             return
 
-        titles = []
+        video_ids = filter(None, [get_video_id(url) for url in found])
+        if not video_ids:
+            return
 
-        for url in found:
-            video_id = get_video_id(url)
+        self.defer(self.retrieve_titles, message.Chat.Name, message.FromHandle,
+                   video_ids)
 
-            if video_id is None:
-                continue
+        return message, status
 
+    def retrieve_titles(self, chat_name, handle, video_ids):
+        """Deferred part of :meth:`on_message_status`."""
+
+        titles = []
+
+        found = self.cache.get_or_compute_many(
+            video_ids, self._retrieve_video_title)
+
+        for video_id in video_ids:
             self._logger.info("Retrieving {0} for {1}".format(
-                video_id, message.FromHandle
+                video_id, handle
             ))
 
-            title = self.get_video_title(video_id)
+            title = found.get(video_id)
+            if title is NEGATIVE:
+                title = None
 
             if title is not None:
                 titles.append(title)
@@ -136,7 +156,7 @@ class VimeoURLParser(Plugin):
                 titles.append(msg)
 
                 msg = "Unable to retrieve {0} for {1}".format(
-                    video_id, message.FromHandle
+                    video_id, handle
                 )
                 self._logger.error(msg)
 
@@ -147,9 +167,7 @@ class VimeoURLParser(Plugin):
             msg = u"[Vimeo] {0}".format("".join(titles))
         else:
             msg = u"[Vimeo]\n{0}".format("\n".join(titles))
-        #message.Chat.SendMessage(msg)
-        self.output.append(ChatMessage(message.Chat.Name, msg))
-        return message, status
+        return ChatMessage(chat_name, msg)
 
 
 if __name__ == "__main__":
@@ -22,6 +22,7 @@ import json
 
 from Skype4Py.enums import cmsReceived, cmsSent
 
+from cache import NEGATIVE
 from plugin import Plugin
 from output import ChatMessage
 import config
@@ -156,20 +157,28 @@ class YouTubeURLParser(Plugin):
         >>> plugin = YouTubeURLParser()
         >>> plugin.get_video_title("dQw4w9WgXcQ")
         u'Rick Astley - Never Gonna Give You Up [00:03:33]'
+
+        Returns `None` for unavailable videos, which are remembered as such
+        for a while.
         """
 
-        cached_title = self._cache.get(video_id)
-        if cached_title is not None:
-            return cached_title
+        title = self._cache.get_or_compute(
+            video_id, lambda: self._retrieve_video_title(video_id))
+        if title is NEGATIVE:
+            return None
+        return title
 
+    def _retrieve_video_title(self, video_id):
         args = self._url_args.copy()
         args.update({'id': video_id})
         url = ''.join((self._api_base_url, '?', urllib.urlencode(args)))
 
         try:
             data = json.loads(self._opener.open(url).read())
-        except urllib2.HTTPError:
-            raise Exception("Check your Google API key")
+        except urllib2.URLError as e:
+            self._logger.error("Unable to retrieve {0}, check your Google "
+                               "API key: {1}".format(video_id, e))
+            return NEGATIVE
 
         try:
             title = data['items'][0]['snippet']['title']
@@ -181,8 +190,9 @@ class YouTubeURLParser(Plugin):
         except (IndexError, AttributeError):
             duration = None
 
+        # Deleted and private videos aren't listed.
         if None in (title, duration):
-            raise Exception("Unable to retrieve video title parts")
+            return NEGATIVE
 
         duration = get_duration(duration)
 
@@ -192,7 +202,6 @@ class YouTubeURLParser(Plugin):
 
         title = u"{0} [{1}]".format(title, duration)
 
-        self._cache.set(video_id, title)
         return title
 
     def on_message_status(self, message, status):
@@ -206,19 +215,31 @@ class YouTubeURLParser(Plugin):
         if not found:
             return
 
-        titles = []
+        video_ids = filter(None, [get_video_id(url) for url in found])
+        if not video_ids:
+            return
+
+        self.defer(self.retrieve_titles, message.Chat.Name, message.FromHandle,
+                   video_ids)
 
-        for url in found:
-            video_id = get_video_id(url)
+        return message, status
 
-            if video_id is None:
-                continue
+    def retrieve_titles(self, chat_name, handle, video_ids):
+        """Deferred part of :meth:`on_message_status`."""
 
+        titles = []
+
+        found = self.cache.get_or_compute_many(
+            video_ids, self._retrieve_video_title)
+
+        for video_id in video_ids:
             self._logger.info("Retrieving {0} for {1}".format(
-                video_id, message.FromHandle
+                video_id, handle
             ))
 
-            title = self.get_video_title(video_id)
+            title = found.get(video_id)
+            if title is NEGATIVE:
+                title = None
 
             if title is not None:
                 titles.append(title)
@@ -227,7 +248,7 @@ class YouTubeURLParser(Plugin):
                 titles.append(msg)
 
                 msg = "Unable to retrieve {0} for {1}".format(
-                    video_id, message.FromHandle
+                    video_id, handle
                 )
                 self._logger.error(msg)
 
@@ -238,10 +259,7 @@ class YouTubeURLParser(Plugin):
             msg = u"[YouTube] {0}".format("".join(titles))
         else:
             msg = u"[YouTube]\n{0}".format("\n".join(titles))
-        #message.Chat.SendMessage(msg)
-        self.output.append(ChatMessage(message.Chat.Name, msg))
-
-        return message, status
+        return ChatMessage(chat_name, msg)
 
 
 if __name__ == "__main__":
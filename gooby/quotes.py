@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+:mod:`quotes` --- Skype client message quotation parser
+=======================================================
+
+Every Skype client quotes messages its own way. Quotations of every
+supported client are recognized in a single scan of a message by one
+combined pattern:
+
+    >>> from quotes import parse_quotes
+    >>> quotes = parse_quotes('''[1:37:59 PM] username derp: a quote
+    ...
+    ... <<< a message''')
+    >>> len(quotes)
+    1
+    >>> quotes[0].client, quotes[0].sender, quotes[0].time
+    (u'windows', u'username derp', u'1:37:59 PM')
+    >>> quotes[0].quote, quotes[0].message
+    (u'a quote', u'a message')
+
+Results are cached by message text, so every plugin handling the same
+message gets them without scanning it again.
+"""
+
+
+from __future__ import unicode_literals
+
+
+__docformat__ = "restructuredtext en"
+
+
+import re
+import threading
+from collections import namedtuple, OrderedDict
+
+
+LINUX = "linux"
+MACOSX = "macosx"
+WINDOWS = "windows"
+ANDROID = "android"
+WINDOWS_MULTIPLE = "windows_multiple"
+
+# Clients which are able to quote the same message, in order of precedence.
+CLIENTS = (WINDOWS, LINUX, MACOSX, ANDROID, WINDOWS_MULTIPLE)
+
+# Pattern sources of every client, in the order they are tried at the same
+# position by the combined pattern. Group names are prefixed with the client
+# name, as they have to be unique within the combined pattern.
+PATTERNS = (
+    (WINDOWS, r"""
+        # Windows Skype client message quotation.
+        # FIXME: Does not work with actual client quotes for some reason.
+        (?P<windows>
+            \[
+            (?P<windows_time>
+                \d{1,2}:\d{2}:\d{2}(?:\s*\w{2})?
+            )\]\s
+            (?P<windows_sender>
+                .*
+            ):\s
+            (?P<windows_quote>
+                .*
+            )\n*
+            <<<\s*
+            (?P<windows_message>
+                .*
+            )\W*
+        )
+    """),
+    (LINUX, r"""
+        # Linux Skype client message quotation.
+        (?P<linux>
+            >\s\[
+            (?P<linux_date>
+                \w+,\s\w+\s\d{1,2},\s\d{4}
+            )\s
+            (?P<linux_time>
+                \d{1,2}:\d{2}:\d{2}\s\w{2}
+            )\s
+            (?P<linux_sender>
+                .+
+            )
+            \]\s
+            (?P<linux_quote>
+                .*
+            )\n?
+            (?P<linux_message>
+                .*
+            )\W*
+        )
+    """),
+    (MACOSX, r"""
+        # Mac OS X Skype client message quotation.
+        (?P<macosx>
+            (?P<macosx_date>
+                \d{2}\.\d{2}\.\d{2}
+            )\s\w+\s
+            (?P<macosx_time>
+                \d{2}:\d{2}
+            )\s
+            # There are no space characters in Skype user names.
+            (?P<macosx_sender>
+                [a-zA-Z0-9_\-\.]+
+            )\s.*:\n
+            >\s*
+            (?P<macosx_quote>
+                .*
+            )\n*
+            (?P<macosx_message>
+                .*
+            )\W*
+        )
+    """),
+    (WINDOWS_MULTIPLE, r"""
+        # Windows Skype client quotation of multiple messages, one per line.
+        (?P<windows_multiple>
+            \[
+            (?P<windows_multiple_date>
+                \d{2}\.\d{2}\.\d{4}
+            )\s
+            (?P<windows_multiple_time>
+                \d{2}:\d{2}:\d{2}
+            )
+            \]\s
+            (?P<windows_multiple_sender>
+                .+
+            ):\s
+            (?P<windows_multiple_message>
+                .*
+            )\s*
+        )
+    """),
+    (ANDROID, r"""
+        # Android Skype client message quotation. Anchored at the line start,
+        # so the greedy sender group is not tried from every position.
+        ^(?P<android>
+            (?P<android_sender>
+                .*
+            )\s\-\s
+            (?P<android_date>
+                .*
+            )\s
+            (?P<android_time>
+                \d{1,2}:\d{1,2}
+            )\n
+            >\s*
+            (?P<android_quote>
+                .*
+            )\n*
+            (?P<android_message>
+                .*
+            )
+        )
+    """),
+)
+
+FLAGS = re.UNICODE | re.VERBOSE | re.MULTILINE
+
+QUOTE_PATTERN = re.compile("|".join(source for _, source in PATTERNS),
+                           FLAGS)
+
+CLIENT_PATTERNS = dict((client, re.compile(source, FLAGS))
+                       for client, source in PATTERNS)
+
+FIELDS = ("sender", "date", "time", "quote", "message")
+
+
+class Quote(namedtuple("Quote", ("client", ) + FIELDS)):
+    """
+    A single message quotation. Fields a client does not provide are
+    `None`.
+    """
+
+    __slots__ = ()
+
+
+def _quote(match):
+    client = match.lastgroup
+    groups = match.groupdict()
+    return Quote(client, *(groups.get(client + "_" + field)
+                           for field in FIELDS))
+
+
+# Number of recently parsed messages kept in the cache.
+CACHE_SIZE = 64
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def parse_quotes(text):
+    """
+    Finds quotations of every supported client in a single scan. The scan
+    consumes matched text, so of overlapping quotations only the first one
+    found is returned.
+
+    >>> parse_quotes('''[06.08.2015 12:30:27] some derp: le message
+    ... [06.08.2015 12:32:51] othername.derp: Asdf?''')  # doctest: +ELLIPSIS
+    (Quote(client=u'windows_multiple', sender=u'some derp', ...), ...)
+    >>> parse_quotes('Herp derp.')
+    ()
+
+    :param text: message text
+    :type text: `unicode`
+
+    :returns: quotations in order of appearance
+    :rtype: `tuple` of :class:`Quote`
+    """
+
+    with _cache_lock:
+        quotes = _cache.pop(text, None)
+        if quotes is not None:
+            _cache[text] = quotes
+            return quotes
+
+    quotes = tuple(_quote(match) for match in QUOTE_PATTERN.finditer(text))
+
+    with _cache_lock:
+        _cache[text] = quotes
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return quotes
+
+
+def first_quote(text, clients=CLIENTS):
+    """
+    Quotations of clients with higher precedence than the best one found by
+    :func:`parse_quotes` may have been hidden by an overlapping match, the
+    text is searched for them separately.
+
+    :param clients: clients to consider, in order of precedence
+
+    :returns: quotation of the first client found in the text, or `None`
+    :rtype: :class:`Quote`
+    """
+
+    quotes = [q for q in parse_quotes(text) if q.client in clients]
+    if not quotes:
+        return None
+    best = min(quotes, key=lambda q: clients.index(q.client))
+    for client in clients[:clients.index(best.client)]:
+        match = CLIENT_PATTERNS[client].search(text)
+        if match is not None:
+            return _quote(match)
+    return best
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+:mod:`scheduler` --- Centralized job scheduler
+==============================================
+
+A single thread which runs one-shot and periodic jobs ordered by a heap of
+their due times. Replaces ad-hoc :class:`threading.Timer` threads, measures
+how late jobs are started (jitter) and whether they run longer than their
+interval (overrun).
+
+Usage
+-----
+
+    >>> from scheduler import Scheduler
+    >>> s = Scheduler()
+    >>> def job():
+    ...     return 42
+    >>> periodic = s.call_every(60, job)
+    >>> oneshot = s.call_later(0, job)
+    >>> periodic.cancel()
+    >>> s.shutdown()
+"""
+
+
+from __future__ import unicode_literals
+
+
+__docformat__ = "restructuredtext en"
+
+
+import atexit
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+
+log = logging.getLogger("Gooby.Scheduler")
+
+
+# Jobs started later than this (in seconds) are reported.
+JITTER_WARNING_THRESHOLD = 1.0
+
+
+class Job(object):
+    """
+    Scheduled job handle. Keeps timing statistics of its runs.
+    """
+
+    def __init__(self, scheduler, due, interval, func, args, kwargs):
+        self._scheduler = scheduler
+        self.due = due
+        self.interval = interval
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+
+        self.runs = 0
+        self.overruns = 0
+        self.max_jitter = 0.0
+        self.last_jitter = 0.0
+        self.last_duration = 0.0
+
+    @property
+    def periodic(self):
+        return self.interval is not None
+
+    def cancel(self):
+        """
+        Cancels the job. A job which is currently running finishes normally
+        but is not scheduled again.
+        """
+
+        self.cancelled = True
+        self._scheduler._wakeup()
+
+    def __repr__(self):
+        return "<Job {0!r} every {1}s, {2} run(s)>".format(
+            self.func, self.interval, self.runs)
+
+
+class Scheduler(object):
+    def __init__(self, name="Scheduler"):
+        self._name = name
+        self._queue = list()
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._shutdown = False
+
+    def call_later(self, delay, func, *args, **kwargs):
+        """
+        Runs ``func(*args, **kwargs)`` once after `delay` seconds.
+
+        :rtype: :class:`Job`
+        """
+
+        return self._schedule(delay, None, func, args, kwargs)
+
+    def call_every(self, interval, func, *args, **kwargs):
+        """
+        Runs ``func(*args, **kwargs)`` every `interval` seconds, starting
+        right away unless `delay` keyword argument is given. Runs which are
+        missed because of an overrun are skipped rather than piled up.
+
+        :rtype: :class:`Job`
+        """
+
+        assert interval > 0
+        delay = kwargs.pop("delay", 0)
+        return self._schedule(delay, interval, func, args, kwargs)
+
+    def _schedule(self, delay, interval, func, args, kwargs):
+        job = Job(self, time.time() + delay, interval, func, args, kwargs)
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Scheduler has been shut down")
+            self._push(job)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name=self._name)
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify()
+        return job
+
+    def _push(self, job):
+        heapq.heappush(self._queue, (job.due, next(self._counter), job))
+
+    def _wakeup(self):
+        with self._condition:
+            self._condition.notify()
+
+    def _next_job(self):
+        """
+        Blocks until a job is due. Returns `None` on shutdown.
+        """
+
+        with self._condition:
+            while not self._shutdown:
+                while self._queue and self._queue[0][2].cancelled:
+                    heapq.heappop(self._queue)
+                if not self._queue:
+                    self._condition.wait()
+                    continue
+                due = self._queue[0][0]
+                now = time.time()
+                if due > now:
+                    self._condition.wait(due - now)
+                    continue
+                return heapq.heappop(self._queue)[2]
+        return None
+
+    def _run(self):
+        while 1:
+            job = self._next_job()
+            if job is None:
+                break
+            self._execute(job)
+
+    def _execute(self, job):
+        started = time.time()
+        jitter = started - job.due
+        job.last_jitter = jitter
+        job.max_jitter = max(job.max_jitter, jitter)
+        if jitter > JITTER_WARNING_THRESHOLD:
+            log.warning("%r started %.3fs late", job, jitter)
+
+        try:
+            job.func(*job.args, **job.kwargs)
+        except Exception:
+            log.exception("%r has failed", job)
+
+        finished = time.time()
+        job.runs += 1
+        job.last_duration = finished - started
+
+        if not job.periodic or job.cancelled:
+            return
+
+        job.due += job.interval
+        if job.due <= finished:
+            missed = int((finished - job.due) // job.interval) + 1
+            job.overruns += 1
+            job.due += missed * job.interval
+            log.warning("%r has overrun its interval (took %.3fs), skipping "
+                        "%d run(s)", job, job.last_duration, missed)
+
+        with self._condition:
+            if not self._shutdown:
+                self._push(job)
+
+    @property
+    def jobs(self):
+        with self._condition:
+            return [job for _, _, job in sorted(self._queue)
+                    if not job.cancelled]
+
+    def shutdown(self, wait=True, timeout=None):
+        """
+        Stops the scheduler thread. Pending jobs are discarded; a job which is
+        currently running is allowed to finish.
+
+        :param wait: block until the scheduler thread exits
+        :type wait: `bool`
+
+        :param timeout: maximum time to wait in seconds, `None` means no limit
+        :type timeout: `float`
+        """
+
+        with self._condition:
+            self._shutdown = True
+            del self._queue[:]
+            thread = self._thread
+            self._condition.notify()
+        if wait and thread is not None and thread is not \
+                threading.current_thread():
+            thread.join(timeout)
+
+
+# Time in seconds to wait for a running job on interpreter exit.
+EXIT_TIMEOUT = 5
+
+scheduler = Scheduler()
+
+call_later = scheduler.call_later
+
+call_every = scheduler.call_every
+
+atexit.register(scheduler.shutdown, timeout=EXIT_TIMEOUT)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+:mod:`serializers` --- Cache value serializers
+==============================================
+
+Serialized values start with a one byte tag telling how the rest of the
+data is encoded, so :func:`loads` decodes values regardless of the
+serializer which has produced them. Values pickled with protocol 2 are
+stored as they are since such pickles always start with ``\\x80``, which
+keeps data written before serializers were introduced readable.
+
+========  ===================================================
+Tag       Encoding
+========  ===================================================
+``\\x80``  :mod:`cPickle`, protocol 2
+``u``     UTF-8 encoded :class:`unicode` string
+``s``     :class:`str` byte string
+``m``     :mod:`marshal`
+``j``     :mod:`json`
+``Z``     :mod:`zlib` compressed serialized value
+``N``     :data:`NEGATIVE` entry
+========  ===================================================
+
+Usage
+-----
+
+    >>> from serializers import get_serializer, loads
+    >>> serializer = get_serializer("raw")
+    >>> serializer.dumps("Gooby pls")
+    'uGooby pls'
+    >>> loads(serializer.dumps("Gooby pls"))
+    u'Gooby pls'
+
+    Values of types a serializer doesn't support are pickled:
+
+    >>> loads(serializer.dumps((1, 2)))
+    (1, 2)
+
+    Large values may be compressed:
+
+    >>> serializer = get_serializer("pickle", compress_threshold=128)
+    >>> data = serializer.dumps("derp" * 1024)
+    >>> data[0], len(data) < 1024
+    ('Z', True)
+    >>> loads(data) == "derp" * 1024
+    True
+"""
+
+
+from __future__ import unicode_literals
+
+
+__docformat__ = "restructuredtext en"
+
+
+import json
+import marshal
+import zlib
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+PICKLE_TAG = b"\x80"
+
+UNICODE_TAG = b"u"
+
+BYTES_TAG = b"s"
+
+MARSHAL_TAG = b"m"
+
+JSON_TAG = b"j"
+
+ZLIB_TAG = b"Z"
+
+NEGATIVE_TAG = b"N"
+
+PICKLE_PROTOCOL = 2
+
+DEFAULT_COMPRESS_LEVEL = 6
+
+
+class Negative(object):
+    """
+    Type of :data:`NEGATIVE`.
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(Negative, cls).__new__(cls)
+        return cls._instance
+
+    def __reduce__(self):
+        return (Negative, ())
+
+    def __repr__(self):
+        return "NEGATIVE"
+
+
+# Cached result of a failed lookup. Unlike a miss, tells that the value is
+# known to be unavailable.
+NEGATIVE = Negative()
+
+
+class Serializer(object):
+    """
+    Base serializer. Falls back to pickle for values which can't be
+    serialized otherwise.
+    """
+
+    def __init__(self, compress_threshold=None,
+                 compress_level=DEFAULT_COMPRESS_LEVEL):
+        """
+        :param compress_threshold: minimum serialized value length in bytes
+            to try compressing it, `None` disables compression
+        :type compress_threshold: `int`
+
+        :param compress_level: zlib compression level
+        :type compress_level: `int`
+        """
+
+        self._compress_threshold = compress_threshold
+        self._compress_level = compress_level
+
+    def dumps(self, value):
+        """
+        :rtype: `str`
+        """
+
+        if value is NEGATIVE:
+            return NEGATIVE_TAG
+        data = self._dumps(value)
+        threshold = self._compress_threshold
+        if threshold is not None and len(data) >= threshold:
+            compressed = zlib.compress(data, self._compress_level)
+            if len(compressed) + 1 < len(data):
+                return ZLIB_TAG + compressed
+        return data
+
+    def _dumps(self, value):
+        return pickle.dumps(value, PICKLE_PROTOCOL)
+
+    def loads(self, data):
+        return loads(data)
+
+
+class PickleSerializer(Serializer):
+    pass
+
+
+class RawSerializer(Serializer):
+    """
+    Stores text and byte strings natively.
+    """
+
+    def _dumps(self, value):
+        if isinstance(value, unicode):
+            return UNICODE_TAG + value.encode("utf-8")
+        if isinstance(value, str):
+            return BYTES_TAG + value
+        return super(RawSerializer, self)._dumps(value)
+
+
+class MarshalSerializer(Serializer):
+    """
+    Fast serializer of built-in types. Marshal format depends on Python
+    version.
+    """
+
+    def _dumps(self, value):
+        try:
+            return MARSHAL_TAG + marshal.dumps(value)
+        except ValueError:
+            return super(MarshalSerializer, self)._dumps(value)
+
+
+class JSONSerializer(Serializer):
+    """
+    Portable serializer. Note that tuples are loaded as lists and byte
+    strings as unicode.
+    """
+
+    def _dumps(self, value):
+        try:
+            return JSON_TAG + json.dumps(value, separators=(",", ":"))
+        except (TypeError, ValueError):
+            return super(JSONSerializer, self)._dumps(value)
+
+
+def loads(data):
+    """
+    Decodes a value serialized by any of the serializers. Integers are
+    returned as they are, since cache backends store counters natively.
+
+    >>> loads(42)
+    42
+
+    :param data: serialized value
+    :type data: `str`, `buffer` or `int`
+    """
+
+    if isinstance(data, (int, long)):
+        return data
+    data = str(data)
+    tag = data[:1]
+    if tag == PICKLE_TAG:
+        return pickle.loads(data)
+    if tag == UNICODE_TAG:
+        return data[1:].decode("utf-8")
+    if tag == BYTES_TAG:
+        return data[1:]
+    if tag == ZLIB_TAG:
+        return loads(zlib.decompress(data[1:]))
+    if tag == MARSHAL_TAG:
+        return marshal.loads(data[1:])
+    if tag == JSON_TAG:
+        return json.loads(data[1:])
+    if tag == NEGATIVE_TAG:
+        return NEGATIVE
+    # Pickles of older protocols have no distinctive header.
+    return pickle.loads(data)
+
+
+SERIALIZERS = {
+    "pickle": PickleSerializer,
+    "raw": RawSerializer,
+    "marshal": MarshalSerializer,
+    "json": JSONSerializer,
+}
+
+
+def get_serializer(serializer="pickle", **kwargs):
+    """
+    :param serializer: serializer name, see :data:`SERIALIZERS`, or
+        serializer object
+    :type serializer: `unicode` or :class:`Serializer`
+
+    :param kwargs: serializer keyword arguments, unless a serializer object
+        is given
+
+    :rtype: :class:`Serializer`
+    """
+
+    if isinstance(serializer, Serializer):
+        return serializer
+    try:
+        klass = SERIALIZERS[serializer]
+    except KeyError:
+        raise ValueError("Unknown serializer: {0}".format(serializer))
+    return klass(**kwargs)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+:mod:`textanalysis` --- Shared message text analysis
+====================================================
+
+Plugins handling the same message tend to lowercase, split and strip its
+text all over again. :func:`analyze` attaches a :class:`TextAnalysis` to the
+message instead, every view of which is computed on first access and shared
+with every other plugin handling the message afterwards.
+
+    >>> from textanalysis import TextAnalysis
+    >>> analysis = TextAnalysis("Губи, ПЛС! Рики-тики-тави")
+    >>> print analysis.lower
+    губи, плс! рики-тики-тави
+    >>> print " ".join(analysis.stripped_tokens)
+    Губи ПЛС Рики-тики-тави
+    >>> part = analysis.parts[2][1]
+    >>> print part, analysis.vowel_counts[part]
+    тики 2
+"""
+
+
+from __future__ import unicode_literals
+
+
+__docformat__ = "restructuredtext en"
+
+
+import string
+from collections import Counter
+
+from utils import cached_property
+
+
+VOWELS = "аеёиоуыэюя"
+
+# Characters stripped off the tokens ends.
+PUNCTUATION = "—" + string.punctuation
+
+# Token parts are split by punctuation, e.g. "рики-тики-тави".
+_PARTS_TRANSLATION = dict((ord(char), " ") for char in string.punctuation)
+
+# Name of the message attribute the analysis is attached to.
+ATTRIBUTE = "_text_analysis"
+
+
+class TextAnalysis(object):
+    """
+    Lazily computed views of a text. Every view is computed once.
+    """
+
+    def __init__(self, text):
+        """
+        :param text: text to analyze
+        :type text: `unicode`
+        """
+
+        self.text = text
+
+    @cached_property
+    def lower(self):
+        """Lowercased text."""
+
+        return self.text.lower()
+
+    @cached_property
+    def tokens(self):
+        """Whitespace separated tokens."""
+
+        return self.text.split()
+
+    @cached_property
+    def stripped_tokens(self):
+        """Tokens stripped of leading and trailing punctuation."""
+
+        return [token.strip(PUNCTUATION) for token in self.tokens]
+
+    @cached_property
+    def parts(self):
+        """Stripped tokens split by punctuation, a list per token."""
+
+        return [token.translate(_PARTS_TRANSLATION).split()
+                for token in self.stripped_tokens]
+
+    @cached_property
+    def char_counts(self):
+        """:class:`~collections.Counter` of the text characters."""
+
+        return Counter(self.text)
+
+    @cached_property
+    def vowel_counts(self):
+        """Number of vowels in every token part, by part."""
+
+        return dict((part, sum(1 for char in part.lower() if char in VOWELS))
+                    for parts in self.parts for part in parts)
+
+
+def analyze(message):
+    """
+    Returns the analysis of a message body, attaching it to the message on
+    first call. A new analysis is made if the body has changed since.
+
+    >>> class Message(object):
+    ...     Body = "Herp derp"
+    >>> message = Message()
+    >>> analyze(message) is analyze(message)
+    True
+    >>> message.Body = "Gooby pls"
+    >>> analyze(message).tokens
+    [u'Gooby', u'pls']
+
+    :param message: Skype4Py message or any other object having `Body`
+
+    :rtype: :class:`TextAnalysis`
+    """
+
+    text = message.Body
+    analysis = getattr(message, ATTRIBUTE, None)
+    if analysis is None or analysis.text != text:
+        analysis = TextAnalysis(text)
+        try:
+            setattr(message, ATTRIBUTE, analysis)
+        except (AttributeError, TypeError):
+            pass
+    return analysis
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -11,7 +11,7 @@
 __docformat__ = "restructuredtext en"
 
 __all__ = ["camelcase_to_underscore", "retry_on_exception",
-           "get_current_file_path", ]
+           "cached_property", "get_current_file_path", ]
 
 
 import os
@@ -93,6 +93,39 @@ class retry_on_exception(object):
         return wrapper
 
 
+class cached_property(object):
+    """
+    Decorator.
+
+    Turns a method into a property computed on first access only. The value
+    is stored in the instance dictionary, which shadows the property from
+    then on.
+
+    >>> class Test(object):
+    ...     @cached_property
+    ...     def answer(self):
+    ...         print "computing"
+    ...         return 42
+    >>> test = Test()
+    >>> test.answer
+    computing
+    42
+    >>> test.answer
+    42
+    """
+
+    def __init__(self, func):
+        self._func = func
+        self.__name__ = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        value = obj.__dict__[self.__name__] = self._func(obj)
+        return value
+
+
 def get_current_file_path():
     """
     py2exe / py2app workaround. Returns current file path based on script's
@@ -0,0 +1,474 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+:mod:`workers` --- Shared worker thread pool
+============================================
+
+A bounded thread pool along with a minimal future implementation. Allows
+event handlers to offload slow work (network requests, etc.) and return
+immediately instead of blocking Skype4Py event threads. CPU bound work,
+which would hold the GIL and stall every thread anyway, is offloaded to a
+pool of worker processes instead.
+
+Usage
+-----
+
+    >>> from workers import WorkerPool
+    >>> pool = WorkerPool(max_workers=2)
+    >>> future = pool.submit(sum, [1, 2, 3])
+    >>> future.result(timeout=5)
+    6
+    >>> pool.shutdown()
+"""
+
+
+from __future__ import unicode_literals
+
+
+__docformat__ = "restructuredtext en"
+
+
+import sys
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+import traceback
+import Queue
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from errors import WorkerError, FutureTimeoutError
+
+
+log = logging.getLogger("Gooby.Workers")
+
+
+DEFAULT_MAX_WORKERS = 4
+
+# Maximum number of pending jobs. Submitting into a full queue fails instead
+# of blocking the caller.
+DEFAULT_MAX_QUEUE_SIZE = 256
+
+DEFAULT_MAX_PROCESSES = 2
+
+# Time in seconds a worker process job may take. Jobs of killed worker
+# processes never finish otherwise.
+DEFAULT_JOB_TIMEOUT = 300
+
+
+class Future(object):
+    """
+    Result placeholder of an asynchronous call.
+
+    >>> future = Future()
+    >>> future.done()
+    False
+    >>> future.set_result(42)
+    >>> future.done()
+    True
+    >>> future.result()
+    42
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._done = False
+        self._result = None
+        self._exc_info = None
+        self._callbacks = list()
+
+    def done(self):
+        return self._done
+
+    def _wait(self, timeout):
+        with self._condition:
+            if not self._done:
+                self._condition.wait(timeout)
+            if not self._done:
+                raise FutureTimeoutError(
+                    "Result is not available in {0} second(s)".format(timeout))
+
+    def result(self, timeout=None):
+        """
+        Returns call result, waiting up to `timeout` seconds for it. Re-raises
+        an exception if the call has failed.
+
+        :raises: :class:`~errors.FutureTimeoutError` if result is not
+            available in time
+        """
+
+        self._wait(timeout)
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        self._wait(timeout)
+        if self._exc_info is not None:
+            return self._exc_info[1]
+        return None
+
+    def add_done_callback(self, callback):
+        """
+        Attaches a callable which is called with the future object as its only
+        argument once the future is done. Called immediately if the future is
+        already done.
+        """
+
+        with self._condition:
+            if not self._done:
+                self._callbacks.append(callback)
+                return
+        self._invoke(callback)
+
+    def set_result(self, result):
+        self._finish(result, None)
+
+    def set_exception(self, exc_info):
+        """
+        :param exc_info: exception information as returned by
+            :func:`sys.exc_info`, so that the original traceback is kept
+        :type exc_info: `tuple`
+        """
+
+        self._finish(None, exc_info)
+
+    def _finish(self, result, exc_info):
+        with self._condition:
+            self._result = result
+            self._exc_info = exc_info
+            self._done = True
+            self._condition.notify_all()
+            callbacks, self._callbacks = self._callbacks, list()
+        for callback in callbacks:
+            self._invoke(callback)
+
+    def _invoke(self, callback):
+        try:
+            callback(self)
+        except Exception:
+            log.exception("Future callback %r has failed", callback)
+
+    def __repr__(self):
+        state = "finished" if self._done else "pending"
+        return "<Future at {0:#x} {1}>".format(id(self), state)
+
+
+class WorkerPool(object):
+    """
+    Fixed-size thread pool with a bounded job queue. Worker threads are
+    spawned on demand up to `max_workers`.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS,
+                 max_queue_size=DEFAULT_MAX_QUEUE_SIZE, name="Worker"):
+        """
+        :param max_workers: maximum number of worker threads
+        :type max_workers: `int`
+
+        :param max_queue_size: maximum number of pending jobs
+        :type max_queue_size: `int`
+
+        :param name: worker thread name prefix
+        :type name: `unicode`
+        """
+
+        assert max_workers > 0
+
+        self._max_workers = max_workers
+        self._name = name
+        self._queue = Queue.Queue(max_queue_size)
+        self._threads = list()
+        self._idle = 0
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Schedules ``func(*args, **kwargs)`` to be executed by a worker thread.
+
+        :returns: future object
+        :rtype: :class:`Future`
+
+        :raises: :class:`~errors.WorkerError` if the pool has been shut down
+            or its queue is full
+        """
+
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise WorkerError("Worker pool has been shut down")
+            try:
+                self._queue.put_nowait((future, func, args, kwargs))
+            except Queue.Full:
+                raise WorkerError("Worker pool queue is full")
+            self._spawn()
+        return future
+
+    def _spawn(self):
+        if self._idle or len(self._threads) >= self._max_workers:
+            return
+        name = "{0}-{1}".format(self._name, len(self._threads) + 1)
+        thread = threading.Thread(target=self._work, name=name)
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+    def _work(self):
+        while 1:
+            with self._lock:
+                self._idle += 1
+            item = self._queue.get()
+            with self._lock:
+                self._idle -= 1
+            if item is None:
+                break
+            future, func, args, kwargs = item
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                future.set_exception(sys.exc_info())
+            else:
+                future.set_result(result)
+            del future, func, args, kwargs, item
+
+    def shutdown(self, wait=True):
+        """
+        Stops accepting new jobs. Already queued jobs are still executed.
+
+        :param wait: block until every worker thread exits
+        :type wait: `bool`
+        """
+
+        with self._lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+            threads = self._threads[:]
+        for _ in threads:
+            self._queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+
+def _call_pickled(func, args, kwargs):
+    # Executed in a worker process. The result is pickled here, so failing
+    # to pickle it is reported like any other error, and exceptions are
+    # returned formatted since tracebacks can't be pickled.
+    try:
+        result = func(*args, **kwargs)
+        return pickle.dumps(result, pickle.HIGHEST_PROTOCOL), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+class ProcessPool(object):
+    """
+    Pool of worker processes with a bounded number of pending jobs. The
+    processes are started on first use, so applications which never submit
+    a job don't fork any.
+
+    Jobs are passed to processes pickled, so functions must be defined at
+    module level, and their arguments and return values must be picklable.
+    Jobs which take longer than `timeout`, e.g. because their process has
+    been killed, are failed by a watchdog thread.
+
+    >>> pool = ProcessPool(max_processes=1)
+    >>> pool.submit(pow, 2, 10).result(timeout=5)
+    1024
+    >>> pool.shutdown()
+    """
+
+    def __init__(self, max_processes=DEFAULT_MAX_PROCESSES,
+                 max_queue_size=DEFAULT_MAX_QUEUE_SIZE,
+                 timeout=DEFAULT_JOB_TIMEOUT):
+        """
+        :param max_processes: number of worker processes
+        :type max_processes: `int`
+
+        :param max_queue_size: maximum number of pending jobs
+        :type max_queue_size: `int`
+
+        :param timeout: time in seconds a job may take, `None` means no
+            limit
+        :type timeout: `float`
+        """
+
+        assert max_processes > 0
+
+        self._max_processes = max_processes
+        self._max_queue_size = max_queue_size
+        self._timeout = timeout
+        self._pool = None
+        self._watchdog = None
+        # Maps pending job ids to their futures and deadlines.
+        self._jobs = dict()
+        # Ids of failed jobs which have not returned, maybe never will.
+        self._lost = set()
+        self._ids = itertools.count()
+        self._condition = threading.Condition()
+        self._shutdown = False
+
+    def _start(self):
+        if self._pool is not None:
+            return
+        self._pool = multiprocessing.Pool(self._max_processes)
+        if self._timeout is not None:
+            self._watchdog = threading.Thread(target=self._watch,
+                                              name="ProcessPool-Watchdog")
+            self._watchdog.daemon = True
+            self._watchdog.start()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Schedules ``func(*args, **kwargs)`` to be executed by a worker
+        process. Exceptions raised by the call are re-raised by the future as
+        :class:`~errors.WorkerError` including the original traceback.
+
+        :returns: future object
+        :rtype: :class:`Future`
+
+        :raises: :class:`~errors.WorkerError` if the pool has been shut down,
+            its queue is full or the job can't be pickled
+        """
+
+        try:
+            pickle.dumps((func, args, kwargs), pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            raise WorkerError("Unable to pickle job: {0!r}".format(e))
+        future = Future()
+        with self._condition:
+            if self._shutdown:
+                raise WorkerError("Process pool has been shut down")
+            if len(self._jobs) >= self._max_queue_size:
+                raise WorkerError("Process pool queue is full")
+            self._start()
+            job = next(self._ids)
+            deadline = None
+            if self._timeout is not None:
+                deadline = time.time() + self._timeout
+            self._jobs[job] = future, deadline
+            self._condition.notify()
+            self._pool.apply_async(
+                _call_pickled, (func, args, kwargs),
+                callback=lambda outcome: self._finish(job, outcome))
+        return future
+
+    def _finish(self, job, outcome):
+        with self._condition:
+            item = self._jobs.pop(job, None)
+            if item is None:
+                # Failed by the watchdog already.
+                self._lost.discard(job)
+                return
+            # Lets the watchdog stop waiting for the deadline of this job.
+            self._condition.notify()
+        future = item[0]
+        data, error = outcome
+        if error is None:
+            future.set_result(pickle.loads(data))
+            return
+        try:
+            raise WorkerError("Worker process job has failed:\n" + error)
+        except WorkerError:
+            future.set_exception(sys.exc_info())
+
+    def _watch(self):
+        while 1:
+            with self._condition:
+                if self._shutdown and not self._jobs:
+                    return
+                now = time.time()
+                expired = [job for job, (_, deadline) in self._jobs.items()
+                           if deadline <= now]
+                futures = [self._jobs.pop(job)[0] for job in expired]
+                self._lost.update(expired)
+                if not futures:
+                    deadlines = [deadline for _, deadline in
+                                 self._jobs.values()]
+                    timeout = min(deadlines) - now if deadlines else None
+                    self._condition.wait(timeout)
+                    continue
+            for future in futures:
+                try:
+                    raise WorkerError("Worker process job has timed out "
+                                      "after {0}s".format(self._timeout))
+                except WorkerError:
+                    future.set_exception(sys.exc_info())
+
+    def shutdown(self, wait=True):
+        """
+        Stops accepting new jobs. Already queued jobs are still executed,
+        unless a job has timed out: its process may have been killed, and
+        the pool would wait for it forever, so the processes are terminated
+        instead.
+
+        :param wait: block until every worker process exits
+        :type wait: `bool`
+        """
+
+        with self._condition:
+            if self._shutdown:
+                return
+            self._shutdown = True
+            self._condition.notify()
+            pool = self._pool
+            lost = bool(self._lost)
+        if pool is None:
+            return
+        if lost:
+            log.warning("Terminating worker processes, some jobs are lost")
+            pool.terminate()
+        else:
+            pool.close()
+        if wait:
+            pool.join()
+
+
+def gather(futures, timeout=None):
+    """
+    Waits for every future to finish and returns their results in order.
+
+    >>> futures = [Future(), Future()]
+    >>> for i, future in enumerate(futures):
+    ...     future.set_result(i)
+    >>> gather(futures, timeout=1)
+    [0, 1]
+
+    :param timeout: total time to wait in seconds, `None` means no limit
+    :type timeout: `float`
+
+    :raises: :class:`~errors.FutureTimeoutError` if not every result is
+        available in time; exception of the first failed call otherwise
+    """
+
+    deadline = None if timeout is None else time.time() + timeout
+    results = list()
+    for future in futures:
+        remaining = None
+        if deadline is not None:
+            remaining = max(0, deadline - time.time())
+        results.append(future.result(remaining))
+    return results
+
+
+worker_pool = WorkerPool()
+
+submit = worker_pool.submit
+
+process_pool = ProcessPool()
+
+submit_process = process_pool.submit
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+:mod:`benchmark_dispatcher` --- Signal dispatcher benchmark
+===========================================================
+
+Measures connect, send and garbage collection cleanup costs at thousands of
+weakly connected receivers, and connect and disconnect costs of strongly
+connected ones. Quadratic implementations take seconds where linear ones
+take milliseconds.
+
+Not a unit test, run it manually::
+
+    python tests/benchmark_dispatcher.py [receivers]
+"""
+
+
+from __future__ import unicode_literals
+
+
+__docformat__ = "restructuredtext en"
+
+
+import os
+import sys
+from timeit import default_timer
+
+path = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "gooby")
+sys.path.insert(0, path)
+
+from dispatcher import dispatcher  # noqa
+
+
+SIGNAL = "benchmark_signal"
+
+
+class Receiver(object):
+
+    def receive(self, value):
+        return value
+
+
+def report(operation, count, started):
+    elapsed = default_timer() - started
+    print "{0:>22}: {1:.3f}s for {2} receivers".format(
+        operation, elapsed, count)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    receivers = [Receiver() for _ in xrange(count)]
+    started = default_timer()
+    for receiver in receivers:
+        dispatcher.connect(receiver.receive, SIGNAL)
+    report("connect", count, started)
+    del receiver
+
+    started = default_timer()
+    responses = dispatcher.send(SIGNAL, 42)
+    report("send", count, started)
+    assert responses == [42] * count
+
+    started = default_timer()
+    del receivers[:]
+    report("cleanup", count, started)
+    assert not dispatcher.connections
+
+    receivers = [Receiver() for _ in xrange(count)]
+    started = default_timer()
+    for receiver in receivers:
+        dispatcher.connect(receiver.receive, SIGNAL, False)
+    for receiver in receivers:
+        dispatcher.disconnect(receiver.receive, SIGNAL)
+    report("connect and disconnect", count, started)
+    assert not dispatcher.connections
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+:mod:`benchmark_textpipeline` --- Summary generator text pipeline benchmark
+===========================================================================
+
+Normalizes a synthetic chat corpus with quotes, links and timestamps using
+:class:`~plugins.summarygenerator.TextPipeline` and with the multi-pass
+approach, which joins and splits the text again after every word filter.
+
+Not a unit test, run it manually::
+
+    python tests/benchmark_textpipeline.py [messages]
+"""
+
+
+from __future__ import unicode_literals
+
+
+__docformat__ = "restructuredtext en"
+
+
+import os
+import sys
+import random
+from timeit import default_timer
+
+path = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "gooby")
+sys.path.insert(0, path)
+
+from plugins.summarygenerator import (  # noqa
+    TextPipeline,
+    SENTENCE_PREFILTERS,
+    WORD_FILTERS,
+    SENTENCE_POSTFILTERS,
+)
+
+
+WORDS = ("губи", "пожалуйста", "херп", "дерп", "ходил", "рофл", "gooby",
+         "pls", "herp", "derp", "lol", "wat", "kappa", "smth", "...", "!!",
+         "http://example.com/derp", "www.example.org", "<<<", "»", "©")
+
+MEMBERS = ["Gooby", "Dolan", "gooby.pls", "dolan_duk"]
+
+
+def make_message(rnd):
+    text = " ".join(rnd.choice(WORDS) for _ in xrange(rnd.randint(3, 20)))
+    kind = rnd.randint(0, 4)
+    if kind == 0:
+        return "[{0:02d}:{1:02d}:{2:02d}] {3}".format(
+            rnd.randint(0, 23), rnd.randint(0, 59), rnd.randint(0, 59), text)
+    if kind == 1:
+        return "{0}: {1}".format(rnd.choice(MEMBERS), text)
+    if kind == 2:
+        return "[04:14:19] Dolan: {0}\n\n<<< {1}".format(
+            text, rnd.choice(WORDS))
+    return text
+
+
+def multi_pass(text, **kwargs):
+    for f in SENTENCE_PREFILTERS:
+        text = f(text, **kwargs)
+    for f in WORD_FILTERS:
+        text = " ".join(filter(None, [f(w) for w in text.split()]))
+    for f in SENTENCE_POSTFILTERS:
+        text = f(text)
+    return text
+
+
+def run(name, func, corpus):
+    started = default_timer()
+    output = [func(text, chat_members=MEMBERS) for text in corpus]
+    elapsed = default_timer() - started
+    print "{0:>12}: {1:.0f} messages/s".format(name, len(corpus) / elapsed)
+    return output
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rnd = random.Random(42)
+    corpus = [make_message(rnd) for _ in xrange(count)]
+
+    pipeline = TextPipeline()
+    expected = run("multi-pass", multi_pass, corpus)
+    output = run("pipeline", pipeline, corpus)
+    assert output == expected
+    print "{0:>12}: {1}".format("stages", pipeline.format_timings())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+:mod:`test_cache` --- Caching facility unit tests
+=================================================
+"""
+
+
+from __future__ import unicode_literals
+
+
+__docformat__ = "restructuredtext en"
+
+
+import os
+import unittest
+import tempfile
+import shutil
+import threading
+import time
+
+import tests
+from gooby import cache
+
+
+def run_threads(target, count=4):
+    errors = []
+
+    def wrapper(n):
+        try:
+            target(n)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=wrapper, args=(n,))
+               for n in xrange(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+class SQLiteCacheTestCase(unittest.TestCase):
+    kwargs = dict()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        location = os.path.join(self.tmp_dir, "test_db.sqlite")
+        self.cache = cache.SQLiteCache(location, **self.kwargs)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_concurrent_incr(self):
+        def worker(n):
+            for i in xrange(300):
+                self.cache.incr("counter")
+                self.cache.get_or_add("key_{0}".format(i % 10), i)
+                self.cache.set("{0}_{1}".format(n, i % 10), i)
+
+        self.assertEqual(run_threads(worker), [])
+        self.assertEqual(self.cache.get("counter"), 1200)
+        self.assertEqual(self.cache.get("key_3"), 3)
+
+    def test_concurrent_batch_writes(self):
+        def worker(n):
+            for i in xrange(300):
+                self.cache.set_many({"{0}_a".format(n): i,
+                                     "{0}_b".format(n): i})
+                self.cache.incr("counter")
+                self.cache.delete_many(["{0}_b".format(n)])
+
+        self.assertEqual(run_threads(worker), [])
+        self.assertEqual(self.cache.get("counter"), 1200)
+        self.assertEqual(self.cache.get_many(["0_a", "0_b", "3_a"]),
+                         {"0_a": 299, "3_a": 299})
+
+
+    def test_get_or_compute_many(self):
+        self.cache.set("a", 1)
+        self.cache.set_negative("c")
+        loaded = []
+        looked_up = []
+        get = self.cache.get
+
+        def loader(key):
+            loaded.append(key)
+            return key * 2 if key != "d" else None
+
+        def counting_get(key):
+            looked_up.append(key)
+            return get(key)
+
+        self.cache.get = counting_get
+        values = self.cache.get_or_compute_many(["a", "b", "c", "d"], loader)
+        self.assertEqual(values, {"a": 1, "b": "bb", "c": cache.NEGATIVE})
+        self.assertEqual(loaded, ["b", "d"])
+        # Stored values are not looked up one by one.
+        self.assertEqual(looked_up, ["b", "d"])
+        self.assertEqual(self.cache.get_or_compute_many(["b"], loader),
+                         {"b": "bb"})
+        self.assertEqual(loaded, ["b", "d"])
+
+
+class SQLiteCacheInMemoryTestCase(SQLiteCacheTestCase):
+    def setUp(self):
+        self.cache = cache.SQLiteCache()
+
+    def tearDown(self):
+        self.cache.close()
+
+
+class SQLiteCacheWriteBehindTestCase(SQLiteCacheTestCase):
+    kwargs = dict(write_behind=True, flush_size=7)
+
+
+class MemoizeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache = cache.SimpleCache()
+        self.calls = []
+
+        @cache.memoize(cache=self.cache)
+        def echo(*args, **kwargs):
+            self.calls.append(args)
+            return args
+
+        self.echo = echo
+
+    def test_non_ascii_arguments(self):
+        self.assertEqual(self.echo("губи"), ("губи", ))
+        self.assertEqual(self.echo("губи", "плс"), ("губи", "плс"))
+        self.assertEqual(self.echo("губи".encode("utf-8"), x="плс"),
+                         ("губи".encode("utf-8"), ))
+        self.assertEqual(self.echo("губи"), ("губи", ))
+        self.assertEqual(len(self.calls), 3)
+        self.assertIn("echo:губи", self.cache)
+
+    def test_argument_types_are_distinguished(self):
+        self.assertEqual(self.echo(3), (3, ))
+        self.assertEqual(self.echo("3"), ("3", ))
+        self.assertEqual(self.echo(3, "a"), (3, "a"))
+        self.assertEqual(self.echo("3", "a"), ("3", "a"))
+        self.assertEqual(len(self.calls), 4)
+        self.assertEqual(self.echo(3), (3, ))
+        self.assertEqual(len(self.calls), 4)
+
+
+class TieredCacheTestCase(unittest.TestCase):
+    @staticmethod
+    def make(**kwargs):
+        return cache.TieredCache(persistent_backend=cache.SQLiteCache,
+                                 **kwargs)
+
+    def test_lru_eviction(self):
+        tiered = self.make(max_entries=2)
+        tiered.set("a", 1)
+        tiered.set("b", 2)
+        self.assertEqual(tiered.get("a"), 1)
+        tiered.set("c", 3)
+        self.assertEqual(sorted(tiered._memory.keys()), ["a", "c"])
+        # Evicted values are still found in the backend.
+        self.assertEqual(tiered.get("b"), 2)
+        self.assertEqual(tiered.stats()["backend"]["hits"], 1)
+        self.assertEqual(tiered.stats()["memory"]["entries"], 2)
+
+    def test_concurrent_stats(self):
+        tiered = self.make()
+
+        def miss():
+            for i in xrange(50):
+                tiered.get(i)
+
+        threads = [threading.Thread(target=miss) for _ in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = tiered.stats()
+        self.assertEqual(stats["memory"]["misses"], 200)
+        self.assertEqual(stats["backend"]["misses"], 200)
+
+    def test_unbounded(self):
+        tiered = self.make(max_entries=None)
+        for i in xrange(100):
+            tiered.set(i, i)
+        self.assertEqual(len(tiered._memory), 100)
+        self.assertEqual(tiered.get(42), 42)
+
+    def test_max_bytes(self):
+        tiered = self.make(max_entries=None, max_bytes=64,
+                           serializer="raw")
+        tiered.set("a", "x" * 40)
+        tiered.set("b", "y" * 40)
+        self.assertEqual(tiered._memory.keys(), ["b"])
+        self.assertLessEqual(tiered.stats()["memory"]["bytes"], 64)
+        self.assertEqual(tiered.get("a"), "x" * 40)
+
+    def test_memory_expiration(self):
+        tiered = self.make(write_back=True)
+        tiered.set("a", 1, timeout=-1)
+        self.assertIsNone(tiered.get("a"))
+        self.assertEqual(tiered._dirty, {})
+        tiered.flush()
+        self.assertIsNone(tiered.backend.get("a"))
+
+    def test_write_back_eviction(self):
+        tiered = self.make(max_entries=1, write_back=True)
+        tiered.set("a", 1)
+        self.assertNotIn("a", tiered.backend)
+        tiered.set("b", 2)
+        self.assertEqual(tiered.backend.get("a"), 1)
+        self.assertNotIn("b", tiered.backend)
+
+    def test_flush(self):
+        tiered = self.make(write_back=True, flush_interval=0)
+        tiered.set("a", 1)
+        tiered.set_many({"b": 2, "c": 3})
+        self.assertTrue(tiered.flush_is_due())
+        tiered.flush()
+        self.assertFalse(tiered.flush_is_due())
+        self.assertEqual(tiered.backend.get_many(["a", "b", "c"]),
+                         {"a": 1, "b": 2, "c": 3})
+
+    def test_incr_writes_pending_value_through(self):
+        tiered = self.make(write_back=True)
+        tiered.set("counter", 1)
+        self.assertEqual(tiered.incr("counter", 2), 3)
+        self.assertEqual(tiered.backend.get("counter"), 3)
+        self.assertEqual(tiered.get("counter"), 3)
+
+    def test_stale_while_revalidate(self):
+        tiered = self.make(default_timeout=3600, refresh_after=-1)
+        tiered.set("a", 1)
+        loading = threading.Event()
+        calls = []
+
+        def loader():
+            calls.append(None)
+            loading.wait()
+            return 2
+
+        # Stale value is returned while it is being refreshed, only once.
+        self.assertEqual(tiered.get_or_compute("a", loader), 1)
+        refresh = tiered._refreshing["a"]
+        self.assertEqual(tiered.get_or_compute("a", loader), 1)
+        loading.set()
+        refresh.result(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(tiered.get("a"), 2)
+        self.assertEqual(tiered.backend.get("a"), 2)
+
+    def test_stale_while_revalidate_many(self):
+        tiered = self.make(default_timeout=3600, refresh_after=-1)
+        tiered.set("a", 1)
+        # Found by the backend query only.
+        tiered.backend.set("b", 2)
+        loading = threading.Event()
+
+        def loader(key):
+            if key != "c":
+                loading.wait()
+            return key * 2
+
+        # Stale values are returned right away, missing ones are computed.
+        self.assertEqual(tiered.get_or_compute_many(["a", "b", "c"], loader),
+                         {"a": 1, "b": 2, "c": "cc"})
+        refreshes = [tiered._refreshing["a"], tiered._refreshing["b"]]
+        self.assertNotIn("c", tiered._refreshing)
+        loading.set()
+        for refresh in refreshes:
+            refresh.result(5)
+        self.assertEqual(tiered.get_many(["a", "b", "c"]),
+                         {"a": "aa", "b": "bb", "c": "cc"})
+
+    def test_failed_refresh_keeps_stale_value(self):
+        tiered = self.make(default_timeout=3600, refresh_after=60)
+        tiered.set("a", 1)
+        tiered._refresh("a", lambda: None, None)
+        self.assertEqual(tiered.get("a"), 1)
+        expires, (value, _, refresh_at) = tiered._memory.peek("a")
+        self.assertGreater(refresh_at, time.time() + 30)
+        self.assertEqual(tiered.get_or_compute("a", lambda: 2), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -19,10 +19,17 @@ import time
 import tempfile
 import shutil
 import datetime
+import threading
+import sqlite3
 from itertools import izip, imap
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 
 from tests import *
 from gooby import cache_new
+from gooby.serializers import NEGATIVE
 
 
 class CacheTestCase(unittest.TestCase):
@@ -133,6 +140,154 @@ class CacheTestCase(unittest.TestCase):
         cached_sequence = [item for item in self.cache]
         self.assertSequenceEqual(sorted(cached_sequence), sorted(sequence))
 
+    def test_get_many(self):
+        self.cache.set('derp', 42)
+        self.cache.set('k', 'v')
+        self.cache.set('expired', 'v', timeout=-1)
+        self.assertEqual(self.cache.get_many(['derp', 'k', 'expired', 'x']),
+                         {'derp': 42, 'k': 'v'})
+        self.assertEqual(self.cache.get_many([]), {})
+
+    def test_set_many(self):
+        self.cache.set('derp', 42)
+        self.cache.set_many({'derp': 'herp', 'k': 'v'})
+        self.assertEqual(self.cache.get('derp'), 'herp')
+        self.assertEqual(self.cache.get('k'), 'v')
+        self.cache.set_many({'expired': 'v'}, timeout=-1)
+        self.assertIsNone(self.cache.get('expired'))
+
+    def test_delete_many(self):
+        self.cache.set_many({'derp': 42, 'k': 'v', 'herp': 'derp'})
+        self.cache.delete_many(['derp', 'k', 'x'])
+        self.assertEqual(self.cache.get_many(['derp', 'k', 'herp']),
+                         {'herp': 'derp'})
+
+    def test_get_or_compute(self):
+        self.assertEqual(self.cache.get_or_compute('derp', lambda: 42), 42)
+        self.assertEqual(self.cache.get_or_compute('derp', lambda: 'herp'),
+                         42)
+        self.assertIsNone(self.cache.get_or_compute('none', lambda: None))
+        self.assertNotIn('none', self.cache)
+
+    def test_set_negative(self):
+        self.cache.set_negative('derp')
+        self.assertIs(self.cache.get('derp'), NEGATIVE)
+        self.assertEqual(self.cache.get_many(['derp', 'x']),
+                         {'derp': NEGATIVE})
+        self.cache.set_negative('expired', timeout=-1)
+        self.assertIsNone(self.cache.get('expired'))
+
+    def test_get_or_compute_negative(self):
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return NEGATIVE
+
+        self.assertIs(self.cache.get_or_compute('derp', loader), NEGATIVE)
+        self.assertIs(self.cache.get_or_compute('derp', loader), NEGATIVE)
+        self.assertEqual(len(calls), 1)
+
+    def test_negative_timeout(self):
+        self.cache._negative_timeout = 0.1
+        self.cache.set_negative('derp')
+        self.assertIs(self.cache.get('derp'), NEGATIVE)
+        time.sleep(0.2)
+        self.assertIsNone(self.cache.get('derp'))
+
+    def _compute_concurrently(self, loader, count=8, **kwargs):
+        results = []
+
+        def worker():
+            try:
+                results.append(
+                    self.cache.get_or_compute('derp', loader, **kwargs))
+            except Exception as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in xrange(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_get_or_compute_single_flight(self):
+        calls = []
+
+        def loader():
+            calls.append(1)
+            time.sleep(0.2)
+            return 42
+
+        self.assertEqual(self._compute_concurrently(loader), [42] * 8)
+        self.assertEqual(len(calls), 1)
+
+    def test_get_or_compute_shares_exception(self):
+        calls = []
+
+        def loader():
+            calls.append(1)
+            time.sleep(0.2)
+            raise ValueError('derp')
+
+        results = self._compute_concurrently(loader)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+        self.assertEqual(self.cache.get_or_compute('derp', lambda: 42), 42)
+
+    def test_get_or_compute_wait_is_bounded(self):
+        calls = []
+
+        def loader():
+            calls.append(1)
+            time.sleep(0.3)
+            return 42
+
+        results = self._compute_concurrently(loader, count=2, wait=0.05)
+        self.assertEqual(results, [42, 42])
+        self.assertEqual(len(calls), 2)
+
+    def test_get_or_add(self):
+        self.assertEqual(self.cache.get_or_add('derp', 42), 42)
+        self.assertEqual(self.cache.get_or_add('derp', 'herp'), 42)
+        self.assertEqual(self.cache.get('derp'), 42)
+        self.cache.set('expired', 'v', timeout=-1)
+        self.assertEqual(self.cache.get_or_add('expired', 'new'), 'new')
+        self.assertEqual(self.cache.get('expired'), 'new')
+
+    def test_incr(self):
+        self.assertEqual(self.cache.incr('counter'), 1)
+        self.assertEqual(self.cache.incr('counter', 10), 11)
+        self.assertEqual(self.cache.decr('counter', 2), 9)
+        self.assertEqual(self.cache.get('counter'), 9)
+        self.cache.set('derp', 41)
+        self.assertEqual(self.cache.incr('derp'), 42)
+        self.cache.set('expired', 41, timeout=-1)
+        self.assertEqual(self.cache.incr('expired'), 1)
+        self.cache.set('derp', 'herp')
+        self.assertRaises(ValueError, self.cache.incr, 'derp')
+
+    def test_incr_keeps_expiration(self):
+        self.cache.incr('counter', timeout=-1)
+        self.assertIsNone(self.cache.get('counter'))
+        self.cache.incr('counter', timeout=0.1)
+        self.cache.incr('counter', timeout=600)
+        time.sleep(0.2)
+        self.assertIsNone(self.cache.get('counter'))
+
+    def test_concurrent_incr(self):
+        def worker():
+            for _ in xrange(50):
+                self.cache.incr('counter')
+
+        threads = [threading.Thread(target=worker) for _ in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+
 
 class SimpleCacheTestCase(CacheTestCase):
     klass = cache_new.SimpleCache
@@ -142,6 +297,102 @@ class SimpleCacheZeroDefaultTimeoutTestCase(SimpleCacheTestCase):
     kwargs = {'timeout': 0}
 
 
+class SimpleCacheBoundedTestCase(SimpleCacheTestCase):
+    kwargs = {'max_entries': 100, 'max_bytes': 64 * 1024}
+
+    def test_lru_eviction(self):
+        for i in xrange(100):
+            self.cache.set(unicode(i), i)
+        self.assertEqual(self.cache.get('0'), 0)
+        self.cache.set('100', 100)
+        self.assertEqual(len(self.cache), 100)
+        self.assertIn('0', self.cache)
+        self.assertNotIn('1', self.cache)
+
+    def test_max_bytes(self):
+        for i in xrange(10):
+            self.cache.set(unicode(i), 'x' * 16 * 1024)
+        self.assertLessEqual(self.cache._cache.bytes, 64 * 1024)
+        self.assertEqual(len(self.cache), 3)
+        self.assertIn('9', self.cache)
+
+    def test_trim_uses_heap(self):
+        for i in xrange(50):
+            self.cache.set('expired_%s' % i, i, timeout=-1)
+            self.cache.set('key_%s' % i, i, timeout=10)
+        self.cache._trim()
+        self.assertEqual(len(self.cache), 50)
+        self.assertEqual(len(self.cache._cache._heap), 50)
+
+    def test_heap_is_compacted(self):
+        for i in xrange(1000):
+            self.cache.set('derp', i, timeout=10)
+        self.assertLess(len(self.cache._cache._heap), 100)
+        self.assertEqual(self.cache.get('derp'), 999)
+
+
+class StripedCacheTestCase(CacheTestCase):
+    klass = cache_new.StripedCache
+
+    def _hammer(self, worker, count=16):
+        errors = []
+
+        def run(n):
+            try:
+                worker(n)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(n,))
+                   for n in xrange(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent_writes(self):
+        def worker(n):
+            for i in xrange(500):
+                key = '%s_%s' % (n, i)
+                self.cache.set(key, i)
+                self.assertEqual(self.cache.get(key), i)
+
+        self._hammer(worker)
+        self.assertEqual(len(self.cache), 16 * 500)
+
+    def test_concurrent_shared_keys(self):
+        def worker(n):
+            for i in xrange(500):
+                key = unicode(i % 20)
+                self.cache.set(key, n, timeout=0.01 * (i % 3 - 1))
+                self.cache.get(key)
+                if not i % 7:
+                    self.cache.delete(key)
+                if not i % 50:
+                    self.cache._trim()
+
+        self._hammer(worker)
+        self.assertLessEqual(len(self.cache), 20)
+        for key, value in self.cache:
+            self.assertIn(value, range(16) + [None])
+
+    def test_concurrent_bounded(self):
+        self.cache = self.klass(stripes=4, max_entries=100)
+
+        def worker(n):
+            for i in xrange(500):
+                self.cache.set('%s_%s' % (n, i), i)
+                self.cache.get('%s_%s' % (n, i - 1))
+
+        self._hammer(worker)
+        self.assertLessEqual(len(self.cache), 100)
+
+
+class StripedCacheZeroDefaultTimeoutTestCase(StripedCacheTestCase):
+    kwargs = {'timeout': 0}
+
+
 class SQLiteCacheTestCase(CacheTestCase):
     klass = cache_new.SQLiteCache
 
@@ -151,7 +402,7 @@ class SQLiteCacheTestCase(CacheTestCase):
         self.cache = self.klass(self.location, *self.args, **self.kwargs)
 
     def tearDown(self):
-        del self.cache
+        self.cache.close()
         shutil.rmtree(self.tmp_dir)
 
     def test_key_prefix(self):
@@ -183,14 +434,238 @@ class SQLiteCacheTestCase(CacheTestCase):
         del cache_without_prefix
         del another_cache_without_prefix
 
+    def test_bulk_operations_with_many_keys(self):
+        count = cache_new.MAX_QUERY_KEYS * 2 + 1
+        mapping = dict(('key_%s' % i, i) for i in xrange(count))
+        self.cache.set_many(mapping)
+        self.assertEqual(self.cache.get_many(mapping.keys()), mapping)
+        self.cache.delete_many(mapping.keys())
+        self.assertEqual(self.cache.get_many(mapping.keys()), {})
+
+    def test_connection_is_reused(self):
+        self.cache.set('derp', 42)
+        connection = self.cache._get_connection()
+        self.cache.get('derp')
+        self.assertIs(connection, self.cache._get_connection())
+
+    def test_connection_per_thread(self):
+        connections = []
+        thread = threading.Thread(
+            target=lambda: connections.append(self.cache._get_connection()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(connections[0], self.cache._get_connection())
+
+    def test_connections_of_dead_threads_are_closed(self):
+        connections = []
+        thread = threading.Thread(
+            target=lambda: connections.append(self.cache._get_connection()))
+        thread.start()
+        thread.join()
+        connection = self.cache._get_connection()
+        self.assertEqual([connection],
+                         [conn for _, conn in self.cache._connections])
+        self.assertRaises(sqlite3.ProgrammingError,
+                          connections[0].execute, 'SELECT 1')
+
+    def test_concurrent_writes_are_counted(self):
+        def worker():
+            for _ in xrange(20):
+                self.cache._maybe_trim()
+
+        self.cache._writes = 0
+        threads = [threading.Thread(target=worker) for _ in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache._writes, 80)
+
+    def test_concurrent_access(self):
+        def worker(n):
+            for i in xrange(50):
+                self.cache.set('%s_%s' % (n, i), i)
+                self.assertEqual(self.cache.get('%s_%s' % (n, i)), i)
+
+        threads = [threading.Thread(target=worker, args=(n,))
+                   for n in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.cache), 200)
+
+    def test_expires_index(self):
+        conn = self.cache._get_connection()
+        plan = conn.execute('EXPLAIN QUERY PLAN ' +
+                            cache_new.SQL_CLEAR_EXPIRED_BATCH,
+                            (time.time(), 1)).fetchall()
+        self.assertIn('container_expires', ' '.join(row[-1] for row in plan))
+
+    def test_trim_is_amortized(self):
+        for i in xrange(10):
+            self.cache.set('expired_%s' % i, i, timeout=-1)
+        self.assertEqual(len(self.cache), 10)
+
+        self.cache._writes = 0
+        for i in xrange(cache_new.TRIM_INTERVAL - 1):
+            self.cache.set('key_%s' % i, i, timeout=0)
+        self.assertEqual(len(self.cache), cache_new.TRIM_INTERVAL + 9)
+
+        self.cache.set('last', 42)
+        self.assertEqual(len(self.cache), cache_new.TRIM_INTERVAL)
+
+    def test_trim_limit(self):
+        for i in xrange(10):
+            self.cache.set('expired_%s' % i, i, timeout=-1)
+        self.cache._trim(limit=3)
+        self.assertEqual(len(self.cache), 7)
+        self.cache._trim()
+        self.assertEqual(len(self.cache), 0)
+
+    def test_counters_are_native_integers(self):
+        self.cache.incr('counter', 42)
+        self.cache.flush()
+        conn = self.cache._get_connection()
+        value, = conn.execute('SELECT typeof(value) FROM container').fetchone()
+        self.assertEqual(value, 'integer')
+
+    def test_incr_pickled_value(self):
+        self.cache.set('counter', 41)
+        self.assertEqual(self.cache.incr('counter'), 42)
+        self.assertEqual(self.cache.incr('counter'), 43)
+
+    def test_without_upsert(self):
+        upsert = cache_new.SQLITE_UPSERT
+        cache_new.SQLITE_UPSERT = False
+        try:
+            self.test_get_or_add()
+            self.test_incr()
+        finally:
+            cache_new.SQLITE_UPSERT = upsert
+
 
 class SQLiteCacheZeroDefaultTimeoutTestCase(SQLiteCacheTestCase):
     kwargs = {'timeout': 0}
 
 
+class SQLiteCacheRawSerializerTestCase(SQLiteCacheTestCase):
+    kwargs = {'serializer': 'raw', 'compress_threshold': 64}
+
+    def test_text_is_stored_natively(self):
+        self.cache.set('derp', 'Gooby pls')
+        conn = self.cache._get_connection()
+        value, = conn.execute('SELECT value FROM container').fetchone()
+        self.assertEqual(str(value), b'uGooby pls')
+
+    def test_legacy_pickled_values(self):
+        conn = self.cache._get_connection()
+        value = buffer(pickle.dumps('Gooby pls', pickle.HIGHEST_PROTOCOL))
+        conn.execute(cache_new.SQL_REPLACE, ('derp', value, 0))
+        self.assertEqual(self.cache.get('derp'), 'Gooby pls')
+
+    def test_large_values_are_compressed(self):
+        self.cache.set('derp', 'derp ' * 1000)
+        conn = self.cache._get_connection()
+        value, = conn.execute('SELECT value FROM container').fetchone()
+        self.assertLess(len(value), 1000)
+        self.assertEqual(self.cache.get('derp'), 'derp ' * 1000)
+
+
+class SQLiteCacheWriteBehindTestCase(SQLiteCacheTestCase):
+    kwargs = {'write_behind': True, 'flush_size': 5, 'flush_interval': 0.1}
+
+    def _stored(self):
+        reader = self.klass(self.location)
+        try:
+            return dict(reader)
+        finally:
+            reader.close()
+
+    def test_trim_is_amortized(self):
+        for i in xrange(10):
+            self.cache.set('expired_%s' % i, i, timeout=-1)
+        self.cache.flush()
+        self.cache._writes = 0
+        self.cache.set('last', 42, timeout=0)
+        self.cache.flush()
+        self.assertEqual(len(self.cache), 1)
+
+    def test_trim_limit(self):
+        writer = self.klass(self.location)
+        for i in xrange(10):
+            writer.set('expired_%s' % i, i, timeout=-1)
+        writer.close()
+        self.cache._trim(limit=3)
+        self.assertEqual(len(self.cache), 7)
+
+    def test_writes_are_buffered(self):
+        self.cache.set('derp', 42)
+        self.cache.set('key', 'v')
+        self.cache.delete('key')
+        self.assertEqual(self.cache.get('derp'), 42)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertIn('derp', self.cache)
+        self.assertNotIn('key', self.cache)
+        self.assertEqual(self._stored(), {})
+
+        self.cache.flush()
+        self.assertEqual(self._stored(), {'derp': 42})
+
+    def test_delete_masks_stored_value(self):
+        self.cache.set('derp', 42)
+        self.cache.flush()
+        self.cache.delete('derp')
+        self.assertIsNone(self.cache.get('derp'))
+        self.assertNotIn('derp', self.cache)
+        self.assertEqual(self._stored(), {'derp': 42})
+        self.cache.flush()
+        self.assertEqual(self._stored(), {})
+
+    def test_flush_on_size(self):
+        for i in xrange(4):
+            self.cache.set(unicode(i), i)
+        self.assertEqual(self._stored(), {})
+        self.cache.set('4', 4)
+        self.assertEqual(len(self._stored()), 5)
+        self.assertEqual(len(self.cache._write_buffer), 0)
+
+    def test_flush_on_interval(self):
+        self.cache.set('derp', 42)
+        self.assertFalse(self.cache._write_buffer.is_due())
+        # Pretend the interval has elapsed instead of sleeping, which lets
+        # the scheduler flush job run in between when the scheduler is up.
+        self.cache._write_buffer._flushed -= 1
+        cache_new._flush_due()
+        self.assertEqual(self._stored(), {'derp': 42})
+
+    def test_flush_on_close(self):
+        self.cache.set('derp', 42)
+        self.cache.close()
+        self.assertEqual(self._stored(), {'derp': 42})
+
+    def test_flush_all(self):
+        self.cache.set('derp', 42)
+        cache_new.flush_all()
+        self.assertEqual(self._stored(), {'derp': 42})
+
+    def test_clear_discards_pending_writes(self):
+        self.cache.set('derp', 42)
+        self.cache.flush()
+        self.cache.set('key', 'v')
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.flush()
+        self.assertEqual(self._stored(), {})
+
+
 TEST_CASES = (SimpleCacheTestCase, SQLiteCacheTestCase,
               SimpleCacheZeroDefaultTimeoutTestCase,
-              SQLiteCacheZeroDefaultTimeoutTestCase)
+              SimpleCacheBoundedTestCase,
+              StripedCacheTestCase, StripedCacheZeroDefaultTimeoutTestCase,
+              SQLiteCacheZeroDefaultTimeoutTestCase,
+              SQLiteCacheRawSerializerTestCase,
+              SQLiteCacheWriteBehindTestCase)
 
 
 def load_tests(loader, tests, pattern):
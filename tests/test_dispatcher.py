@@ -15,9 +15,11 @@ __docformat__ = "restructuredtext en"
 
 
 import unittest
+import threading
 
 import tests
 from gooby.dispatcher import dispatcher, _id
+from gooby.workers import gather
 
 
 SIGNAL = "test_signal"
@@ -26,7 +28,7 @@ ANOTHER_SIGNAL = 1
 
 class DispatcherTestCase(unittest.TestCase):
     def tearDown(self):
-        dispatcher.connections.clear()
+        dispatcher.clear()
 
     def test_connection(self):
         def receiver():
@@ -36,9 +38,39 @@ class DispatcherTestCase(unittest.TestCase):
         dispatcher.connect(receiver, SIGNAL)
         receivers = dispatcher.connections.get(SIGNAL)
         self.assertEqual(len(receivers), 1)
-        r_id, _ = receivers[-1]
+        r_id, _ = receivers.items()[-1]
         self.assertEqual(r_id, receiver_id)
 
+    def test_duplicate_connection(self):
+        def receiver():
+            pass
+
+        dispatcher.connect(receiver, SIGNAL)
+        dispatcher.connect(receiver, SIGNAL)
+        self.assertEqual(len(dispatcher.connections.get(SIGNAL)), 1)
+
+    def test_weak_bound_method(self):
+        class Test(object):
+            def test(self):
+                return 42
+
+        obj = Test()
+        dispatcher.connect(obj.test, SIGNAL)
+        dispatcher.connect(obj.test, ANOTHER_SIGNAL)
+        self.assertEqual([42], dispatcher.send(SIGNAL))
+        del obj
+        self.assertEqual([], dispatcher.send(SIGNAL))
+        self.assertEqual({}, dispatcher.connections)
+        self.assertEqual({}, dispatcher._signals)
+
+    def test_weak_function_cleanup(self):
+        def receiver():
+            pass
+
+        dispatcher.connect(receiver, SIGNAL)
+        del receiver
+        self.assertNotIn(SIGNAL, dispatcher.connections)
+
     def test_multiple_connections(self):
         def receiver():
             pass
@@ -73,7 +105,8 @@ class DispatcherTestCase(unittest.TestCase):
         dispatcher.connect(another_receiver, SIGNAL)
         dispatcher.disconnect(receiver, SIGNAL)
         receivers = dispatcher.connections.get(SIGNAL)
-        r_id, _ = receivers[-1]
+        self.assertEqual(len(receivers), 1)
+        r_id, _ = receivers.items()[-1]
         self.assertEqual(r_id, another_receiver_id)
 
     def test_send(self):
@@ -102,6 +135,79 @@ class DispatcherTestCase(unittest.TestCase):
         ]
         self.assertItemsEqual(expected, responses)
 
+    def test_send_without_receivers(self):
+        self.assertEqual([], dispatcher.send("unknown signal"))
+        self.assertEqual([], dispatcher.send_async("unknown signal"))
+
+    def test_send_async(self):
+        def receiver(*args, **kwargs):
+            return "derp", args, kwargs
+
+        def another_receiver(*args, **kwargs):
+            return 42
+
+        dispatcher.connect(receiver, SIGNAL)
+        dispatcher.connect(another_receiver, SIGNAL)
+        futures = dispatcher.send_async(SIGNAL, 42, herp="derp")
+        expected = [
+            42,
+            ("derp", (42,), {'herp': u'derp'}),
+        ]
+        self.assertItemsEqual(expected, gather(futures, timeout=5))
+
+    def test_send_async_error(self):
+        def receiver():
+            raise ValueError("derp")
+
+        dispatcher.connect(receiver, SIGNAL)
+        futures = dispatcher.send_async(SIGNAL)
+        self.assertRaises(ValueError, gather, futures, 5)
+
+    def test_post(self):
+        event = threading.Event()
+
+        def receiver(value):
+            event.set()
+
+        dispatcher.connect(receiver, SIGNAL)
+        self.assertIsNone(dispatcher.post(SIGNAL, 42))
+        self.assertTrue(event.wait(5))
+
+
+class Receiver(object):
+    def receive(self, value):
+        return value
+
+
+class ManyReceiversTestCase(unittest.TestCase):
+    """
+    Connect, send and garbage collection cleanup of many weakly connected
+    receivers. See benchmark_dispatcher.py for their costs.
+    """
+
+    RECEIVERS_COUNT = 1000
+
+    def tearDown(self):
+        dispatcher.clear()
+
+    def test_weak_receivers(self):
+        receivers = [Receiver() for _ in xrange(self.RECEIVERS_COUNT)]
+        for receiver in receivers:
+            dispatcher.connect(receiver.receive, SIGNAL)
+        del receiver
+        self.assertEqual([42] * self.RECEIVERS_COUNT,
+                         dispatcher.send(SIGNAL, 42))
+        del receivers[:]
+        self.assertEqual({}, dispatcher.connections)
+
+    def test_connect_and_disconnect(self):
+        receivers = [Receiver() for _ in xrange(self.RECEIVERS_COUNT)]
+        for receiver in receivers:
+            dispatcher.connect(receiver.receive, SIGNAL, False)
+        for receiver in receivers:
+            dispatcher.disconnect(receiver.receive, SIGNAL)
+        self.assertEqual({}, dispatcher.connections)
+
 
 if __name__ == "__main__":
     unittest.main()
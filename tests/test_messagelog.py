@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+:mod:`test_messagelog` --- Chat message log unit tests
+======================================================
+"""
+
+
+from __future__ import unicode_literals
+
+
+__docformat__ = "restructuredtext en"
+
+
+import os
+import unittest
+import tempfile
+import shutil
+import threading
+
+import tests
+from gooby.messagelog import MessageLog
+
+
+class MessageLogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.location = os.path.join(self.tmp_dir, "messages.sqlite")
+        self.log = MessageLog(self.location)
+
+    def tearDown(self):
+        self.log.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_append(self):
+        self.log.append("#chat", "Губи.", timestamp=1)
+        self.log.append("#chat", "Herp derp.", timestamp=2)
+        self.log.append("#other", "Derp.", timestamp=1)
+        self.assertEqual(list(self.log.sentences("#chat")),
+                         ["Губи.", "Herp derp."])
+        self.assertEqual(list(self.log.sentences("#other")), ["Derp."])
+        self.assertEqual(list(self.log.sentences("#nothing")), [])
+        self.assertEqual(sorted(self.log.chats()), ["#chat", "#other"])
+
+    def test_order(self):
+        # Sentences with equal timestamps keep the order they were
+        # appended in.
+        for i in xrange(10):
+            self.log.append("#chat", unicode(i), timestamp=i // 3)
+        self.assertEqual(list(self.log.sentences("#chat")),
+                         [unicode(i) for i in xrange(10)])
+        self.assertEqual(list(self.log.sentences("#chat", since=2)),
+                         ["6", "7", "8", "9"])
+        # Otherwise they are ordered by timestamp.
+        self.log.append("#chat", "late", timestamp=0)
+        self.assertEqual(list(self.log.sentences("#chat"))[:4],
+                         ["0", "1", "2", "late"])
+
+    def test_entries(self):
+        self.log.append("#chat", "Herp.", timestamp=1.5)
+        [(entry_id, timestamp, sentence)] = list(self.log.entries("#chat"))
+        self.assertIsInstance(entry_id, (int, long))
+        self.assertEqual((timestamp, sentence), (1.5, "Herp."))
+
+    def test_entries_after(self):
+        first = self.log.append("#chat", "Herp.")
+        second = self.log.append("#chat", "Derp.")
+        self.log.append("#other", "Gooby.")
+        self.assertGreater(second, first)
+        self.assertEqual([row[2] for row in
+                          self.log.entries_after("#chat", first)], ["Derp."])
+        self.assertEqual(list(self.log.entries_after("#chat", second)), [])
+        self.assertEqual(len(list(self.log.entries_after("#chat", 0))), 2)
+        self.assertEqual(self.log.count_after("#chat", first), 1)
+        self.assertEqual(self.log.count_after("#chat", second), 0)
+        self.assertEqual(self.log.count_after("#chat", 0), 2)
+
+    def test_streaming(self):
+        self.log.extend("#chat", (("Derp %s." % i, i) for i in xrange(1000)))
+        sentences = self.log.sentences("#chat")
+        self.assertEqual(next(sentences), "Derp 0.")
+        # Appending while streaming is allowed.
+        self.log.append("#chat", "Herp.", timestamp=2000)
+        self.assertEqual(sum(1 for _ in sentences), 1000)
+
+    def test_expire(self):
+        self.log.extend("#chat", (("Derp %s." % i, i) for i in xrange(10)))
+        self.log.append("#other", "Herp.", timestamp=0)
+        self.assertEqual(self.log.expire("#chat", before=5), 5)
+        self.assertEqual(self.log.expire("#chat", before=5), 0)
+        self.assertEqual(self.log.count("#chat"), 5)
+        self.assertEqual(next(self.log.sentences("#chat")), "Derp 5.")
+        self.assertEqual(self.log.count("#other"), 1)
+
+    def test_clear(self):
+        self.log.append("#chat", "Herp.")
+        self.log.append("#other", "Derp.")
+        self.log.clear("#chat")
+        self.assertEqual(self.log.count("#chat"), 0)
+        self.assertEqual(self.log.count("#other"), 1)
+
+    def test_persistence(self):
+        self.log.append("#chat", "Herp.", timestamp=1)
+        self.log.close()
+        self.log = MessageLog(self.location)
+        self.assertEqual(list(self.log.sentences("#chat")), ["Herp."])
+
+    def test_threads(self):
+        def append(i):
+            for j in xrange(50):
+                self.log.append("#chat", "%s %s" % (i, j))
+
+        threads = [threading.Thread(target=append, args=(i,))
+                   for i in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.log.count("#chat"), 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
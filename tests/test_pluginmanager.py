@@ -15,9 +15,11 @@ __docformat__ = "restructuredtext en"
 
 
 import unittest
+import threading
 
 import tests
 from gooby.plugin import Plugin
+from gooby.output import ChatMessage
 from gooby.pluginmanager import (PluginManager, camelcase_to_underscores,
                                  chat_is_whitelisted)
 
@@ -184,6 +186,53 @@ class PluginManagerTestCase(unittest.TestCase):
         self.assertItemsEqual(handlers, expected)
 
 
+class PluginDeferTestCase(unittest.TestCase):
+    def setUp(self):
+        self.plugin = DefaultConfigPlugin()
+
+    def _wait(self, future):
+        # Callbacks are called in order, so the plugin one is done by now.
+        done = threading.Event()
+        future.add_done_callback(lambda f: done.set())
+        done.wait(5)
+
+    def test_deferred_output(self):
+        future = self.plugin.defer(ChatMessage, "chat", "derp")
+        self._wait(future)
+        output = self.plugin.flush_output()
+        self.assertEqual(1, len(output))
+        self.assertEqual("derp", output[0].text)
+
+    def test_process_deferred_output(self):
+        future = self.plugin.defer_process(ChatMessage, "chat", "derp")
+        self._wait(future)
+        output = self.plugin.flush_output()
+        self.assertEqual(1, len(output))
+        self.assertEqual("derp", output[0].text)
+
+    def test_concurrent_output(self):
+        def append():
+            for i in xrange(1000):
+                self.plugin.output.append(i)
+
+        threads = [threading.Thread(target=append) for _ in xrange(4)]
+        for thread in threads:
+            thread.start()
+        output = list()
+        while any(thread.is_alive() for thread in threads):
+            output.extend(self.plugin.flush_output())
+        for thread in threads:
+            thread.join()
+        output.extend(self.plugin.flush_output())
+        self.assertEqual(4000, len(output))
+
+    def test_deferred_error_produces_no_output(self):
+        future = self.plugin.defer(int, "derp")
+        self._wait(future)
+        self.assertIsInstance(future.exception(), ValueError)
+        self.assertEqual([], self.plugin.flush_output())
+
+
 class ChatIsWhitelistedTestCase(unittest.TestCase):
     def setUp(self):
         self.whitelist = [
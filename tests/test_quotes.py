@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+:mod:`test_quotes` --- Message quotation parser unit tests
+==========================================================
+"""
+
+
+from __future__ import unicode_literals
+
+
+__docformat__ = "restructuredtext en"
+
+
+import unittest
+
+import tests
+from gooby import quotes
+from gooby.quotes import parse_quotes, first_quote, Quote
+
+
+WINDOWS_QUOTE = """
+[1:37:59 PM] юзернейм derp: a quoted message
+
+<<< тест
+"""
+
+LINUX_QUOTE = """
+> [Wednesday, June 26, 2013 1:37:59 PM юзернейм derp] a quoted message
+some other message.
+"""
+
+MACOSX_QUOTE = """
+26.06.13 в 13:37 skypename.derp написал (-а):
+> a quoted message
+some other message.
+"""
+
+ANDROID_QUOTE = """
+some skype name - Сегодня 6:19
+> A Quoted message.
+some answer
+"""
+
+WINDOWS_MULTIPLE_QUOTE = """[06.08.2015 12:30:27] some derp: le message
+[06.08.2015 12:32:51] othername.derp: Asdf?"""
+
+# Windows quotation hidden in a Linux one, found first by a single scan.
+OVERLAPPING_QUOTE = """
+> [Monday, June 1, 2015 1:37:59 PM derp] [1:38:00 PM] herp: a quote
+<<< a message
+"""
+
+
+class QuotesTestCase(unittest.TestCase):
+    def test_windows(self):
+        self.assertEqual(parse_quotes(WINDOWS_QUOTE), (
+            Quote(quotes.WINDOWS, "юзернейм derp", None, "1:37:59 PM",
+                  "a quoted message", "тест"),
+        ))
+
+    def test_linux(self):
+        self.assertEqual(parse_quotes(LINUX_QUOTE), (
+            Quote(quotes.LINUX, "юзернейм derp", "Wednesday, June 26, 2013",
+                  "1:37:59 PM", "a quoted message", "some other message."),
+        ))
+
+    def test_macosx(self):
+        self.assertEqual(parse_quotes(MACOSX_QUOTE), (
+            Quote(quotes.MACOSX, "skypename.derp", "26.06.13", "13:37",
+                  "a quoted message", "some other message."),
+        ))
+
+    def test_android(self):
+        self.assertEqual(parse_quotes(ANDROID_QUOTE), (
+            Quote(quotes.ANDROID, "some skype name", "Сегодня", "6:19",
+                  "A Quoted message.", "some answer"),
+        ))
+
+    def test_windows_multiple(self):
+        self.assertEqual(parse_quotes(WINDOWS_MULTIPLE_QUOTE), (
+            Quote(quotes.WINDOWS_MULTIPLE, "some derp", "06.08.2015",
+                  "12:30:27", None, "le message"),
+            Quote(quotes.WINDOWS_MULTIPLE, "othername.derp", "06.08.2015",
+                  "12:32:51", None, "Asdf?"),
+        ))
+
+    def test_not_quoted(self):
+        for text in ("", "Herp derp.", "[1:37:59] herp", "> derp",
+                     "herp - derp 6:19"):
+            self.assertEqual(parse_quotes(text), ())
+            self.assertIsNone(first_quote(text))
+
+    def test_first_quote(self):
+        text = WINDOWS_MULTIPLE_QUOTE + "\n" + MACOSX_QUOTE
+        self.assertEqual(first_quote(text).client, quotes.MACOSX)
+        self.assertEqual(first_quote(text, (quotes.WINDOWS_MULTIPLE,
+                                            quotes.MACOSX)).sender,
+                         "some derp")
+        self.assertIsNone(first_quote(text, (quotes.LINUX, )))
+
+    def test_first_quote_overlapping(self):
+        self.assertEqual([q.client for q in parse_quotes(OVERLAPPING_QUOTE)],
+                         [quotes.LINUX])
+        self.assertEqual(first_quote(OVERLAPPING_QUOTE), Quote(
+            quotes.WINDOWS, "herp", None, "1:38:00 PM", "a quote",
+            "a message"))
+        self.assertEqual(first_quote(OVERLAPPING_QUOTE, (
+            quotes.LINUX, quotes.WINDOWS)).client, quotes.LINUX)
+
+    def test_cache(self):
+        found = parse_quotes(MACOSX_QUOTE)
+        self.assertIs(parse_quotes(MACOSX_QUOTE), found)
+        for i in xrange(quotes.CACHE_SIZE):
+            parse_quotes("herp {0}".format(i))
+        self.assertLessEqual(len(quotes._cache), quotes.CACHE_SIZE)
+        self.assertIsNot(parse_quotes(MACOSX_QUOTE), found)
+        self.assertEqual(parse_quotes(MACOSX_QUOTE), found)
+
+
+if __name__ == "__main__":
+    unittest.main()
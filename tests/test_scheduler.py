@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+:mod:`test_scheduler` --- Scheduler unit tests
+==============================================
+"""
+
+
+from __future__ import unicode_literals
+
+
+__docformat__ = "restructuredtext en"
+
+
+import unittest
+import threading
+import time
+
+import tests
+from gooby.scheduler import Scheduler
+
+
+class SchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = Scheduler()
+
+    def tearDown(self):
+        self.scheduler.shutdown()
+
+    def test_call_later(self):
+        event = threading.Event()
+        job = self.scheduler.call_later(0.05, event.set)
+        self.assertTrue(event.wait(5))
+        time.sleep(0.05)
+        self.assertEqual(1, job.runs)
+        self.assertGreaterEqual(job.last_jitter, 0)
+        self.assertEqual([], self.scheduler.jobs)
+
+    def test_call_every(self):
+        calls = []
+        called = threading.Event()
+
+        def call():
+            calls.append(1)
+            if len(calls) >= 3:
+                called.set()
+
+        job = self.scheduler.call_every(0.02, call)
+        self.assertTrue(called.wait(5))
+        # Waits for a run in progress, so the counts can't change anymore.
+        self.scheduler.shutdown()
+        self.assertGreaterEqual(len(calls), 3)
+        self.assertEqual(len(calls), job.runs)
+
+    def test_jobs_ordered_by_due_time(self):
+        late = self.scheduler.call_later(60, int)
+        early = self.scheduler.call_later(30, int)
+        self.assertEqual([early, late], self.scheduler.jobs)
+
+    def test_cancel(self):
+        calls = []
+        job = self.scheduler.call_later(0.05, calls.append, 1)
+        job.cancel()
+        time.sleep(0.1)
+        self.assertEqual([], calls)
+        self.assertEqual([], self.scheduler.jobs)
+
+    def test_overrun_skips_missed_runs(self):
+        job = self.scheduler.call_every(0.01, time.sleep, 0.05)
+        time.sleep(0.2)
+        job.cancel()
+        self.assertGreater(job.overruns, 0)
+        self.assertLessEqual(job.runs, 5)
+
+    def test_failing_job_is_rescheduled(self):
+        job = self.scheduler.call_every(0.02, int, "derp")
+        time.sleep(0.1)
+        job.cancel()
+        self.assertGreater(job.runs, 1)
+
+    def test_shutdown(self):
+        self.scheduler.call_every(0.01, int)
+        self.scheduler.shutdown()
+        self.assertFalse(self.scheduler._thread.is_alive())
+        self.assertRaises(RuntimeError, self.scheduler.call_later, 1, int)
+
+
+if __name__ == "__main__":
+    unittest.main()
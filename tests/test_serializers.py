@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+:mod:`test_serializers` --- Cache value serializers unit tests
+==============================================================
+"""
+
+
+from __future__ import unicode_literals
+
+
+__docformat__ = "restructuredtext en"
+
+
+import unittest
+import datetime
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import tests
+from gooby.serializers import get_serializer, loads, Serializer, NEGATIVE
+
+
+VALUES = (
+    "Gooby pls",
+    "Губи",
+    b"\x00\x80bytes",
+    "",
+    42,
+    3.5,
+    None,
+    [1, "2", [3]],
+    {"a": 1},
+)
+
+
+class SerializersTestCase(unittest.TestCase):
+    def _assert_round_trip(self, serializer, values=VALUES):
+        for value in values:
+            loaded = loads(serializer.dumps(value))
+            self.assertEqual(loaded, value)
+            self.assertEqual(type(loaded), type(value))
+
+    def test_pickle(self):
+        serializer = get_serializer("pickle")
+        self._assert_round_trip(serializer,
+                                VALUES + ((1, 2), datetime.date.today()))
+
+    def test_raw(self):
+        serializer = get_serializer("raw")
+        self._assert_round_trip(serializer)
+        self.assertEqual(serializer.dumps("Губи"), b"u" +
+                         "Губи".encode("utf-8"))
+        self.assertEqual(serializer.dumps(b"derp"), b"sderp")
+
+    def test_marshal(self):
+        serializer = get_serializer("marshal")
+        self._assert_round_trip(serializer)
+        # Unsupported types are pickled.
+        date = datetime.date.today()
+        self.assertEqual(loads(serializer.dumps(date)), date)
+
+    def test_json(self):
+        serializer = get_serializer("json")
+        self._assert_round_trip(serializer, ("Губи", 42, None, {"a": [1]}))
+        date = datetime.date.today()
+        self.assertEqual(loads(serializer.dumps(date)), date)
+
+    def test_compression(self):
+        serializer = get_serializer("raw", compress_threshold=64)
+        value = "derp " * 100
+        data = serializer.dumps(value)
+        self.assertEqual(data[:1], b"Z")
+        self.assertLess(len(data), len(value))
+        self.assertEqual(loads(data), value)
+        self.assertEqual(serializer.dumps("derp"), b"uderp")
+
+    def test_legacy_pickles(self):
+        for protocol in (0, 1, pickle.HIGHEST_PROTOCOL):
+            data = pickle.dumps(("derp", 42), protocol)
+            self.assertEqual(loads(buffer(data)), ("derp", 42))
+
+    def test_negative(self):
+        for name in ("pickle", "raw", "marshal", "json"):
+            serializer = get_serializer(name)
+            self.assertEqual(serializer.dumps(NEGATIVE), b"N")
+            self.assertIs(loads(serializer.dumps(NEGATIVE)), NEGATIVE)
+        self.assertIs(pickle.loads(pickle.dumps([NEGATIVE], 2))[0], NEGATIVE)
+
+    def test_get_serializer(self):
+        serializer = Serializer()
+        self.assertIs(get_serializer(serializer), serializer)
+        self.assertRaises(ValueError, get_serializer, "derp")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,395 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+:mod:`test_summarygenerator` --- Summary generator chat model unit tests
+========================================================================
+"""
+
+
+from __future__ import unicode_literals
+
+
+__docformat__ = "restructuredtext en"
+
+
+import os
+import sys
+import time
+import unittest
+import tempfile
+import shutil
+
+import tests
+
+# Plugins import core modules by their top level names.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "gooby"))
+
+from StringIO import StringIO  # noqa
+
+from messagelog import MessageLog  # noqa
+import plugins.summarygenerator as summarygenerator  # noqa
+from plugins.summarygenerator import (  # noqa
+    ChatModel,
+    MarkovChain,
+    MappedMarkovChain,
+    generate_summary,
+    CHAIN_HEADER,
+    MODEL_MAX_AGE,
+)
+
+
+SENTENCES = ("Herp derp gooby pls.", "Gooby pls derp herp.",
+             "Derp herp pls gooby.", "Pls gooby herp derp.")
+
+
+class MarkovChainDumpTestCase(unittest.TestCase):
+    TEXT = ("Губи пожалуйста ходил. Herp derp gooby. Herp derp pls. "
+            "Herp derp gooby. Gooby pls derp. Пожалуйста губи ходил.")
+
+    def dump(self, chain, meta=None):
+        f = StringIO()
+        chain.dump(f, meta)
+        return f.getvalue()
+
+    def load(self, data):
+        return MarkovChain.load(StringIO(data))
+
+    def assertRejected(self, data):
+        self.assertRaises(ValueError, self.load, data)
+        path = os.path.join(self.tmp_dir, "chain.model")
+        with open(path, "wb") as f:
+            f.write(data)
+        self.assertRaises(ValueError, MappedMarkovChain, path)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.chain = MarkovChain.from_string(self.TEXT)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_round_trip(self):
+        meta = {"last_id": 42, "tail": ["Gooby", "pls."]}
+        loaded = self.load(self.dump(self.chain, meta))
+        self.assertEqual(loaded.order, self.chain.order)
+        self.assertEqual(loaded.meta, meta)
+        self.assertEqual(transitions(loaded), transitions(self.chain))
+        self.assertEqual(loaded.successors(["Herp", "derp"]),
+                         {"gooby.": 2, "pls.": 1})
+        self.assertEqual(set(loaded._state_words(state)
+                             for state in loaded._first_keys),
+                         set(self.chain._state_words(state)
+                             for state in self.chain._first_keys))
+        # Saved again, the chain is the same byte for byte.
+        self.assertEqual(self.dump(loaded, meta), self.dump(self.chain, meta))
+
+    def test_round_trip_after_discard(self):
+        self.chain.discard(["Gooby", "pls", "derp."])
+        self.chain.discard(["Губи", "пожалуйста", "ходил."])
+        loaded = self.load(self.dump(self.chain))
+        self.assertEqual(transitions(loaded), transitions(self.chain))
+        self.assertEqual(loaded.successors(["Gooby", "pls"]), {})
+        # Words no longer used are dropped.
+        self.assertNotIn("Губи", loaded._ids)
+        self.assertLess(len(loaded._words), len(self.chain._words))
+
+    def test_empty_chain(self):
+        loaded = self.load(self.dump(MarkovChain()))
+        self.assertEqual(len(loaded), 0)
+        self.assertEqual(loaded.meta, {})
+
+    def test_truncated(self):
+        data = self.dump(self.chain)
+        for size in (0, CHAIN_HEADER.size - 1, CHAIN_HEADER.size + 1,
+                     len(data) // 2, len(data) - 4):
+            self.assertRejected(data[:size])
+
+    def test_corrupt(self):
+        data = self.dump(self.chain)
+        header = list(CHAIN_HEADER.unpack_from(data))
+        self.assertRejected(b"GMCX" + data[4:])
+        for index, value in ((1, 1), (2, 0), (3, -1), (6, -2), (8, 1000)):
+            corrupt = header[:]
+            corrupt[index] = value
+            self.assertRejected(CHAIN_HEADER.pack(*corrupt) +
+                                data[CHAIN_HEADER.size:])
+
+
+class Choices(object):
+    """
+    Stands for the :mod:`random` module, so that every possible choice is
+    made once.
+    """
+
+    def __init__(self):
+        self.n = -1
+
+    def randrange(self, stop):
+        self.n += 1
+        return self.n % stop
+
+
+class MappedMarkovChainTestCase(unittest.TestCase):
+    TEXT = ("Herp derp gooby. Gooby pls derp. Herp derp pls. "
+            "Herp derp gooby. Herp derp gooby. pls Herp derp.")
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "chain.model")
+        self.chain = MarkovChain.from_string(self.TEXT)
+        with open(self.path, "wb") as f:
+            self.chain.dump(f)
+        self.mapped = MappedMarkovChain(self.path)
+
+    def tearDown(self):
+        self.mapped.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_start_index(self):
+        first_keys = set(self.chain._state_words(state)
+                         for state in self.chain._first_keys)
+        self.assertEqual(first_keys, set([("Herp", "derp"),
+                                          ("Gooby", "pls")]))
+        self.assertEqual(self.mapped._sections["starts"][1], 2)
+        starts = self.mapped._sample_first_keys(2)
+        self.assertEqual(len(set(starts)), 2)
+        self.assertEqual(set(self.mapped._state_words(state)
+                             for state in starts), first_keys)
+
+    def test_start_index_shortage(self):
+        # Any states are drawn once the starting ones run out.
+        starts = self.mapped._sample_first_keys(5)
+        self.assertEqual(len(starts), 5)
+        for state in starts:
+            self.assertTrue(0 <= state < len(self.mapped))
+
+    def test_transitions(self):
+        self.assertEqual(len(self.mapped), len(self.chain))
+        for state in self.chain._db:
+            words = self.chain._state_words(state)
+            self.assertEqual(self.mapped.successors(words),
+                             self.chain.successors(words))
+        self.assertEqual(self.mapped.successors(["Herp", "derp"]),
+                         {"gooby.": 3, "pls.": 1})
+        self.assertEqual(self.mapped.successors(["Herp", "herp"]), {})
+        self.assertEqual(self.mapped.successors(["Kappa", "derp"]), {})
+
+    def test_cumulative_weight_sampling(self):
+        state = self.mapped._find_state(["Herp", "derp"])
+        random = summarygenerator.random
+        summarygenerator.random = Choices()
+        try:
+            steps = [self.mapped._step(state) for _ in xrange(4)]
+        finally:
+            summarygenerator.random = random
+        words = [self.mapped._word(word_id) for word_id, _ in steps]
+        # Every successor is drawn as many times as it has been counted.
+        self.assertEqual(sorted(words), ["gooby.", "gooby.", "gooby.",
+                                         "pls."])
+        for word, (_, next_state) in zip(words, steps):
+            self.assertEqual(self.mapped._state_words(next_state),
+                             ("derp", word))
+
+    def test_last_state(self):
+        # Nothing follows the corpus end, "pls Herp derp.".
+        self.assertIsNone(self.mapped._find_state(["Herp", "derp."]))
+        word_id, next_state = self.mapped._step(
+            self.mapped._find_state(["pls", "Herp"]))
+        self.assertEqual(self.mapped._word(word_id), "derp.")
+        self.assertIsNone(next_state)
+
+    def test_generate_sentences(self):
+        for sentence in self.mapped.generate_sentences(sentences_count=3):
+            self.assertTrue(sentence)
+            for word in sentence.split():
+                self.assertIn(word, self.TEXT.split())
+
+
+def transitions(chain):
+    """Successors of every state of an in-memory chain, by state words."""
+
+    return dict((chain._state_words(state),
+                 chain.successors(chain._state_words(state)))
+                for state in chain._db)
+
+
+class ChatModelTestCase(unittest.TestCase):
+    CHAT = "#chat"
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "chat.model")
+        self.log = MessageLog(os.path.join(self.tmp_dir, "messages.sqlite"))
+
+    def tearDown(self):
+        self.log.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def entries(self, count):
+        # One sentence a second, so entry timestamps equal their ids.
+        return [(i, i, SENTENCES[i % len(SENTENCES)])
+                for i in xrange(1, count + 1)]
+
+    def assertSameModel(self, model, other):
+        self.assertEqual(transitions(model.chain), transitions(other.chain))
+        self.assertEqual(len(model.chain._first_keys),
+                         len(other.chain._first_keys))
+
+    def test_expire_equals_rebuild(self):
+        entries = self.entries(20)
+        for before in (1, 2, 7, 20, 21):
+            model = ChatModel(None)
+            model.catch_up(entries)
+            model.expire(entries, before)
+            rebuilt = ChatModel(None)
+            rebuilt.catch_up(entry for entry in entries if entry[1] >= before)
+            self.assertSameModel(model, rebuilt)
+            # Sentences added later follow live ones only.
+            model.add(21, "Kappa keepo.")
+            rebuilt.add(21, "Kappa keepo.")
+            self.assertSameModel(model, rebuilt)
+
+    def test_expire_within_sentence(self):
+        model = ChatModel(None)
+        entries = [(1, 1, "Herp derp gooby pls derp."),
+                   (2, 2, "Gooby pls.")]
+        model.catch_up(entries)
+        model.expire(entries, 2)
+        self.assertEqual(transitions(model.chain), {})
+        self.assertEqual(model._tail, ["Gooby", "pls."])
+
+    def test_catch_up(self):
+        for sentence in SENTENCES:
+            self.log.append(self.CHAT, sentence)
+        model = ChatModel(self.path)
+        model.catch_up(self.log.entries_after(self.CHAT, model.last_id))
+        model.save()
+
+        for sentence in SENTENCES:
+            self.log.append(self.CHAT, sentence)
+        self.log.append("#other", "Kappa keepo.")
+        loaded = ChatModel.load(self.path)
+        self.assertEqual(loaded.last_id, len(SENTENCES))
+        self.assertEqual(loaded._tail, model._tail)
+        entries = list(self.log.entries_after(self.CHAT, loaded.last_id))
+        self.assertEqual([entry[0] for entry in entries], range(5, 9))
+        loaded.catch_up(entries)
+        self.assertEqual(loaded.last_id, 2 * len(SENTENCES))
+
+        # Sentences saved with the model are not counted in twice.
+        rebuilt = ChatModel(None)
+        rebuilt.catch_up(self.log.entries_after(self.CHAT, 0))
+        self.assertSameModel(loaded, rebuilt)
+
+    def test_save_unchanged(self):
+        model = ChatModel(self.path)
+        model.save()
+        self.assertFalse(os.path.exists(self.path))
+
+
+class GenerateSummaryTestCase(unittest.TestCase):
+    CHAT = "#chat"
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log_location = os.path.join(self.tmp_dir, "messages.sqlite")
+        self.model_path = os.path.join(self.tmp_dir, "chat.model")
+        self.log = MessageLog(self.log_location)
+
+    def tearDown(self):
+        self.log.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def log_sentences(self, count, timestamp=None):
+        for i in xrange(count):
+            self.log.append(self.CHAT, SENTENCES[i % len(SENTENCES)],
+                            timestamp)
+
+    def generate(self, expires=0):
+        return generate_summary(self.log_location, self.model_path,
+                                self.CHAT, expires)
+
+    def saved_last_id(self):
+        chain = MappedMarkovChain(self.model_path)
+        try:
+            return chain.meta['last_id']
+        finally:
+            chain.close()
+
+    def test_empty_log(self):
+        self.assertIsNone(self.generate())
+
+    def test_model_is_saved(self):
+        self.log_sentences(40)
+        message = self.generate()
+        self.assertEqual(message.chat_name, self.CHAT)
+        self.assertTrue(message.text)
+        self.assertEqual(self.saved_last_id(), 40)
+
+    def test_updated_model_is_sampled_mapped(self):
+        self.log_sentences(40)
+
+        def step(chain, state):
+            raise AssertionError("In-memory chain is sampled")
+
+        original = MarkovChain.__dict__['_step']
+        MarkovChain._step = step
+        try:
+            self.assertTrue(self.generate().text)
+        finally:
+            MarkovChain._step = original
+        self.assertEqual(self.saved_last_id(), 40)
+
+    def test_model_is_mapped_until_enough_sentences_are_logged(self):
+        self.log_sentences(40)
+        self.generate()
+        # Four new sentences make up a tenth of the counted ones.
+        self.log_sentences(4)
+        self.assertTrue(self.generate().text)
+        self.assertEqual(self.saved_last_id(), 40)
+        self.log_sentences(1)
+        self.generate()
+        self.assertEqual(self.saved_last_id(), 45)
+
+    def test_old_model_is_rewritten(self):
+        self.log_sentences(40)
+        self.generate()
+        self.log_sentences(1)
+        saved = time.time() - MODEL_MAX_AGE - 1
+        os.utime(self.model_path, (saved, saved))
+        self.generate()
+        self.assertEqual(self.saved_last_id(), 41)
+        self.assertGreater(os.path.getmtime(self.model_path), saved)
+
+    def test_expiration_on_rewrite(self):
+        self.log_sentences(40, timestamp=1)
+        self.generate(expires=0)
+        self.log_sentences(2, timestamp=3)
+        # Mapped model is sampled, nothing is purged.
+        self.generate(expires=2)
+        self.assertEqual(self.log.count(self.CHAT), 42)
+        self.log_sentences(2, timestamp=3)
+        os.utime(self.model_path, (0, 0))
+        self.generate(expires=2)
+        self.assertEqual(self.log.count(self.CHAT), 4)
+        chain = MappedMarkovChain(self.model_path)
+        try:
+            self.assertEqual(chain.successors(["pls.", "Gooby"]),
+                             {"pls": 2})
+            self.assertEqual(chain.successors(["derp.", "Herp"]), {})
+        finally:
+            chain.close()
+
+    def test_corrupt_model_is_rebuilt(self):
+        self.log_sentences(40)
+        with open(self.model_path, "wb") as f:
+            f.write(b"derp")
+        self.assertTrue(self.generate().text)
+        self.assertEqual(self.saved_last_id(), 40)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+:mod:`test_textanalysis` --- Message text analysis unit tests
+=============================================================
+"""
+
+
+from __future__ import unicode_literals
+
+
+__docformat__ = "restructuredtext en"
+
+
+import unittest
+
+import tests
+from gooby.textanalysis import TextAnalysis, analyze
+
+
+class Message(object):
+    # Skype4Py Message object stub.
+    def __init__(self, body):
+        self.Body = body
+
+
+class SlottedMessage(object):
+    __slots__ = ("Body", )
+
+    def __init__(self, body):
+        self.Body = body
+
+
+class TextAnalysisTestCase(unittest.TestCase):
+    def test_views(self):
+        analysis = TextAnalysis(" Губи,  ПЛС! —рики-тики-тави (: ")
+        self.assertEqual(analysis.lower, " губи,  плс! —рики-тики-тави (: ")
+        self.assertEqual(analysis.tokens,
+                         ["Губи,", "ПЛС!", "—рики-тики-тави", "(:"])
+        self.assertEqual(analysis.stripped_tokens,
+                         ["Губи", "ПЛС", "рики-тики-тави", ""])
+        self.assertEqual(analysis.parts,
+                         [["Губи"], ["ПЛС"], ["рики", "тики", "тави"], []])
+        self.assertEqual(analysis.char_counts["и"], 6)
+        self.assertEqual(analysis.char_counts[")"], 0)
+        self.assertEqual(analysis.vowel_counts,
+                         {"Губи": 2, "ПЛС": 0, "рики": 2, "тики": 2,
+                          "тави": 2})
+
+    def test_empty(self):
+        analysis = TextAnalysis("")
+        self.assertEqual(analysis.tokens, [])
+        self.assertEqual(analysis.parts, [])
+        self.assertEqual(analysis.vowel_counts, {})
+
+    def test_views_are_computed_once(self):
+        analysis = TextAnalysis("Herp derp")
+        self.assertIs(analysis.tokens, analysis.tokens)
+        self.assertIs(analysis.parts, analysis.parts)
+        self.assertIs(analysis.char_counts, analysis.char_counts)
+
+    def test_analyze(self):
+        message = Message("Herp derp")
+        analysis = analyze(message)
+        self.assertIs(analyze(message), analysis)
+        self.assertEqual(analysis.tokens, ["Herp", "derp"])
+
+    def test_analyze_modified_body(self):
+        message = Message("Herp derp")
+        analysis = analyze(message)
+        message.Body = "Gooby pls"
+        self.assertIsNot(analyze(message), analysis)
+        self.assertEqual(analyze(message).tokens, ["Gooby", "pls"])
+
+    def test_analyze_unattachable(self):
+        message = SlottedMessage("Herp derp")
+        self.assertEqual(analyze(message).tokens, ["Herp", "derp"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+:mod:`test_workers` --- Worker pool unit tests
+==============================================
+"""
+
+
+from __future__ import unicode_literals
+
+
+__docformat__ = "restructuredtext en"
+
+
+import os
+import sys
+import time
+import unittest
+import threading
+
+import tests
+from gooby.workers import WorkerPool, ProcessPool, Future
+from gooby.errors import WorkerError, FutureTimeoutError
+
+
+class FutureTestCase(unittest.TestCase):
+    def test_result_timeout(self):
+        future = Future()
+        self.assertRaises(FutureTimeoutError, future.result, 0.01)
+
+    def test_exception_is_reraised(self):
+        future = Future()
+        try:
+            raise ValueError("derp")
+        except ValueError:
+            future.set_exception(sys.exc_info())
+        self.assertRaises(ValueError, future.result)
+        self.assertIsInstance(future.exception(), ValueError)
+
+    def test_done_callbacks(self):
+        future = Future()
+        called = []
+        future.add_done_callback(called.append)
+        future.set_result(42)
+        future.add_done_callback(called.append)
+        self.assertEqual([future, future], called)
+
+
+class WorkerPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pool = WorkerPool(max_workers=2, max_queue_size=4)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_submit(self):
+        futures = [self.pool.submit(pow, i, 2) for i in xrange(4)]
+        results = [future.result(timeout=5) for future in futures]
+        self.assertEqual([0, 1, 4, 9], results)
+
+    def test_worker_count_is_bounded(self):
+        event = threading.Event()
+        futures = [self.pool.submit(event.wait, 5) for _ in xrange(4)]
+        self.assertLessEqual(len(self.pool._threads), 2)
+        event.set()
+        for future in futures:
+            future.result(timeout=5)
+
+    def test_full_queue(self):
+        event = threading.Event()
+        futures = list()
+        self.assertRaises(WorkerError, lambda: [
+            futures.append(self.pool.submit(event.wait, 5))
+            for _ in xrange(10)])
+        event.set()
+        for future in futures:
+            future.result(timeout=5)
+
+    def test_submit_after_shutdown(self):
+        self.pool.shutdown()
+        self.assertRaises(WorkerError, self.pool.submit, sum, [1])
+
+
+class ProcessPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pool = ProcessPool(max_processes=2, max_queue_size=4)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_submit(self):
+        futures = [self.pool.submit(pow, i, 2) for i in xrange(4)]
+        results = [future.result(timeout=5) for future in futures]
+        self.assertEqual([0, 1, 4, 9], results)
+
+    def test_exception(self):
+        future = self.pool.submit(int, "derp")
+        self.assertRaises(WorkerError, future.result, 5)
+        self.assertIn("ValueError", unicode(future.exception()))
+
+    def test_unpicklable_result(self):
+        future = self.pool.submit(threading.Lock)
+        self.assertRaises(WorkerError, future.result, 5)
+
+    def test_unpicklable_job(self):
+        self.assertRaises(WorkerError, self.pool.submit, lambda: 42)
+
+    def test_full_queue(self):
+        futures = list()
+        self.assertRaises(WorkerError, lambda: [
+            futures.append(self.pool.submit(time.sleep, 0.1))
+            for _ in xrange(10)])
+        self.assertEqual(4, len(futures))
+        for future in futures:
+            future.result(timeout=5)
+        # Finished jobs free up the queue.
+        self.assertEqual(4, self.pool.submit(pow, 2, 2).result(timeout=5))
+
+    def test_submit_after_shutdown(self):
+        self.pool.shutdown()
+        self.assertRaises(WorkerError, self.pool.submit, sum, [1])
+
+    def test_start_on_first_use(self):
+        self.assertIsNone(self.pool._pool)
+        self.assertEqual(4, self.pool.submit(pow, 2, 2).result(timeout=5))
+        self.assertIsNotNone(self.pool._pool)
+
+
+class ProcessPoolTimeoutTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pool = ProcessPool(max_processes=1, max_queue_size=4,
+                                timeout=0.5)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_killed_process(self):
+        future = self.pool.submit(os._exit, 1)
+        self.assertRaises(WorkerError, future.result, 5)
+        self.assertIn("timed out", unicode(future.exception()))
+        self.assertEqual({}, self.pool._jobs)
+        # The pool replaces the killed process.
+        self.assertEqual(4, self.pool.submit(pow, 2, 2).result(timeout=5))
+
+    def test_timeout(self):
+        future = self.pool.submit(time.sleep, 1)
+        self.assertRaises(WorkerError, future.result, 5)
+        # The late result of a failed job is discarded.
+        self.assertEqual(4, self.pool.submit(pow, 2, 2).result(timeout=5))
+
+
+if __name__ == "__main__":
+    unittest.main()